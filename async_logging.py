@@ -0,0 +1,238 @@
+"""
+Logging setup for Senior Advertising Bot
+Hands log records to a background writer through a queue, so file and
+terminal I/O stay off the send path, with sampling of per-recipient lines
+and a rotating log file
+"""
+
+import atexit
+import json
+import logging
+import queue
+import sys
+import threading
+import time
+from datetime import datetime, timezone
+from logging.handlers import QueueHandler, QueueListener, RotatingFileHandler
+from typing import Dict, List, Optional
+
+from metrics import REGISTRY
+
+TEXT_FORMAT = '%(asctime)s - %(levelname)s - %(message)s'
+
+LOG_RECORDS_DROPPED = REGISTRY.counter(
+    "log_records_dropped_total", "Log records dropped because the log queue was full"
+)
+
+# Attributes every LogRecord has; anything else was passed through ``extra``
+STANDARD_ATTRIBUTES = set(logging.makeLogRecord({}).__dict__) | {"message", "asctime"}
+
+
+class JSONFormatter(logging.Formatter):
+    """One JSON object per line, including any fields passed through ``extra``"""
+
+    def format(self, record: logging.LogRecord) -> str:
+        entry = {
+            "time": datetime.fromtimestamp(record.created, timezone.utc).isoformat(timespec="milliseconds"),
+            "level": record.levelname,
+            "logger": record.name,
+            "message": record.getMessage(),
+        }
+        for key, value in record.__dict__.items():
+            if key not in STANDARD_ATTRIBUTES and not key.startswith("_"):
+                entry[key] = value
+        if record.exc_info:
+            entry["exception"] = self.formatException(record.exc_info)
+        return json.dumps(entry, default=str, ensure_ascii=False)
+
+
+class LogSampler:
+    """Decides which per-recipient success lines get logged: one in ``every``,
+    and at least one per ``interval`` seconds
+
+    Callers ask ``admit`` before building a log record at all, since creating
+    the record is most of the cost of a log call. Failures are never sampled.
+    """
+
+    def __init__(self, every: int = 1, interval: float = 60.0):
+        self.configure(every, interval)
+        self._skipped: Dict[str, int] = {}
+        self._last: Dict[str, float] = {}
+        self._lock = threading.Lock()
+
+    def configure(self, every: int, interval: float):
+        self.every = max(1, every)
+        self.interval = interval
+
+    def admit(self, event: str) -> Optional[int]:
+        """None to skip this line, else how many were skipped since the last one logged"""
+        if self.every == 1:
+            return 0
+        now = time.monotonic()
+        with self._lock:
+            skipped = self._skipped.get(event, 0)
+            if skipped + 1 < self.every and now - self._last.get(event, float("-inf")) < self.interval:
+                self._skipped[event] = skipped + 1
+                return None
+            self._skipped[event] = 0
+            self._last[event] = now
+            return skipped
+
+
+# Shared by every hot path; logs everything until configure_logging says otherwise
+SUCCESS_SAMPLER = LogSampler()
+
+
+class NonBlockingQueueHandler(QueueHandler):
+    """Queues records without formatting them; when the queue is full, records
+    below WARNING are dropped rather than block the caller
+
+    Warnings and errors wait up to ``block_seconds`` for room and are written
+    straight to stderr if there still is none, so a burst of per-recipient
+    lines can never hide a failure. The queue stays inside this process, so
+    records need no pickling and the message is formatted by the writer
+    thread instead of the caller.
+    """
+
+    block_seconds = 1.0
+    fallback_formatter = logging.Formatter(TEXT_FORMAT)
+
+    def prepare(self, record: logging.LogRecord) -> logging.LogRecord:
+        return record
+
+    def enqueue(self, record: logging.LogRecord):
+        try:
+            self.queue.put_nowait(record)
+            return
+        except queue.Full:
+            if record.levelno < logging.WARNING:
+                LOG_RECORDS_DROPPED.inc()
+                return
+        try:
+            self.queue.put(record, timeout=self.block_seconds)
+        except queue.Full:
+            try:
+                sys.stderr.write(self.fallback_formatter.format(record) + "\n")
+            except (OSError, ValueError):
+                LOG_RECORDS_DROPPED.inc()
+
+
+class _Listener(QueueListener):
+    def enqueue_sentinel(self):
+        # Block rather than fail when the queue is full at shutdown
+        self.queue.put(self._sentinel)
+
+
+_listener: Optional[QueueListener] = None
+
+
+def build_handlers(settings: dict) -> List[logging.Handler]:
+    """File and console handlers that do the actual writing"""
+    if settings.get('format', 'text') == 'json':
+        formatter: logging.Formatter = JSONFormatter()
+    else:
+        formatter = logging.Formatter(TEXT_FORMAT)
+
+    handlers: List[logging.Handler] = []
+    path = settings.get('file', 'senior_bot.log')
+    if path:
+        if settings.get('max_bytes', 10 * 1024 * 1024):
+            handlers.append(RotatingFileHandler(
+                path,
+                maxBytes=settings.get('max_bytes', 10 * 1024 * 1024),
+                backupCount=settings.get('backup_count', 5),
+                encoding='utf-8'
+            ))
+        else:
+            handlers.append(logging.FileHandler(path, encoding='utf-8'))
+    if settings.get('console', True):
+        handlers.append(logging.StreamHandler(sys.stderr))
+    for handler in handlers:
+        handler.setFormatter(formatter)
+    return handlers
+
+
+def configure_logging(settings: Optional[dict] = None) -> Optional[QueueListener]:
+    """Set up root logging from the ``logging`` config section
+
+    In the default "async" mode the root logger only has a queue handler and
+    a background listener does the formatting and I/O; "sync" writes from the
+    calling thread as before. Calling it again replaces the earlier setup.
+    """
+    global _listener
+    settings = settings or {}
+    shutdown_logging()
+
+    root = logging.getLogger()
+    for handler in list(root.handlers):
+        root.removeHandler(handler)
+        handler.close()
+    root.setLevel(getattr(logging, str(settings.get('level', 'INFO')).upper(), logging.INFO))
+
+    SUCCESS_SAMPLER.configure(settings.get('sample_success_every', 100), settings.get('sample_interval_seconds', 60))
+    if not settings.get('caller_info', False):
+        # Neither format prints them, so skip looking them up for every record
+        logging.logProcesses = False
+        logging.logMultiprocessing = False
+
+    handlers = build_handlers(settings)
+    if settings.get('mode', 'async') != 'async':
+        for handler in handlers:
+            root.addHandler(handler)
+        return None
+
+    log_queue: "queue.Queue[logging.LogRecord]" = queue.Queue(maxsize=settings.get('queue_size', 10000))
+    root.addHandler(NonBlockingQueueHandler(log_queue))
+
+    _listener = _Listener(log_queue, *handlers, respect_handler_level=True)
+    _listener.start()
+    return _listener
+
+
+def shutdown_logging():
+    """Flush queued records and stop the background writer"""
+    global _listener
+    if _listener is not None:
+        listener, _listener = _listener, None
+        listener.stop()
+        for handler in listener.handlers:
+            handler.close()
+
+
+class _Forwarder(logging.Handler):
+    """Hands records from another process to this process's loggers"""
+
+    def emit(self, record: logging.LogRecord):
+        logger = logging.getLogger(record.name)
+        if logger.isEnabledFor(record.levelno):
+            logger.handle(record)
+
+
+def forward_logs(log_queue) -> QueueListener:
+    """Re-log records that worker processes put on ``log_queue`` here"""
+    listener = QueueListener(log_queue, _Forwarder())
+    listener.start()
+    return listener
+
+
+def configure_worker_logging(log_queue, settings: Optional[dict] = None, prefix: str = ""):
+    """Send this worker process's records to the parent through ``log_queue``
+
+    Records are formatted (with ``prefix``) before they cross the process
+    boundary, and success lines are sampled per worker.
+    """
+    settings = settings or {}
+    root = logging.getLogger()
+    for handler in list(root.handlers):
+        root.removeHandler(handler)
+    root.setLevel(getattr(logging, str(settings.get('level', 'INFO')).upper(), logging.INFO))
+    SUCCESS_SAMPLER.configure(settings.get('sample_success_every', 100), settings.get('sample_interval_seconds', 60))
+    if not settings.get('caller_info', False):
+        logging.logProcesses = False
+        logging.logMultiprocessing = False
+    handler = QueueHandler(log_queue)
+    handler.setFormatter(logging.Formatter(prefix + "%(message)s"))
+    root.addHandler(handler)
+
+
+atexit.register(shutdown_logging)
@@ -0,0 +1,679 @@
+"""
+Benchmarks for Senior Advertising Bot email campaigns
+Runs the real SeniorEmailCampaign against a local SMTP sink, and the Graph
+client and community poster against local Graph and site stubs; the suite mode sweeps list sizes and
+stores results as JSON for comparing runs
+"""
+
+import argparse
+import json
+import logging
+import multiprocessing
+import os
+import platform
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+from concurrent.futures import ProcessPoolExecutor
+from datetime import datetime, timezone
+from typing import Iterator, List, Optional
+
+try:
+    import resource
+except ImportError:  # Windows
+    resource = None
+
+from community_poster import CLOSED, CommunitySitePoster
+from email_campaign import SeniorEmailCampaign
+from email_templates import CompiledEmailTemplate, serialize_for_smtp
+from facebook_client import MAYBE_POSTED, FacebookGraphClient
+from graph_stub import GraphStub
+from metrics import COMMUNITY_SECONDS, HistogramValue
+from site_stub import SiteStub
+from smtp_sink import SMTPSink
+from suppression import SuppressionIndex, SuppressionIngester
+
+SAMPLE_MESSAGE = (
+    "🌟 Senior Support Services - Providing patient, clear technology help\n\n"
+    "We understand the importance of clear communication and reliable service.\n"
+    "📞 Call us at: (555) 123-4567 | 📧 Email: help@seniorservices.com\n\n"
+    "Feel free to call or email with any questions!"
+)
+
+
+def make_recipients(count: int) -> list:
+    """Synthetic recipient list in the same format as config.json"""
+    return [f"Senior Friend {i} <friend{i}@example.com>" for i in range(count)]
+
+
+def benchmark_delivery(count: int = 500, workers: int = 4, delay: float = 0.005) -> dict:
+    """Measure campaign throughput with one connection versus a worker pool"""
+    recipients = make_recipients(count)
+    report = {}
+
+    for label, pool_size in (("single_connection", 1), ("pooled", workers)):
+        with SMTPSink(delay=delay) as sink:
+            config = {"platforms": {"email": sink.email_config(pool_size=pool_size, workers=pool_size)}}
+            campaign = SeniorEmailCampaign(config)
+
+            started = time.perf_counter()
+            ok = campaign.send_email_campaign(recipients, "Benchmark", "Hello from the benchmark")
+            elapsed = time.perf_counter() - started
+
+            delivered = sum(1 for result in campaign.last_results if result.success)
+            if not ok or delivered != count or sink.message_count != count:
+                raise RuntimeError(f"{label}: delivered {delivered}/{count}, sink saw {sink.message_count}")
+
+            report[label] = {
+                "messages": count,
+                "seconds": round(elapsed, 3),
+                "messages_per_second": round(count / elapsed, 1),
+                "connections": sink.connection_count,
+            }
+
+    report["speedup"] = round(
+        report["pooled"]["messages_per_second"] / report["single_connection"]["messages_per_second"], 2
+    )
+    return report
+
+
+def benchmark_render(count: int = 2000) -> dict:
+    """Per-message cost of building wire bytes: full MIME path versus compiled template"""
+    campaign = SeniorEmailCampaign({"platforms": {"email": {"username": "bot@seniorservices.com"}}})
+    template = CompiledEmailTemplate(campaign, "Benchmark", SAMPLE_MESSAGE)
+    names = [f"Senior Friend {i}" for i in range(count)]
+    report = {}
+
+    started = time.perf_counter()
+    for i, name in enumerate(names):
+        serialize_for_smtp(template.build_message(name, f"friend{i}@example.com"))
+    report["mime_us_per_message"] = round((time.perf_counter() - started) / count * 1e6, 1)
+
+    started = time.perf_counter()
+    for i, name in enumerate(names):
+        template.render(name, f"friend{i}@example.com")
+    report["compiled_us_per_message"] = round((time.perf_counter() - started) / count * 1e6, 1)
+
+    report["speedup"] = round(report["mime_us_per_message"] / report["compiled_us_per_message"], 1)
+    return report
+
+
+def benchmark_dkim(count: int = 2000) -> dict:
+    """Per-message DKIM cost: full signing versus the template's cached body hash"""
+    from cryptography.hazmat.primitives.asymmetric import ed25519, rsa
+    from dkim_signer import DKIMSigner
+
+    campaign = SeniorEmailCampaign({"platforms": {"email": {"enabled": True, "username": "bot@seniorservices.com"}}})
+    recipients = [(f"Senior Friend {i % 50}", f"friend{i}@example.com") for i in range(count)]
+    report = {}
+    for label, key in (("rsa_2048", rsa.generate_private_key(public_exponent=65537, key_size=2048)),
+                       ("ed25519", ed25519.Ed25519PrivateKey.generate())):
+        signer = DKIMSigner("seniorservices.com", "senior", key)
+        plain = CompiledEmailTemplate(campaign, "Benchmark", SAMPLE_MESSAGE)
+        signed = CompiledEmailTemplate(campaign, "Benchmark", SAMPLE_MESSAGE, signer=signer)
+
+        started = time.perf_counter()
+        for name, email in recipients:
+            signer.sign(plain.render(name, email))
+        full = time.perf_counter() - started
+
+        started = time.perf_counter()
+        for name, email in recipients:
+            signed.render(name, email)
+        cached = time.perf_counter() - started
+        report[label] = {
+            "full_us_per_message": round(full / count * 1e6, 1),
+            "cached_us_per_message": round(cached / count * 1e6, 1),
+        }
+    return report
+
+
+def benchmark_outbox(count: int = 2000, workers: int = 4, commit_every: int = 500, repeat: int = 3) -> dict:
+    """Send throughput with and without the durable outbox
+
+    Against a zero-latency sink the two runs differ by less than their own
+    run-to-run noise, so they alternate ``repeat`` times and medians are kept.
+    """
+    recipients = make_recipients(count)
+    timings = {"no_outbox": [], "outbox": []}
+
+    with tempfile.TemporaryDirectory() as tmp:
+        for run in range(repeat):
+            for label in timings:
+                with SMTPSink() as sink:
+                    email_config = sink.email_config(pool_size=workers, workers=workers)
+                    if label == "outbox":
+                        email_config.update(outbox=os.path.join(tmp, f"outbox{run}.db"), outbox_commit_every=commit_every)
+                    campaign = SeniorEmailCampaign({"platforms": {"email": email_config}})
+
+                    started = time.perf_counter()
+                    campaign.send_email_campaign(iter(recipients), "Benchmark", SAMPLE_MESSAGE)
+                    timings[label].append(time.perf_counter() - started)
+                    if sink.message_count != count:
+                        raise RuntimeError(f"{label}: sink saw {sink.message_count}/{count} messages")
+
+    report = {}
+    for label, seconds in timings.items():
+        elapsed = statistics.median(seconds)
+        report[label] = {"seconds": round(elapsed, 3), "messages_per_second": round(count / elapsed, 1)}
+    report["overhead_percent"] = round(
+        (report["outbox"]["seconds"] / report["no_outbox"]["seconds"] - 1) * 100, 1
+    )
+    return report
+
+
+BOUNCE_TEMPLATE = (
+    "From MAILER-DAEMON Mon Jan  1 00:00:00 2024\n"
+    "From: Mail Delivery System <MAILER-DAEMON@mx.example.com>\n"
+    "To: bot@seniorservices.com\n"
+    "Subject: Undelivered Mail Returned to Sender\n"
+    "MIME-Version: 1.0\n"
+    'Content-Type: multipart/report; report-type=delivery-status; boundary="b{i}"\n\n'
+    "--b{i}\nContent-Type: text/plain\n\nThe mail system could not deliver your message.\n\n"
+    "--b{i}\nContent-Type: message/delivery-status\n\n"
+    "Reporting-MTA: dns; mx.example.com\n\n"
+    "Final-Recipient: rfc822; friend{i}@example.com\nAction: failed\nStatus: 5.1.1\n\n"
+    "--b{i}--\n\n"
+)
+
+REPLY_TEMPLATE = (
+    "From friend{i}@example.com Mon Jan  1 00:00:00 2024\n"
+    "From: Senior Friend {i} <friend{i}@example.com>\n"
+    "To: bot@seniorservices.com\n"
+    "Subject: Re: A friendly hello\n\n"
+    "{body}\n\n"
+    "On Mon, Jan 1, 2024 Senior Support Services wrote:\n"
+    "> If you'd prefer not to receive these emails, simply reply with \"UNSUBSCRIBE\"\n\n"
+)
+
+
+def write_sample_mailbox(path: str, count: int) -> int:
+    """mbox of replies where every 10th is an UNSUBSCRIBE and every 10th a bounce"""
+    suppressed = 0
+    with open(path, "w") as mailbox:
+        for i in range(count):
+            if i % 10 == 0:
+                mailbox.write(BOUNCE_TEMPLATE.format(i=i))
+                suppressed += 1
+            elif i % 10 == 5:
+                mailbox.write(REPLY_TEMPLATE.format(i=i, body="UNSUBSCRIBE please"))
+                suppressed += 1
+            else:
+                mailbox.write(REPLY_TEMPLATE.format(i=i, body="Thank you, could you call me on Tuesday?\n" * 20))
+    return suppressed
+
+
+def benchmark_suppression(count: int = 20000, lookups: int = 200000) -> dict:
+    """Mailbox ingestion throughput and the per-recipient cost of the suppression check"""
+    report = {}
+    with tempfile.TemporaryDirectory() as tmp:
+        mailbox = os.path.join(tmp, "replies.mbox")
+        expected = write_sample_mailbox(mailbox, count)
+
+        with SuppressionIndex(os.path.join(tmp, "suppressions.db")) as index:
+            ingester = SuppressionIngester(index)
+            summary = ingester.ingest(mailbox)
+            if summary.added != expected or len(index) != expected:
+                raise RuntimeError(f"suppressed {len(index)} addresses, expected {expected}")
+            report["ingest"] = {
+                "messages": summary.messages,
+                "seconds": round(summary.seconds, 3),
+                "messages_per_second": round(summary.messages / summary.seconds, 1),
+                "megabytes_per_second": round(summary.bytes / summary.seconds / 1e6, 1),
+                "suppressed": summary.added,
+            }
+
+            # A second pass only reads what was appended since the first
+            rerun = ingester.ingest(mailbox)
+            report["rerun_seconds"] = round(rerun.seconds, 4)
+
+            addresses = [f"friend{i}@example.com" for i in range(lookups)]
+            started = time.perf_counter()
+            hits = sum(1 for address in addresses if address in index)
+            elapsed = time.perf_counter() - started
+            report["lookup"] = {
+                "checks": lookups,
+                "us_per_check": round(elapsed / lookups * 1e6, 2),
+                "suppressed": hits,
+                "database_checks": index.database_checks,
+            }
+    return report
+
+
+# 5% wide latency buckets from 10us to over a minute
+LATENCY_BUCKETS = tuple(0.00001 * 1.05 ** i for i in range(325))
+
+SUITE_SIZES = (1000, 10000, 100000)
+# With --full; a million recipients takes minutes, so it is left out of quick runs
+FULL_SUITE_SIZES = SUITE_SIZES + (1000000,)
+
+# Compared between runs; True where a larger number is better
+SUITE_METRICS = {
+    "messages_per_second": True,
+    "p50_ms": False,
+    "p99_ms": False,
+    "peak_rss_mb": False,
+}
+
+
+def stream_recipients(count: int) -> Iterator[str]:
+    """Synthetic recipients generated on the fly, like a streaming source"""
+    for i in range(count):
+        yield f"Senior Friend {i} <friend{i}@example.com>"
+
+
+def peak_rss_mb() -> Optional[float]:
+    """High-water resident set size of this process"""
+    if resource is None:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Linux reports KiB, macOS bytes
+    return round(peak / (1024 * 1024 if sys.platform == "darwin" else 1024), 1)
+
+
+def run_campaign(email_config: dict, count: int) -> dict:
+    """One campaign of ``count`` recipients; runs in a fresh process so RSS is its own"""
+    logging.basicConfig(level=logging.WARNING)
+    latency = HistogramValue(LATENCY_BUCKETS)
+    campaign = SeniorEmailCampaign({"platforms": {"email": email_config}})
+
+    started = time.perf_counter()
+    campaign.send_email_campaign(
+        stream_recipients(count), "Benchmark", SAMPLE_MESSAGE,
+        on_result=lambda index, result: latency.observe(result.elapsed)
+    )
+    elapsed = time.perf_counter() - started
+    return {
+        "recipients": count,
+        "messages": latency.count,
+        "seconds": round(elapsed, 3),
+        "messages_per_second": round(latency.count / elapsed, 1),
+        "p50_ms": round(latency.quantile(0.5) * 1000, 3),
+        "p99_ms": round(latency.quantile(0.99) * 1000, 3),
+        "peak_rss_mb": peak_rss_mb(),
+    }
+
+
+def environment() -> dict:
+    """What the numbers were measured on, so runs can be told apart"""
+    try:
+        commit = subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True,
+            cwd=os.path.dirname(os.path.abspath(__file__)), timeout=10
+        ).stdout.strip() or None
+    except (OSError, subprocess.SubprocessError):
+        commit = None
+    return {
+        "timestamp": datetime.now(timezone.utc).isoformat(timespec="seconds"),
+        "commit": commit,
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "cpus": os.cpu_count(),
+    }
+
+
+def benchmark_suite(sizes: List[int] = SUITE_SIZES, workers: int = 4, delay: float = 0.0, repeat: int = 1) -> dict:
+    """Throughput, p50/p99 latency and peak RSS for each list size
+
+    The sink runs here while each campaign runs in its own spawned process,
+    so sender memory and CPU are measured without the sink mixed in. With
+    ``repeat`` each size runs several times and the median-throughput run
+    is kept, which steadies comparisons on noisy machines.
+    """
+    results = {
+        "environment": environment(),
+        "parameters": {"workers": workers, "delay": delay, "repeat": repeat},
+        "runs": [],
+    }
+    context = multiprocessing.get_context("spawn")
+    for count in sizes:
+        attempts = []
+        for _ in range(max(1, repeat)):
+            with SMTPSink(delay=delay) as sink:
+                email_config = sink.email_config(pool_size=workers, workers=workers)
+                with ProcessPoolExecutor(max_workers=1, mp_context=context) as executor:
+                    attempt = executor.submit(run_campaign, email_config, count).result()
+                if sink.message_count != count:
+                    raise RuntimeError(f"{count} recipients: sink saw {sink.message_count} messages")
+                attempt["connections"] = sink.connection_count
+            attempts.append(attempt)
+        attempts.sort(key=lambda attempt: attempt["messages_per_second"])
+        run = attempts[len(attempts) // 2]
+        results["runs"].append(run)
+        print(f"{count:>9} recipients: {run['messages_per_second']:>8} msg/s, p50 {run['p50_ms']} ms, "
+              f"p99 {run['p99_ms']} ms, peak RSS {run['peak_rss_mb']} MB", flush=True)
+    return results
+
+
+def benchmark_shards(count: int = 100000, shards: Optional[int] = None, workers: int = 4, delay: float = 0.0) -> dict:
+    """Throughput of one process versus a sharded campaign with ``shards`` worker processes
+
+    Like the suite, the campaign runs in its own spawned process so the sink
+    here does not compete with it for the GIL.
+    """
+    shards = shards or os.cpu_count() or 1
+    report = {"cpus": os.cpu_count()}
+    context = multiprocessing.get_context("spawn")
+    for label, shard_count in (("single_process", 1), ("sharded", shards)):
+        with SMTPSink(delay=delay) as sink:
+            email_config = sink.email_config(pool_size=workers, workers=workers, shards=shard_count)
+            with ProcessPoolExecutor(max_workers=1, mp_context=context) as executor:
+                run = executor.submit(run_campaign, email_config, count).result()
+            if sink.message_count != count:
+                raise RuntimeError(f"{label}: sink saw {sink.message_count}/{count} messages")
+        report[label] = {
+            "shards": shard_count,
+            "seconds": run["seconds"],
+            "messages_per_second": run["messages_per_second"],
+        }
+    report["speedup"] = round(
+        report["sharded"]["messages_per_second"] / report["single_process"]["messages_per_second"], 2
+    )
+    return report
+
+
+def benchmark_bulk(count: int = 5000, workers: int = 4, delay: float = 0.005, batch_size: int = 50) -> dict:
+    """Per-recipient messages versus bulk envelopes of ``batch_size`` recipients"""
+    recipients = make_recipients(count)
+    report = {}
+    for label, bulk in (("per_recipient", False), ("bulk_envelope", True)):
+        with SMTPSink(delay=delay) as sink:
+            email_config = sink.email_config(pool_size=workers, workers=workers,
+                                             bulk_envelope={"enabled": bulk, "batch_size": batch_size})
+            campaign = SeniorEmailCampaign({"platforms": {"email": email_config}})
+
+            started = time.perf_counter()
+            ok = campaign.send_email_campaign(recipients, "Benchmark", SAMPLE_MESSAGE)
+            elapsed = time.perf_counter() - started
+
+            delivered = sum(1 for result in campaign.last_results if result.success)
+            if not ok or delivered != count or sink.recipient_count != count:
+                raise RuntimeError(f"{label}: delivered {delivered}/{count}, sink saw {sink.recipient_count}")
+            report[label] = {
+                "recipients": count,
+                "seconds": round(elapsed, 3),
+                "recipients_per_second": round(count / elapsed, 1),
+                "transactions": sink.message_count,
+                "megabytes": round(sink.bytes_received / 1e6, 3),
+            }
+    report["speedup"] = round(
+        report["bulk_envelope"]["recipients_per_second"] / report["per_recipient"]["recipients_per_second"], 2
+    )
+    return report
+
+
+def benchmark_faults(count: int = 2000, workers: int = 4, delay: float = 0.005) -> dict:
+    """Throughput against a clean sink versus one that drops connections, defers
+    recipients and expires sessions; every message must still arrive"""
+    recipients = make_recipients(count)
+    retry = {"max_attempts": 6, "base_delay_seconds": 0.05, "max_delay_seconds": 1.0}
+    report = {}
+    # Every injected fault would otherwise log a retry warning
+    delivery_logger = logging.getLogger("email_delivery")
+    level = delivery_logger.level
+    delivery_logger.setLevel(logging.ERROR)
+    for label, faults in (("clean", {}),
+                          ("faulty", {"drop_every": 50, "defer_every": 40, "fail_logins": 1, "session_messages": 100})):
+        with SMTPSink(delay=delay, **faults) as sink:
+            email_config = sink.email_config(pool_size=workers, workers=workers, retry=retry)
+            campaign = SeniorEmailCampaign({"platforms": {"email": email_config}})
+
+            started = time.perf_counter()
+            campaign.send_email_campaign(recipients, "Benchmark", "Hello from the benchmark")
+            elapsed = time.perf_counter() - started
+
+            summary = campaign.last_summary
+            if summary is None or summary.sent != count or sink.recipient_count != count:
+                raise RuntimeError(f"{label}: delivered {summary and summary.sent}/{count}, sink saw {sink.recipient_count}")
+            report[label] = {
+                "messages_per_second": round(count / elapsed, 1),
+                "faults": sink.faults_injected,
+                "retried": summary.retried,
+                "logins": sink.login_count,
+            }
+    delivery_logger.setLevel(level)
+    report["throughput_kept_percent"] = round(
+        report["faulty"]["messages_per_second"] / report["clean"]["messages_per_second"] * 100, 1
+    )
+    return report
+
+
+def benchmark_facebook(count: int = 1000, delay: float = 0.005) -> dict:
+    """Group posting against a clean Graph stub versus one that throttles, fails,
+    stalls and rate-limits; no group may ever be posted to twice"""
+    group_ids = [f"group{i}" for i in range(count)]
+    report = {}
+    facebook_logger = logging.getLogger("facebook_client")
+    level = facebook_logger.level
+    facebook_logger.setLevel(logging.ERROR)
+    for label, faults in (("clean", {}),
+                          ("faulty", {"throttle_requests": 1, "fail_requests": 1, "stall_requests": 1,
+                                      "stall_seconds": 1.0, "rate_limit_every": 7, "null_every": 11})):
+        with GraphStub(delay=delay, **faults) as stub:
+            client = FacebookGraphClient.from_config(stub.facebook_config(group_ids, max_retries=8),
+                                                     backoff_seconds=0.01,
+                                                     timeout=0.5)
+            started = time.perf_counter()
+            try:
+                results = client.post_to_groups(group_ids, SAMPLE_MESSAGE)
+            finally:
+                client.close()
+            elapsed = time.perf_counter() - started
+
+            posted = sum(result.success for result in results)
+            unknown = sum(not result.success and MAYBE_POSTED in (result.error or "") for result in results)
+            if stub.double_posted():
+                raise RuntimeError(f"{label}: posted twice to {len(stub.double_posted())} groups")
+            # Groups in a batch whose reply was lost may or may not have been posted
+            missing = sum(result.success and result.group_id not in stub.posts for result in results)
+            if posted + unknown != count or missing:
+                raise RuntimeError(f"{label}: posted {posted}/{count} ({unknown} unknown), "
+                                   f"{missing} reported posted that the stub never saw")
+            report[label] = {
+                "posts_per_second": round(count / elapsed, 1),
+                "batches": stub.request_count,
+                "faults": stub.faults_injected,
+                "not_resent": unknown,
+            }
+    facebook_logger.setLevel(level)
+    return report
+
+
+def benchmark_community(cycles: int = 3, timeout: float = 1.0, total_timeout: float = 1.5) -> dict:
+    """Community posting cycles against healthy, slow, failing and slow-drip sites;
+    every cycle must finish within its total time limit and bad hosts get tripped"""
+    stubs = {
+        "healthy": SiteStub(),
+        "slow": SiteStub(delay=timeout / 2),
+        "failing": SiteStub(status=503),
+        "drip_body": SiteStub(drip="body", drip_seconds=0.1),
+        "drip_headers": SiteStub(drip="headers", drip_seconds=0.1),
+    }
+    for stub in stubs.values():
+        stub.start()
+    poster = CommunitySitePoster([stub.url for stub in stubs.values()], timeout_seconds=timeout,
+                                 total_timeout_seconds=total_timeout, failure_threshold=2)
+    community_logger = logging.getLogger("community_poster")
+    level = community_logger.level
+    community_logger.setLevel(logging.ERROR)
+    report = {"cycles": []}
+    try:
+        for cycle in range(cycles):
+            started = time.perf_counter()
+            results = dict(zip(stubs, poster.post(SAMPLE_MESSAGE)))
+            elapsed = time.perf_counter() - started
+            if elapsed > total_timeout + 0.5:
+                raise RuntimeError(f"cycle {cycle + 1} took {elapsed:.2f}s, limit {total_timeout}s")
+            if not (results["healthy"].success and results["slow"].success):
+                raise RuntimeError(f"cycle {cycle + 1}: healthy sites failed: {results}")
+            report["cycles"].append({
+                "seconds": round(elapsed, 2),
+                "posted": sum(result.success for result in results.values()),
+                "skipped": sum(result.skipped for result in results.values()),
+            })
+        names = {stub.url: label for label, stub in stubs.items()}
+        states = {names[result.url]: poster.breaker_states()[result.host] for result in poster.post(SAMPLE_MESSAGE)}
+        if any(states[label] == CLOSED for label in ("failing", "drip_body", "drip_headers")):
+            raise RuntimeError(f"bad sites were not tripped: {states}")
+        report["breakers"] = states
+        report["p50_seconds"] = {
+            label: COMMUNITY_SECONDS.labels(f"{stub.host}:{stub.port}").quantile(0.5) for label, stub in stubs.items()
+        }
+    finally:
+        community_logger.setLevel(level)
+        poster.close()
+        for stub in stubs.values():
+            stub.stop()
+    return report
+
+
+def compare_results(baseline: dict, current: dict, threshold: float = 10.0) -> List[str]:
+    """Lines comparing two suite results; regressions beyond ``threshold`` percent are flagged"""
+    lines = []
+    regressions = 0
+    previous = {run["recipients"]: run for run in baseline.get("runs", [])}
+    for run in current["runs"]:
+        before = previous.get(run["recipients"])
+        if before is None:
+            continue
+        for metric, higher_is_better in SUITE_METRICS.items():
+            old, new = before.get(metric), run.get(metric)
+            if not old or new is None:
+                continue
+            change = (new - old) / old * 100
+            worse = -change if higher_is_better else change
+            flag = ""
+            if worse > threshold:
+                flag = "  REGRESSION"
+                regressions += 1
+            lines.append(f"{run['recipients']:>9} {metric:>20}: {old:>10} -> {new:>10} ({change:+.1f}%){flag}")
+    lines.append(f"{regressions} regressions beyond {threshold}%")
+    return lines
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark the email send pipeline")
+    parser.add_argument("benchmark", nargs="?", choices=("delivery", "render", "outbox", "dkim", "suppression", "shards", "bulk", "faults", "facebook", "community", "suite", "all"), default="all")
+    parser.add_argument("--count", type=int, default=500, help="recipients per run")
+    parser.add_argument("--workers", type=int, default=4, help="pooled connections and workers")
+    parser.add_argument("--delay", type=float, default=0.005, help="simulated server latency per message (s)")
+    parser.add_argument("--sizes", help="suite: comma-separated list sizes (default: "
+                        + ",".join(map(str, SUITE_SIZES)) + ")")
+    parser.add_argument("--full", action="store_true",
+                        help="suite: also run 1,000,000 recipients (" + ",".join(map(str, FULL_SUITE_SIZES)) + ")")
+    parser.add_argument("--output", help="suite: write results to this JSON file")
+    parser.add_argument("--compare", help="suite: earlier results JSON to compare against")
+    parser.add_argument("--repeat", type=int, default=1, help="suite: runs per size, median kept")
+    parser.add_argument("--shards", type=int, help="shards: worker processes (default: one per CPU)")
+    parser.add_argument("--batch-size", type=int, default=50, help="bulk: recipients per SMTP transaction")
+    parser.add_argument("--threshold", type=float, default=10.0, help="suite: regression threshold in percent")
+    args = parser.parse_args()
+
+    if args.benchmark == "suite":
+        if args.sizes:
+            sizes = [int(size) for size in args.sizes.split(",") if size.strip()]
+        else:
+            sizes = list(FULL_SUITE_SIZES if args.full else SUITE_SIZES)
+        results = benchmark_suite(sizes, args.workers, args.delay, args.repeat)
+        if args.output:
+            with open(args.output, "w") as f:
+                json.dump(results, f, indent=2)
+            print(f"Results written to {args.output}")
+        if args.compare:
+            with open(args.compare) as f:
+                lines = compare_results(json.load(f), results, args.threshold)
+            print("\n".join(lines))
+            if "REGRESSION" in "\n".join(lines):
+                sys.exit(1)
+        return
+
+    logging.basicConfig(level=logging.WARNING)
+
+    if args.benchmark in ("delivery", "all"):
+        report = benchmark_delivery(args.count, args.workers, args.delay)
+        print("Delivery throughput:")
+        for label in ("single_connection", "pooled"):
+            stats = report[label]
+            print(f"{label:>18}: {stats['messages_per_second']:>8} msg/s "
+                  f"({stats['messages']} messages in {stats['seconds']}s, {stats['connections']} connections)")
+        print(f"{'speedup':>18}: {report['speedup']}x")
+
+    if args.benchmark in ("render", "all"):
+        report = benchmark_render(max(args.count, 2000))
+        print("Per-message render cost:")
+        print(f"{'MIME path':>18}: {report['mime_us_per_message']} us")
+        print(f"{'compiled':>18}: {report['compiled_us_per_message']} us")
+        print(f"{'speedup':>18}: {report['speedup']}x")
+
+    if args.benchmark in ("outbox", "all"):
+        report = benchmark_outbox(max(args.count, 2000), args.workers)
+        print("Checkpoint overhead:")
+        for label in ("no_outbox", "outbox"):
+            print(f"{label:>18}: {report[label]['messages_per_second']:>8} msg/s")
+        print(f"{'overhead':>18}: {report['overhead_percent']}%")
+
+    if args.benchmark in ("dkim", "all"):
+        report = benchmark_dkim(max(args.count, 2000))
+        print("DKIM render and sign cost (50 distinct names):")
+        for label in ("rsa_2048", "ed25519"):
+            stats = report[label]
+            print(f"{label:>18}: {stats['full_us_per_message']} us full, {stats['cached_us_per_message']} us cached body hash")
+
+    if args.benchmark in ("suppression", "all"):
+        report = benchmark_suppression(max(args.count, 20000))
+        ingest, lookup = report["ingest"], report["lookup"]
+        print("Suppression ingestion:")
+        print(f"{'mbox':>18}: {ingest['messages_per_second']:>8} msg/s "
+              f"({ingest['messages']} messages, {ingest['megabytes_per_second']} MB/s, "
+              f"{ingest['suppressed']} suppressed)")
+        print(f"{'rerun':>18}: {report['rerun_seconds']}s")
+        print(f"{'check':>18}: {lookup['us_per_check']} us per recipient "
+              f"({lookup['database_checks']} database lookups for {lookup['checks']} checks)")
+
+    if args.benchmark == "shards":
+        report = benchmark_shards(max(args.count, 100000), args.shards, args.workers, args.delay)
+        print(f"Sharded campaign ({report['cpus']} CPUs):")
+        for label in ("single_process", "sharded"):
+            stats = report[label]
+            print(f"{label:>18}: {stats['messages_per_second']:>8} msg/s ({stats['shards']} shards, {stats['seconds']}s)")
+        print(f"{'speedup':>18}: {report['speedup']}x")
+
+    if args.benchmark in ("bulk", "all"):
+        report = benchmark_bulk(max(args.count, 5000), args.workers, args.delay, args.batch_size)
+        print("Bulk envelopes:")
+        for label in ("per_recipient", "bulk_envelope"):
+            stats = report[label]
+            print(f"{label:>18}: {stats['recipients_per_second']:>8} recipients/s "
+                  f"({stats['transactions']} transactions, {stats['megabytes']} MB sent)")
+        print(f"{'speedup':>18}: {report['speedup']}x")
+
+    if args.benchmark in ("faults", "all"):
+        report = benchmark_faults(max(args.count, 2000), args.workers, args.delay)
+        print("Transient SMTP faults:")
+        for label in ("clean", "faulty"):
+            stats = report[label]
+            print(f"{label:>18}: {stats['messages_per_second']:>8} msg/s ({stats['faults']} faults, "
+                  f"{stats['retried']} retries, {stats['logins']} logins)")
+        print(f"{'throughput kept':>18}: {report['throughput_kept_percent']}%")
+
+    if args.benchmark in ("facebook", "all"):
+        report = benchmark_facebook(max(args.count, 1000), args.delay)
+        print("Facebook group posting:")
+        for label in ("clean", "faulty"):
+            stats = report[label]
+            print(f"{label:>18}: {stats['posts_per_second']:>8} posts/s ({stats['batches']} batches, "
+                  f"{stats['faults']} faults, {stats['not_resent']} of unknown outcome not resent)")
+
+    if args.benchmark in ("community", "all"):
+        report = benchmark_community()
+        print("Community sites (healthy, slow, failing, slow-drip):")
+        for number, stats in enumerate(report["cycles"], 1):
+            print(f"{'cycle ' + str(number):>18}: {stats['seconds']:>6}s ({stats['posted']} posted, {stats['skipped']} skipped)")
+        for label, state in report["breakers"].items():
+            print(f"{label:>18}: circuit {state}, p50 {report['p50_seconds'][label]}s")
+
+
+if __name__ == "__main__":
+    main()
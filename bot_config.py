@@ -0,0 +1,265 @@
+"""
+Configuration for Senior Advertising Bot
+Validates config.json once into compact, typed settings and reloads them
+when the file changes, swapping in a new snapshot only if it is valid
+"""
+
+import json
+import logging
+import os
+from typing import Dict, List, Optional, Tuple
+
+from recipient_parser import parse_recipient
+from window_scheduler import WindowScheduler
+
+
+class ConfigError(ValueError):
+    """Raised with every problem found in a configuration"""
+
+    def __init__(self, problems: List[str]):
+        self.problems = problems
+        super().__init__("Invalid configuration: " + "; ".join(problems))
+
+
+class _Checker:
+    def __init__(self):
+        self.problems: List[str] = []
+
+    def section(self, raw: dict, path: str) -> dict:
+        value = raw
+        for key in path.split("."):
+            value = value.get(key, {}) if isinstance(value, dict) else {}
+        if not isinstance(value, dict):
+            self.problems.append(f"{path} must be an object")
+            return {}
+        return value
+
+    def check(self, section: dict, path: str, key: str, kind, default=None, minimum=None, maximum=None,
+              required: bool = False):
+        value = section.get(key, default)
+        name = f"{path}.{key}" if path else key
+        if value is None:
+            if required:
+                self.problems.append(f"{name} is required")
+            return default
+        if isinstance(value, bool) and kind is not bool:
+            self.problems.append(f"{name} must be {kind.__name__}, not a boolean")
+            return default
+        if kind is float and isinstance(value, int):
+            value = float(value)
+        if not isinstance(value, kind):
+            self.problems.append(f"{name} must be {kind.__name__}, got {type(value).__name__}")
+            return default
+        if minimum is not None and value < minimum:
+            self.problems.append(f"{name} must be at least {minimum}")
+        if maximum is not None and value > maximum:
+            self.problems.append(f"{name} must be at most {maximum}")
+        return value
+
+
+class PlatformSettings:
+    """Settings every platform has; ``raw`` is the section as loaded"""
+    __slots__ = ("enabled", "cycle_timeout", "raw")
+
+    def __init__(self, enabled: bool, cycle_timeout: float, raw):
+        self.enabled = enabled
+        self.cycle_timeout = cycle_timeout
+        self.raw = raw
+
+
+class EmailSettings(PlatformSettings):
+    __slots__ = ("subject",)
+
+    def __init__(self, enabled: bool, cycle_timeout: float, raw, subject: Optional[str]):
+        super().__init__(enabled, cycle_timeout, raw)
+        self.subject = subject
+
+
+class FacebookSettings(PlatformSettings):
+    __slots__ = ("group_ids", "access_token")
+
+    def __init__(self, enabled: bool, cycle_timeout: float, raw, group_ids: Tuple[str, ...], access_token: str):
+        super().__init__(enabled, cycle_timeout, raw)
+        self.group_ids = group_ids
+        self.access_token = access_token
+
+
+class BotConfig:
+    """One validated snapshot of config.json
+
+    The bot's own hot paths read the typed attributes. ``raw`` is the parsed
+    file for components that take a config section; every reload parses a
+    fresh one, so a snapshot in use is never modified underneath its reader.
+    """
+    __slots__ = (
+        "business_name", "target_message", "contact_info",
+        "email", "facebook", "community_sites",
+        "frequency_hours", "metrics_port", "metrics_textfile", "reload_check_seconds",
+        "raw", "stamp",
+    )
+
+    def __init__(self, raw: dict, stamp: Tuple[int, int] = (0, 0)):
+        checker = _Checker()
+        self.business_name = checker.check(raw, "", "business_name", str, required=True)
+        self.target_message = checker.check(raw, "", "target_message", str, required=True)
+        self.contact_info = checker.check(raw, "", "contact_info", str, required=True)
+
+        email = checker.section(raw, "platforms.email")
+        self.email = EmailSettings(
+            checker.check(email, "platforms.email", "enabled", bool, False),
+            checker.check(email, "platforms.email", "cycle_timeout_seconds", float, 3600.0, minimum=1),
+            None,
+            checker.check(email, "platforms.email", "subject", str),
+        )
+        if self.email.enabled:
+            checker.check(email, "platforms.email", "smtp_server", str, required=True)
+            checker.check(email, "platforms.email", "smtp_port", int, 587, minimum=1, maximum=65535)
+            username = checker.check(email, "platforms.email", "username", str, required=True)
+            if username is not None and parse_recipient(username)[0] is None:
+                checker.problems.append(f"platforms.email.username must be an email address, got {username!r}")
+        checker.check(email, "platforms.email", "pool_size", int, 4, minimum=1)
+        checker.check(email, "platforms.email", "workers", int, 4, minimum=1)
+        checker.check(email, "platforms.email", "shards", int, 1, minimum=1)
+        checker.check(email, "platforms.email", "dedupe_recipients", bool, True)
+        checker.check(email, "platforms.email", "rejected_report", str)
+        bulk = checker.section(raw, "platforms.email.bulk_envelope")
+        checker.check(bulk, "platforms.email.bulk_envelope", "enabled", bool, False)
+        # RFC 5321 servers must take at least 100 recipients per message
+        checker.check(bulk, "platforms.email.bulk_envelope", "batch_size", int, 50, minimum=1, maximum=100)
+        retry = checker.section(raw, "platforms.email.retry")
+        checker.check(retry, "platforms.email.retry", "max_attempts", int, 4, minimum=1)
+        checker.check(retry, "platforms.email.retry", "base_delay_seconds", float, 2.0, minimum=0)
+        checker.check(retry, "platforms.email.retry", "max_delay_seconds", float, 60.0, minimum=0)
+        dkim = checker.section(raw, "platforms.email.dkim")
+        if checker.check(dkim, "platforms.email.dkim", "enabled", bool, False):
+            for key in ("domain", "selector", "private_key_file"):
+                checker.check(dkim, "platforms.email.dkim", key, str, required=True)
+        for entry in checker.check(email, "platforms.email", "recipients", list, []):
+            if not isinstance(entry, str):
+                checker.problems.append(f"platforms.email.recipients entries must be strings, got {entry!r}")
+                break
+
+        facebook = checker.section(raw, "platforms.facebook")
+        self.facebook = FacebookSettings(
+            checker.check(facebook, "platforms.facebook", "enabled", bool, False),
+            checker.check(facebook, "platforms.facebook", "cycle_timeout_seconds", float, 300.0, minimum=1),
+            None,
+            tuple(str(group_id) for group_id in checker.check(facebook, "platforms.facebook", "group_ids", list, [])),
+            checker.check(facebook, "platforms.facebook", "access_token", str, ""),
+        )
+        checker.check(facebook, "platforms.facebook", "batch_size", int, 50, minimum=1, maximum=50)
+
+        community = checker.section(raw, "platforms.community_sites")
+        self.community_sites = PlatformSettings(
+            checker.check(community, "platforms.community_sites", "enabled", bool, False),
+            checker.check(community, "platforms.community_sites", "cycle_timeout_seconds", float, 300.0, minimum=1),
+            None,
+        )
+        checker.check(community, "platforms.community_sites", "timeout_seconds", float, 10.0, minimum=0.1)
+        checker.check(community, "platforms.community_sites", "total_timeout_seconds", float, 30.0, minimum=0.1)
+        for site in checker.check(community, "platforms.community_sites", "urls", list, []):
+            url = site.get('url') if isinstance(site, dict) else site
+            if not isinstance(url, str) or not url.startswith(("http://", "https://")):
+                checker.problems.append(f"platforms.community_sites.urls entry {site!r} is not an http(s) URL")
+
+        schedule = checker.section(raw, "posting_schedule")
+        self.frequency_hours = checker.check(schedule, "posting_schedule", "frequency_hours", float, 24.0, minimum=0)
+        checker.check(schedule, "posting_schedule", "max_posts_per_day", int, 3, minimum=1)
+        checker.check(schedule, "posting_schedule", "retry_minutes", float, 15.0, minimum=1)
+        try:
+            # Time ranges, timezones and quiet hours are checked by building the real scheduler
+            WindowScheduler.from_config(raw)
+        except (ValueError, TypeError) as e:
+            checker.problems.append(f"posting_schedule: {e}")
+
+        limits = checker.section(raw, "compliance.rate_limits")
+        for key in ("global_per_minute", "per_domain_per_minute"):
+            checker.check(limits, "compliance.rate_limits", key, float, minimum=0.001)
+
+        metrics = checker.section(raw, "metrics")
+        self.metrics_port = checker.check(metrics, "metrics", "port", int, 0, minimum=0, maximum=65535)
+        self.metrics_textfile = checker.check(metrics, "metrics", "textfile", str, "")
+
+        log_settings = checker.section(raw, "logging")
+        mode = checker.check(log_settings, "logging", "mode", str, "async")
+        if mode not in ("async", "sync"):
+            checker.problems.append(f"logging.mode must be async or sync, got {mode!r}")
+        self.reload_check_seconds = checker.check(raw, "", "reload_check_seconds", float, 30.0, minimum=1)
+
+        if checker.problems:
+            raise ConfigError(checker.problems)
+
+        self.raw = raw
+        self.stamp = stamp
+        self.email.raw = email
+        self.facebook.raw = facebook
+        self.community_sites.raw = community
+
+    def section(self, name: str) -> dict:
+        """Top-level section as loaded, empty when absent"""
+        return self.raw.get(name) or {}
+
+
+def file_stamp(path: str) -> Tuple[int, int]:
+    """Modification time and size; either changing means the file was rewritten"""
+    stat = os.stat(path)
+    return stat.st_mtime_ns, stat.st_size
+
+
+def load_config_file(path: str) -> BotConfig:
+    """Read and validate a config file"""
+    stamp = file_stamp(path)
+    try:
+        with open(path, 'r') as f:
+            raw = json.load(f)
+    except ValueError as e:
+        raise ConfigError([f"{path} is not valid JSON: {e}"])
+    if not isinstance(raw, dict):
+        raise ConfigError([f"{path} must contain a JSON object"])
+    return BotConfig(raw, stamp)
+
+
+class ConfigWatcher:
+    """Holds the current config and swaps in a new one when the file changes
+
+    ``check`` costs one ``stat`` when nothing changed. A file that fails to
+    parse or validate (for example one caught half-written) is logged and
+    ignored until it changes again, and the last good config stays current.
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        self.logger = logging.getLogger(__name__)
+        self.current = load_config_file(path)
+        self._rejected: Optional[Tuple[int, int]] = None
+
+    def check(self) -> bool:
+        """Reload if the file changed; True when a new config was swapped in"""
+        try:
+            stamp = file_stamp(self.path)
+        except OSError as e:
+            self.logger.error(f"Cannot stat {self.path}, keeping the current configuration: {e}")
+            return False
+        if stamp == self.current.stamp or stamp == self._rejected:
+            return False
+
+        try:
+            config = load_config_file(self.path)
+        except (ConfigError, OSError) as e:
+            self._rejected = stamp
+            self.logger.error(f"Keeping the current configuration: {e}")
+            return False
+
+        self.current = config
+        self._rejected = None
+        return True
+
+
+def changed_sections(old: BotConfig, new: BotConfig) -> Dict[str, bool]:
+    """Which top-level sections and platforms differ between two snapshots"""
+    names = set(old.raw) | set(new.raw)
+    changes = {name: old.raw.get(name) != new.raw.get(name) for name in names}
+    old_platforms, new_platforms = old.section('platforms'), new.section('platforms')
+    for name in set(old_platforms) | set(new_platforms):
+        changes[f"platforms.{name}"] = old_platforms.get(name) != new_platforms.get(name)
+    return changes
@@ -0,0 +1,259 @@
+"""
+Campaign outbox for Senior Advertising Bot
+Durable record of every campaign message's state so an interrupted campaign
+can resume where it stopped instead of double-sending or skipping people
+"""
+
+import hashlib
+import logging
+import sqlite3
+import threading
+import time
+from typing import Dict, Iterator, List, Optional, Tuple
+
+from email_delivery import DeliveryResult
+
+QUEUED = "queued"
+SENT = "sent"
+FAILED = "failed"
+DEFERRED = "deferred"
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS campaigns (
+    id TEXT PRIMARY KEY,
+    subject TEXT,
+    position INTEGER NOT NULL DEFAULT 0,
+    started_at TEXT NOT NULL DEFAULT CURRENT_TIMESTAMP,
+    completed_at TEXT
+);
+CREATE TABLE IF NOT EXISTS outbox (
+    campaign_id TEXT NOT NULL,
+    seq INTEGER NOT NULL,
+    recipient TEXT NOT NULL,
+    email TEXT,
+    state TEXT NOT NULL,
+    attempts INTEGER NOT NULL DEFAULT 0,
+    error TEXT,
+    updated_at REAL,
+    PRIMARY KEY (campaign_id, seq)
+) WITHOUT ROWID;
+CREATE INDEX IF NOT EXISTS outbox_state ON outbox(campaign_id, state);
+CREATE TABLE IF NOT EXISTS variants (
+    campaign_id TEXT NOT NULL,
+    variant TEXT NOT NULL,
+    body TEXT NOT NULL,
+    PRIMARY KEY (campaign_id, variant)
+) WITHOUT ROWID;
+"""
+
+
+def campaign_key(subject: str, message: str) -> str:
+    """Stable campaign id for a subject and message, so reruns find their outbox"""
+    return hashlib.sha256(f"{subject}\0{message}".encode("utf-8")).hexdigest()[:16]
+
+
+class CampaignOutbox:
+    """Write-behind outbox: state changes are buffered and committed in batches
+
+    ``position`` counts how many entries of the recipient stream have been
+    durably queued, so a restarted campaign skips straight past them and
+    only re-sends rows still queued or deferred. A crash can repeat at most
+    the results from the last uncommitted batch.
+
+    A batch that cannot be committed (a lock held past ``busy_timeout``
+    seconds, a full disk) stays buffered for the next attempt and is kept
+    in ``error``; the campaign then stops queueing recipients, since it
+    could no longer resume without sending some of them twice.
+    """
+
+    def __init__(self, path: str, campaign_id: str, subject: str = "",
+                 commit_every: int = 500, commit_interval: float = 1.0, busy_timeout: float = 30.0):
+        self.path = path
+        self.campaign_id = campaign_id
+        self.commit_every = max(1, commit_every)
+        self.commit_interval = commit_interval
+        self.logger = logging.getLogger(__name__)
+        self.commits = 0
+        self.commit_seconds = 0.0
+        self.error: Optional[sqlite3.Error] = None
+
+        # The recipient parser's address index shares this file, so wait out its writes
+        self.conn = sqlite3.connect(path, timeout=busy_timeout, check_same_thread=False)
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.execute("PRAGMA synchronous=NORMAL")
+        self.conn.executescript(SCHEMA)
+        columns = {row[1] for row in self.conn.execute("PRAGMA table_info(outbox)")}
+        if "variant" not in columns:
+            # Outboxes created before message variants were recorded
+            self.conn.execute("ALTER TABLE outbox ADD COLUMN variant TEXT")
+        with self.conn:
+            self.conn.execute(
+                "INSERT OR IGNORE INTO campaigns (id, subject) VALUES (?, ?)", (campaign_id, subject)
+            )
+        self.position, completed_at = self.conn.execute(
+            "SELECT position, completed_at FROM campaigns WHERE id = ?", (campaign_id,)
+        ).fetchone()
+        self.completed = completed_at is not None
+
+        self._lock = threading.Lock()
+        # Held while a batch is written; commits happen in the order batches were taken
+        self._write_lock = threading.Lock()
+        self._queued: List[Tuple[str, int, str, str, float]] = []
+        self._results: List[Tuple[str, Optional[str], Optional[str], Optional[str], float, str, int]] = []
+        self._next_position = self.position
+        self._last_commit = time.monotonic()
+
+    def pending(self) -> Iterator[Tuple[int, str]]:
+        """(seq, recipient) rows queued or deferred by an earlier run"""
+        cursor = self.conn.execute(
+            "SELECT seq, recipient FROM outbox WHERE campaign_id = ? AND state IN (?, ?) ORDER BY seq",
+            (self.campaign_id, QUEUED, DEFERRED)
+        )
+        return iter(cursor.fetchall())
+
+    def counts(self) -> dict:
+        """Number of messages in each state"""
+        rows = self.conn.execute(
+            "SELECT state, COUNT(*) FROM outbox WHERE campaign_id = ? GROUP BY state", (self.campaign_id,)
+        )
+        return dict(rows.fetchall())
+
+    def record_variants(self, variants: Dict[str, str]):
+        """Store the text of each message variant (id -> body) used by this campaign"""
+        with self.conn:
+            self.conn.executemany(
+                "INSERT OR IGNORE INTO variants (campaign_id, variant, body) VALUES (?, ?, ?)",
+                [(self.campaign_id, variant, body) for variant, body in variants.items()]
+            )
+
+    def variant_counts(self) -> Dict[str, int]:
+        """Messages sent per variant"""
+        rows = self.conn.execute(
+            "SELECT variant, COUNT(*) FROM outbox WHERE campaign_id = ? AND state = ? AND variant IS NOT NULL "
+            "GROUP BY variant", (self.campaign_id, SENT)
+        )
+        return dict(rows.fetchall())
+
+    def enqueue(self, seq: int, recipient: str):
+        """Record that the entry at ``seq`` of the recipient stream was handed to a worker"""
+        with self._lock:
+            self._queued.append((self.campaign_id, seq, recipient, QUEUED, time.time()))
+            self._next_position = max(self._next_position, seq + 1)
+            due = self._due()
+        if due:
+            self._try_flush(block=False)
+
+    def record(self, seq: int, result: DeliveryResult):
+        """Record a delivery outcome; transient failures stay deferred for the next run"""
+        if result.success:
+            state = SENT
+        elif result.transient:
+            state = DEFERRED
+        else:
+            state = FAILED
+        with self._lock:
+            self._results.append((state, result.email, result.error, result.variant, time.time(), self.campaign_id, seq))
+            due = self._due()
+        if due:
+            self._try_flush(block=False)
+
+    def _due(self) -> bool:
+        return (len(self._queued) + len(self._results) >= self.commit_every
+                or time.monotonic() - self._last_commit >= self.commit_interval)
+
+    def _try_flush(self, block: bool = True) -> bool:
+        """Commit the buffered batch, keeping it and noting the error if that fails
+
+        The batch is taken out of the buffers before it is written, so other
+        threads keep recording while it commits. Without ``block`` a thread
+        that finds a commit under way leaves its rows to the next one.
+        """
+        if not self._write_lock.acquire(blocking=block):
+            return True
+        try:
+            with self._lock:
+                queued, results, position = self._queued, self._results, self._next_position
+                self._queued, self._results = [], []
+                # Also paces retries after a failure to once per commit interval
+                self._last_commit = time.monotonic()
+            try:
+                self._write(queued, results, position)
+            except sqlite3.Error as e:
+                with self._lock:
+                    self._queued[:0] = queued
+                    self._results[:0] = results
+                if self.error is None:
+                    self.logger.error(f"Cannot checkpoint campaign {self.campaign_id}: {e}")
+                self.error = e
+                return False
+            return True
+        finally:
+            self._write_lock.release()
+
+    def _write(self, queued: list, results: list, position: int):
+        started = time.perf_counter()
+        finished = []
+        if queued and results:
+            # Most results land in the same batch as their queued row: insert
+            # those rows in their final state instead of inserting then updating
+            rows = {row[1]: row for row in queued}
+            updates = []
+            for result in results:
+                state, email, error, variant, updated_at, campaign_id, seq = result
+                row = rows.pop(seq, None)
+                if row is None:
+                    updates.append(result)
+                else:
+                    finished.append((campaign_id, seq, row[2], email, state, error, variant, updated_at))
+            queued, results = list(rows.values()), updates
+        with self.conn:
+            if queued:
+                self.conn.executemany(
+                    "INSERT OR IGNORE INTO outbox (campaign_id, seq, recipient, state, updated_at) "
+                    "VALUES (?, ?, ?, ?, ?)", queued
+                )
+            if finished:
+                self.conn.executemany(
+                    "INSERT INTO outbox (campaign_id, seq, recipient, email, state, error, variant, updated_at, "
+                    "attempts) VALUES (?, ?, ?, ?, ?, ?, ?, ?, 1) "
+                    "ON CONFLICT (campaign_id, seq) DO UPDATE SET state = excluded.state, email = excluded.email, "
+                    "error = excluded.error, variant = excluded.variant, updated_at = excluded.updated_at, "
+                    "attempts = attempts + 1", finished
+                )
+            if results:
+                self.conn.executemany(
+                    "UPDATE outbox SET state = ?, email = ?, error = ?, variant = ?, updated_at = ?, "
+                    "attempts = attempts + 1 "
+                    "WHERE campaign_id = ? AND seq = ?", results
+                )
+            if position != self.position:
+                self.conn.execute(
+                    "UPDATE campaigns SET position = ? WHERE id = ?", (position, self.campaign_id)
+                )
+        self.position = position
+        self.commits += 1
+        self.commit_seconds += time.perf_counter() - started
+
+    def flush(self) -> bool:
+        """Commit everything buffered so far; False if it could not be written"""
+        return self._try_flush()
+
+    def complete(self):
+        """Flush and mark the recipient stream as fully processed"""
+        if not self._try_flush():
+            return
+        with self._write_lock:
+            try:
+                with self.conn:
+                    self.conn.execute(
+                        "UPDATE campaigns SET completed_at = CURRENT_TIMESTAMP WHERE id = ?", (self.campaign_id,)
+                    )
+            except sqlite3.Error as e:
+                self.error = e
+                self.logger.error(f"Cannot mark campaign {self.campaign_id} complete: {e}")
+                return
+        self.completed = True
+
+    def close(self):
+        self.flush()
+        self.conn.close()
@@ -0,0 +1,313 @@
+"""
+Sharded campaigns for Senior Advertising Bot
+Splits one email campaign across worker processes by a stable hash of each
+address, so rendering, TLS and SMTP work are not confined to one core
+"""
+
+import copy
+import logging
+import multiprocessing
+import queue
+import threading
+import time
+import zlib
+from dataclasses import dataclass, field
+from typing import Callable, Dict, Iterable, List, Optional, Tuple, Union
+
+from async_logging import configure_worker_logging, forward_logs
+from email_delivery import DeliveryResult, DeliverySummary
+from message_variants import VariantSet
+from metrics import (MESSAGES, RENDER_SECONDS, RETRIES, SEND_SECONDS, SERIALIZE_SECONDS, SIGN_SECONDS,
+                     SMTP_CONNECT_SECONDS, SMTP_CONNECTIONS, SMTP_LOGIN_SECONDS)
+from recipient_parser import Recipient
+from recipient_store import split_recipient
+
+# Recipients per hand-off to a worker and results per hand-back; both
+# amortize the pickling and pipe round trip over many messages
+CHUNK_SIZE = 500
+RESULT_BATCH = 500
+# Chunks buffered per worker before the reader waits for it
+QUEUE_CHUNKS = 4
+
+# Metrics live per process; workers report these back to be merged into the parent's
+SHARD_METRICS = (RENDER_SECONDS, SERIALIZE_SECONDS, SIGN_SECONDS, SMTP_CONNECT_SECONDS, SMTP_LOGIN_SECONDS,
+                 SMTP_CONNECTIONS, SEND_SECONDS, MESSAGES, RETRIES)
+
+
+def shard_for(recipient: Union[str, Recipient], shards: int) -> int:
+    """Shard of a recipient entry; depends only on the address, so reruns agree"""
+    address = recipient.address if isinstance(recipient, Recipient) else split_recipient(recipient)[1].lower()
+    return zlib.crc32(address.encode("utf-8")) % shards
+
+
+def shard_config(config: dict, shards: int) -> dict:
+    """Config for one worker: no further sharding, and rate limits split evenly
+
+    Addresses of every domain are spread over all shards, so each worker
+    gets 1/shards of the global and per-domain limits and together they
+    stay inside the configured ones.
+    """
+    config = copy.deepcopy(config)
+    email_config = config['platforms']['email']
+    email_config['shards'] = 1
+    # The parent already parsed, deduplicated and reported on the list
+    email_config['dedupe_recipients'] = False
+    email_config['rejected_report'] = None
+    limits = config.setdefault('compliance', {}).setdefault('rate_limits', {})
+    limits['global_per_minute'] = limits.get('global_per_minute', 600) / shards
+    limits['per_domain_per_minute'] = limits.get('per_domain_per_minute', 120) / shards
+    limits['domains'] = {domain: per_minute / shards for domain, per_minute in limits.get('domains', {}).items()}
+    return config
+
+
+def merge_rate_stats(shard_stats: List[dict]) -> Optional[dict]:
+    """Combine the rate scheduler stats of every shard into one report"""
+    if not shard_stats:
+        return None
+    sent = sum(stats["sent"] for stats in shard_stats)
+    domains: Dict[str, dict] = {}
+    for stats in shard_stats:
+        for domain, entry in stats["domains"].items():
+            merged = domains.setdefault(domain, {"queued": 0, "sent": 0, "avg_wait_seconds": 0.0, "max_wait_seconds": 0.0})
+            total = merged["avg_wait_seconds"] * merged["sent"] + entry["avg_wait_seconds"] * entry["sent"]
+            merged["queued"] += entry["queued"]
+            merged["sent"] += entry["sent"]
+            merged["avg_wait_seconds"] = round(total / merged["sent"], 3) if merged["sent"] else 0.0
+            merged["max_wait_seconds"] = max(merged["max_wait_seconds"], entry["max_wait_seconds"])
+    wait_total = sum(stats["avg_wait_seconds"] * stats["sent"] for stats in shard_stats)
+    return {
+        "queue_depth": sum(stats["queue_depth"] for stats in shard_stats),
+        "max_queue_depth": max(stats["max_queue_depth"] for stats in shard_stats),
+        "sent": sent,
+        # Shards throttle in parallel, so the longest one is the time lost
+        "throttled_seconds": max(stats["throttled_seconds"] for stats in shard_stats),
+        "avg_wait_seconds": round(wait_total / sent, 3) if sent else 0.0,
+        "max_wait_seconds": max(stats["max_wait_seconds"] for stats in shard_stats),
+        "domains": domains,
+    }
+
+
+def _run_shard(config: dict, shard: int, subject: str, message: Union[str, VariantSet], campaign_id: Optional[str],
+               chunks, results, log_queue, cancel, report: bool):
+    """Worker process: send one shard's recipients as an ordinary campaign"""
+    # Imported here because email_campaign imports this module
+    from email_campaign import SeniorEmailCampaign
+
+    configure_worker_logging(log_queue, config.get('logging'), f"[shard {shard}] ")
+    # A forked worker starts with the parent's values; only report what this shard adds
+    baseline = {metric.name: metric.snapshot() for metric in SHARD_METRICS}
+    # Shard-local stream position -> position in the full recipient stream
+    positions: Dict[int, int] = {}
+    pending: List[Tuple[int, DeliveryResult]] = []
+    lock = threading.Lock()
+
+    def stream() -> Iterable[str]:
+        local = 0
+        while True:
+            chunk = chunks.get()
+            if chunk is None:
+                return
+            for index, recipient in chunk:
+                if report:
+                    positions[local] = index
+                local += 1
+                yield recipient
+
+    def on_result(local: int, result: DeliveryResult):
+        batch = None
+        with lock:
+            # -1 for leftovers retried from an earlier run's outbox
+            pending.append((positions.pop(local, -1), result))
+            if len(pending) >= RESULT_BATCH:
+                batch = pending[:]
+                pending.clear()
+        if batch:
+            results.put(("results", shard, batch))
+
+    campaign = SeniorEmailCampaign(config)
+    recipients = stream()
+    ok = False
+    error = None
+    try:
+        ok = campaign.send_email_campaign(recipients, subject, message, on_result if report else None,
+                                          campaign_id, cancel)
+    except Exception as e:
+        logging.getLogger(__name__).exception(f"Campaign shard {shard} failed")
+        error = f"{type(e).__name__}: {e}"
+    finally:
+        # Take whatever the campaign left unread so the parent never blocks feeding us
+        unread = sum(1 for _ in recipients)
+        if pending:
+            results.put(("results", shard, pending[:]))
+        summary = campaign.last_summary or DeliverySummary()
+        results.put(("error" if error else "done", shard, {
+            "ok": ok,
+            "error": error,
+            "complete": error is None and campaign.last_complete,
+            "unread": unread,
+            "attempted": summary.attempted,
+            "sent": summary.sent,
+            "failed": summary.failed,
+            "retried": summary.retried,
+            "suppressed": campaign.last_suppressed,
+            "rate_stats": campaign.last_rate_stats,
+            "variants": campaign.last_variant_counts,
+            "metrics": {metric.name: metric.snapshot(baseline[metric.name]) for metric in SHARD_METRICS},
+        }))
+
+
+@dataclass
+class ShardedOutcome:
+    """Aggregated result of a sharded campaign"""
+    summary: DeliverySummary
+    ok: bool
+    suppressed: int = 0
+    rate_stats: Optional[dict] = None
+    variant_counts: Dict[str, int] = field(default_factory=dict)
+    shard_summaries: Dict[int, DeliverySummary] = field(default_factory=dict)
+    crashed: List[int] = field(default_factory=list)
+    # Shards that reported back without getting through their whole stream
+    unfinished: List[int] = field(default_factory=list)
+    seconds: float = 0.0
+
+
+class ShardedCampaign:
+    """Runs a campaign in ``shards`` worker processes, each with its own SMTP pool
+
+    This process reads the recipient stream, hashes each address to a shard
+    and hands recipients over in chunks; results come back in batches and
+    are passed to ``on_result`` here, on one reader thread.
+    """
+
+    def __init__(self, config: dict, shards: int, start_method: str = "spawn"):
+        self.config = config
+        self.shards = max(1, shards)
+        self.context = multiprocessing.get_context(start_method)
+        self.logger = logging.getLogger(__name__)
+
+    def run(
+        self,
+        recipients: Iterable[Tuple[int, Recipient]],
+        subject: str,
+        message: Union[str, VariantSet],
+        on_result: Optional[Callable[[int, DeliveryResult], None]] = None,
+        campaign_id: Optional[str] = None,
+        cancel: Optional[threading.Event] = None,
+    ) -> ShardedOutcome:
+        """Send ``(index, recipient)`` pairs and wait for every shard
+
+        With ``campaign_id`` each shard keeps its own outbox under
+        "<campaign_id>.<shard>of<shards>"; since shards depend only on the
+        address, a rerun with the same shard count resumes every shard.
+        """
+        started = time.perf_counter()
+        config = shard_config(self.config, self.shards)
+        results = self.context.Queue()
+        log_queue = self.context.Queue()
+        stop = self.context.Event()
+        chunk_queues = [self.context.Queue(maxsize=QUEUE_CHUNKS) for _ in range(self.shards)]
+        workers = []
+        for shard, chunks in enumerate(chunk_queues):
+            shard_id = f"{campaign_id}.{shard}of{self.shards}" if campaign_id else None
+            workers.append(self.context.Process(
+                target=_run_shard,
+                args=(config, shard, subject, message, shard_id, chunks, results, log_queue, stop, on_result is not None),
+                name=f"campaign-shard-{shard}",
+                daemon=True,
+            ))
+
+        log_listener = forward_logs(log_queue)
+        for worker in workers:
+            worker.start()
+
+        outcome = ShardedOutcome(DeliverySummary(), ok=False)
+        reports: Dict[int, dict] = {}
+        reader = threading.Thread(
+            target=self._read_results, args=(results, workers, reports, on_result, outcome), daemon=True
+        )
+        reader.start()
+        try:
+            self._feed(recipients, chunk_queues, workers, cancel, stop)
+        finally:
+            for shard, chunks in enumerate(chunk_queues):
+                self._put(chunks, None, workers[shard])
+            reader.join()
+            for worker in workers:
+                worker.join()
+            log_listener.stop()
+
+        for shard in sorted(reports):
+            report = reports[shard]
+            summary = DeliverySummary(report["attempted"], report["sent"], report["failed"], report["retried"])
+            outcome.shard_summaries[shard] = summary
+            outcome.summary.attempted += summary.attempted
+            outcome.summary.sent += summary.sent
+            outcome.summary.failed += summary.failed
+            outcome.summary.retried += summary.retried
+            outcome.suppressed += report["suppressed"]
+            for variant, count in report["variants"].items():
+                outcome.variant_counts[variant] = outcome.variant_counts.get(variant, 0) + count
+            for metric in SHARD_METRICS:
+                metric.merge(report["metrics"].get(metric.name, {}))
+        outcome.rate_stats = merge_rate_stats([report["rate_stats"] for report in reports.values() if report["rate_stats"]])
+        outcome.unfinished = sorted(shard for shard, report in reports.items() if not report["complete"])
+        if outcome.crashed or outcome.unfinished:
+            outcome.ok = False
+        elif outcome.summary.attempted:
+            outcome.ok = outcome.summary.sent > 0
+        else:
+            # Nothing left to send: fine only if every shard says so
+            outcome.ok = len(reports) == self.shards and all(report["ok"] for report in reports.values())
+        outcome.seconds = time.perf_counter() - started
+        return outcome
+
+    def _put(self, chunks, item, worker) -> bool:
+        """Hand a chunk to a worker, giving up if the worker has died"""
+        while True:
+            try:
+                chunks.put(item, timeout=1)
+                return True
+            except queue.Full:
+                if not worker.is_alive():
+                    return False
+
+    def _feed(self, recipients: Iterable[Tuple[int, Recipient]], chunk_queues, workers, cancel: Optional[threading.Event], stop):
+        buffers: List[List[Tuple[int, Recipient]]] = [[] for _ in range(self.shards)]
+        dead = set()
+        for index, recipient in recipients:
+            if cancel is not None and cancel.is_set():
+                self.logger.warning("Sharded campaign cancelled, no further recipients will be queued")
+                stop.set()
+                return
+            shard = shard_for(recipient, self.shards)
+            buffer = buffers[shard]
+            buffer.append((index, recipient))
+            if len(buffer) >= CHUNK_SIZE:
+                buffers[shard] = []
+                if shard not in dead and not self._put(chunk_queues[shard], buffer, workers[shard]):
+                    dead.add(shard)
+                    self.logger.error(f"Campaign shard {shard} exited early; its remaining recipients are not sent")
+        for shard, buffer in enumerate(buffers):
+            if buffer and shard not in dead:
+                self._put(chunk_queues[shard], buffer, workers[shard])
+
+    def _read_results(self, results, workers, reports: Dict[int, dict],
+                      on_result: Optional[Callable[[int, DeliveryResult], None]], outcome: ShardedOutcome):
+        while len(reports) + len(outcome.crashed) < self.shards:
+            try:
+                kind, shard, payload = results.get(timeout=1)
+            except queue.Empty:
+                for shard, worker in enumerate(workers):
+                    if shard not in reports and shard not in outcome.crashed and worker.exitcode not in (None, 0):
+                        outcome.crashed.append(shard)
+                        self.logger.error(f"Campaign shard {shard} crashed with exit code {worker.exitcode}")
+                continue
+            if kind in ("done", "error"):
+                reports[shard] = payload
+                if kind == "error":
+                    self.logger.error(f"Campaign shard {shard} failed: {payload['error']}")
+                elif not payload["complete"]:
+                    self.logger.error(f"Campaign shard {shard} stopped with {payload['unread']} recipients unread")
+            elif on_result:
+                for index, result in payload:
+                    on_result(index, result)
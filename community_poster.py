@@ -0,0 +1,366 @@
+"""
+Community site poster for Senior Advertising Bot
+Posts to every configured community site at once, with a keep-alive pool,
+timeouts and circuit breaker per host so a dead or slow forum is skipped quickly
+"""
+
+import logging
+import socket
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, wait
+from dataclasses import dataclass
+from typing import Callable, Dict, List, Optional, Union
+from urllib.parse import urlsplit
+
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.connection import HTTPConnection, HTTPSConnection
+from urllib3.connectionpool import HTTPConnectionPool, HTTPSConnectionPool
+from urllib3.exceptions import HTTPError
+
+from metrics import COMMUNITY_BREAKER_CHANGES, COMMUNITY_POSTS, COMMUNITY_SECONDS
+
+CLOSED = "closed"
+OPEN = "open"
+HALF_OPEN = "half_open"
+
+# Response bytes read between deadline checks
+READ_CHUNK = 8192
+
+# Time a post past its deadline gets to unwind before it is reported as overrunning
+OVERRUN_GRACE = 0.25
+
+# Deadline of the post running on each worker thread, seen by its connection
+_current = threading.local()
+
+
+class TotalTimeout(requests.Timeout):
+    """The whole request took longer than its total time limit"""
+
+
+class _Deadline:
+    """Total time limit of one post
+
+    Reads are given socket timeouts no longer than the time left, and once
+    the limit passes the socket of the request in flight is shut down, which
+    ends a read blocked on it even while a server drips its headers.
+    """
+
+    def __init__(self, seconds: float):
+        self.expires = time.monotonic() + seconds
+        self.expired = False
+        self.connection: Optional[HTTPConnection] = None
+        self._lock = threading.Lock()
+        self._timer = threading.Timer(seconds, self._expire)
+        self._timer.daemon = True
+        self._timer.start()
+
+    def remaining(self) -> float:
+        return self.expires - time.monotonic()
+
+    def watch(self, connection: HTTPConnection):
+        with self._lock:
+            self.connection = connection
+            expired = self.expired
+        if expired:
+            self._shutdown(connection)
+
+    def cancel(self):
+        """Stop watching, before the connection goes back to the pool"""
+        self._timer.cancel()
+        with self._lock:
+            self.connection = None
+
+    def _expire(self):
+        with self._lock:
+            self.expired = True
+            connection = self.connection
+        if connection is not None:
+            self._shutdown(connection)
+
+    @staticmethod
+    def _shutdown(connection: HTTPConnection):
+        sock = connection.sock
+        if sock is not None:
+            try:
+                sock.shutdown(socket.SHUT_RDWR)
+            except OSError:
+                pass
+
+
+class _WatchedMixin:
+    """Connection that registers with the deadline of the post using it"""
+
+    def request(self, *args, **kwargs):
+        deadline = getattr(_current, "deadline", None)
+        if deadline is not None:
+            deadline.watch(self)
+        super().request(*args, **kwargs)
+
+    def getresponse(self):
+        deadline = getattr(_current, "deadline", None)
+        if deadline is not None and self.timeout is not None:
+            self.timeout = max(0.001, min(self.timeout, deadline.remaining()))
+        return super().getresponse()
+
+
+class _WatchedConnection(_WatchedMixin, HTTPConnection):
+    pass
+
+
+class _WatchedHTTPSConnection(_WatchedMixin, HTTPSConnection):
+    pass
+
+
+class _WatchedPool(HTTPConnectionPool):
+    ConnectionCls = _WatchedConnection
+
+
+class _WatchedHTTPSPool(HTTPSConnectionPool):
+    ConnectionCls = _WatchedHTTPSConnection
+
+
+class _DeadlineAdapter(HTTPAdapter):
+    def init_poolmanager(self, *args, **kwargs):
+        super().init_poolmanager(*args, **kwargs)
+        self.poolmanager.pool_classes_by_scheme = {"http": _WatchedPool, "https": _WatchedHTTPSPool}
+
+
+class CircuitBreaker:
+    """Opens after ``failure_threshold`` consecutive failures and lets one
+    trial request through once ``reset_timeout`` seconds have passed"""
+
+    def __init__(self, failure_threshold: int = 3, reset_timeout: float = 300.0,
+                 clock: Callable[[], float] = time.monotonic,
+                 on_change: Optional[Callable[[str], None]] = None):
+        self.failure_threshold = max(1, failure_threshold)
+        self.reset_timeout = reset_timeout
+        self.clock = clock
+        self.on_change = on_change
+        self.state = CLOSED
+        self.failures = 0
+        self.opened_at = 0.0
+        self._lock = threading.Lock()
+
+    def _changed(self, before: str):
+        if self.on_change is not None and self.state != before:
+            self.on_change(self.state)
+
+    def allow(self) -> bool:
+        with self._lock:
+            before = self.state
+            if before == OPEN and self.clock() - self.opened_at >= self.reset_timeout:
+                self.state = HALF_OPEN
+                allowed = True
+            else:
+                allowed = before == CLOSED
+        self._changed(before)
+        return allowed
+
+    def record_success(self):
+        with self._lock:
+            before = self.state
+            self.state = CLOSED
+            self.failures = 0
+        self._changed(before)
+
+    def record_failure(self):
+        with self._lock:
+            before = self.state
+            self.failures += 1
+            if self.state == HALF_OPEN or self.failures >= self.failure_threshold:
+                self.state = OPEN
+                self.opened_at = self.clock()
+        self._changed(before)
+
+
+@dataclass
+class SitePostResult:
+    """Outcome of posting to one community site"""
+    url: str
+    host: str
+    success: bool
+    status_code: Optional[int] = None
+    elapsed: float = 0.0
+    error: Optional[str] = None
+    skipped: bool = False
+
+
+class _Host:
+    def __init__(self, name: str, breaker: CircuitBreaker, pool_size: int):
+        self.breaker = breaker
+        self.latency = COMMUNITY_SECONDS.labels(name)
+        self.session = requests.Session()
+        adapter = _DeadlineAdapter(pool_connections=1, pool_maxsize=pool_size)
+        self.session.mount("https://", adapter)
+        self.session.mount("http://", adapter)
+
+
+class CommunitySitePoster:
+    """Keeps per-host sessions and breakers across cycles
+
+    ``timeout_seconds`` bounds each connect and each read from the socket,
+    and ``total_timeout_seconds`` the whole request, so a server that drips
+    its response a byte at a time cannot hold a cycle or a worker thread.
+    Latency per host, outcomes and breaker changes go to the shared metrics
+    registry, once per post.
+    """
+
+    def __init__(
+        self,
+        sites: List[Union[str, dict]],
+        max_workers: int = 8,
+        timeout_seconds: float = 10.0,
+        total_timeout_seconds: float = 30.0,
+        failure_threshold: int = 3,
+        reset_timeout: float = 300.0,
+        message_field: str = "message",
+        clock: Callable[[], float] = time.monotonic,
+    ):
+        self.sites = [site if isinstance(site, dict) else {"url": site} for site in sites]
+        self.max_workers = max(1, max_workers)
+        self.timeout_seconds = timeout_seconds
+        self.total_timeout_seconds = total_timeout_seconds
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.message_field = message_field
+        self.clock = clock
+        self.logger = logging.getLogger(__name__)
+        self._hosts: Dict[str, _Host] = {}
+        self._lock = threading.Lock()
+
+    @classmethod
+    def from_config(cls, community_config: dict, **kwargs) -> "CommunitySitePoster":
+        return cls(
+            community_config.get('urls', []),
+            max_workers=community_config.get('max_workers', 8),
+            timeout_seconds=community_config.get('timeout_seconds', 10),
+            total_timeout_seconds=community_config.get('total_timeout_seconds', 30),
+            failure_threshold=community_config.get('failure_threshold', 3),
+            reset_timeout=community_config.get('reset_timeout_seconds', 300),
+            message_field=community_config.get('message_field', 'message'),
+            **kwargs
+        )
+
+    def host(self, name: str) -> _Host:
+        with self._lock:
+            host = self._hosts.get(name)
+            if host is None:
+                breaker = CircuitBreaker(self.failure_threshold, self.reset_timeout, self.clock,
+                                         lambda state: self._breaker_changed(name, state))
+                host = self._hosts[name] = _Host(name, breaker, self.max_workers)
+            return host
+
+    def breaker_states(self) -> Dict[str, str]:
+        with self._lock:
+            return {name: host.breaker.state for name, host in self._hosts.items()}
+
+    def _breaker_changed(self, name: str, state: str):
+        COMMUNITY_BREAKER_CHANGES.labels(name, state).inc()
+        if state == OPEN:
+            self.logger.warning(f"Circuit opened for {name}, skipping it for {self.reset_timeout}s")
+        elif state == CLOSED:
+            self.logger.info(f"Circuit closed for {name}")
+
+    def close(self):
+        for host in self._hosts.values():
+            host.session.close()
+
+    def post(self, message: str, cancel: Optional[threading.Event] = None) -> List[SitePostResult]:
+        """Post to every site concurrently; results come back in config order"""
+        if not self.sites:
+            return []
+        workers = min(self.max_workers, len(self.sites))
+        # Sites queue for a worker, so the last of them may start a few rounds in
+        rounds = -(-len(self.sites) // workers)
+        limit = rounds * max(self._total_timeout(site) for site in self.sites) + OVERRUN_GRACE
+        # Whichever of a post and its overrun report gets here first records the outcome
+        claims = [threading.Lock() for _ in self.sites]
+        executor = ThreadPoolExecutor(max_workers=workers)
+        futures = [executor.submit(self._post_one, site, message, cancel, claim)
+                   for site, claim in zip(self.sites, claims)]
+        done, _ = wait(futures, timeout=limit)
+        results = [
+            future.result() if future in done else self._overran(site, limit, claim)
+            for site, future, claim in zip(self.sites, futures, claims)
+        ]
+        # Requests end at their own deadlines, so this only waits out the stragglers
+        executor.shutdown(wait=True, cancel_futures=True)
+        return results
+
+    def _total_timeout(self, site: dict) -> float:
+        return site.get('total_timeout_seconds', self.total_timeout_seconds)
+
+    def _overran(self, site: dict, limit: float, claim: threading.Lock) -> SitePostResult:
+        url = site['url']
+        name = urlsplit(url).netloc.lower()
+        result = SitePostResult(url, name, False, elapsed=limit, error=f"no response within {limit:.0f}s")
+        return self._record(self.host(name), result, False, claim)
+
+    def _record(self, host: _Host, result: SitePostResult, healthy: Optional[bool],
+                claim: threading.Lock) -> SitePostResult:
+        """Count a post's outcome unless it was already counted as overrunning
+
+        ``healthy`` feeds the host's breaker; None means no request was made.
+        """
+        if not claim.acquire(blocking=False):
+            return result
+        if healthy is not None:
+            host.latency.observe(result.elapsed)
+            if healthy:
+                host.breaker.record_success()
+            else:
+                host.breaker.record_failure()
+        outcome = "skipped" if result.skipped else "posted" if result.success else "failed"
+        COMMUNITY_POSTS.labels(result.host, outcome).inc()
+        return result
+
+    def _post_one(self, site: dict, message: str, cancel: Optional[threading.Event],
+                  claim: threading.Lock) -> SitePostResult:
+        url = site['url']
+        name = urlsplit(url).netloc.lower()
+        host = self.host(name)
+
+        if cancel is not None and cancel.is_set():
+            return SitePostResult(url, name, False, error="cancelled", skipped=True)
+        if not host.breaker.allow():
+            return self._record(host, SitePostResult(url, name, False, error="circuit open", skipped=True),
+                                None, claim)
+
+        total = self._total_timeout(site)
+        timeout = min(site.get('timeout_seconds', self.timeout_seconds), total)
+        field = site.get('message_field', self.message_field)
+        started = time.perf_counter()
+        deadline = _current.deadline = _Deadline(total)
+        try:
+            response = host.session.post(url, data={field: message}, timeout=timeout, stream=True)
+            with response:
+                # Read the body ourselves so each read waits no longer than the time left
+                sock = deadline.connection.sock if deadline.connection is not None else None
+                while True:
+                    remaining = deadline.remaining()
+                    if remaining <= 0:
+                        raise TotalTimeout(f"{url} took longer than {total}s in total")
+                    if sock is not None:
+                        sock.settimeout(min(timeout, remaining))
+                    if not response.raw.read1(READ_CHUNK):
+                        break
+                deadline.cancel()
+                if deadline.expired:
+                    # The shut-down socket reads as the end of the body
+                    raise TotalTimeout(f"{url} took longer than {total}s in total")
+            elapsed = time.perf_counter() - started
+        except (requests.RequestException, HTTPError) as e:
+            elapsed = time.perf_counter() - started
+            error = f"{url} took longer than {total}s in total" if deadline.expired else str(e)
+            return self._record(host, SitePostResult(url, name, False, elapsed=elapsed, error=error), False, claim)
+        finally:
+            deadline.cancel()
+            _current.deadline = None
+
+        healthy = response.status_code < 500 and response.status_code != 429
+        if response.ok:
+            return self._record(host, SitePostResult(url, name, True, response.status_code, elapsed), healthy, claim)
+        result = SitePostResult(url, name, False, response.status_code, elapsed, f"HTTP {response.status_code}")
+        return self._record(host, result, healthy, claim)
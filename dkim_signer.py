@@ -0,0 +1,141 @@
+"""
+DKIM signing for Senior Advertising Bot
+Signs wire-ready message bytes (RFC 6376, relaxed/simple canonicalization)
+with an RSA or Ed25519 key, so the body hash of a template is computed once
+and each recipient only costs a header signature
+"""
+
+import base64
+import hashlib
+import re
+import time
+from typing import Dict, Iterable, List, Optional, Tuple
+
+from metrics import SIGN_SECONDS
+
+# Signed in this order when present; To is the only one that varies per recipient
+SIGNED_HEADERS = ("from", "to", "subject", "date", "message-id", "mime-version", "content-type")
+
+FOLDING = re.compile(rb"\r\n(?=[ \t])")
+WHITESPACE = re.compile(rb"[ \t]+")
+TRAILING_NEWLINES = re.compile(rb"(?:\r\n)+\Z")
+
+
+def canonical_header(line: bytes) -> bytes:
+    """Relaxed canonical form of one header field, without its final CRLF"""
+    name, _, value = line.partition(b":")
+    value = WHITESPACE.sub(b" ", FOLDING.sub(b"", value)).strip(b" \r\n")
+    return name.strip().lower() + b":" + value
+
+
+def split_headers(headers: bytes) -> List[bytes]:
+    """Header fields of a header block, each with its folded continuation lines"""
+    fields: List[bytes] = []
+    for line in headers.split(b"\r\n"):
+        if line[:1] in (b" ", b"\t") and fields:
+            fields[-1] += b"\r\n" + line
+        elif line:
+            fields.append(line)
+    return fields
+
+
+def canonical_body(body: bytes) -> bytes:
+    """Simple body canonicalization: exactly one CRLF after the last non-empty line"""
+    return TRAILING_NEWLINES.sub(b"", body) + b"\r\n"
+
+
+def split_message(message: bytes) -> Tuple[bytes, bytes]:
+    """Header block (with the CRLF ending its last field) and body of wire bytes"""
+    headers, separator, body = message.partition(b"\r\n\r\n")
+    if not separator:
+        return message, b""
+    return headers + b"\r\n", body
+
+
+def load_private_key(path: str):
+    """PEM private key for signing; RSA or Ed25519"""
+    try:
+        from cryptography.hazmat.primitives import serialization
+    except ImportError:
+        raise ImportError("DKIM signing requires cryptography (pip install cryptography)")
+    with open(path, "rb") as f:
+        return serialization.load_pem_private_key(f.read(), password=None)
+
+
+class DKIMSigner:
+    """Adds a DKIM-Signature header for ``domain`` and ``selector``
+
+    Callers that send many messages with the same body compute ``body_hash``
+    once and pass it to ``sign``; ``canonical_fields`` likewise lets a
+    template canonicalize its fixed headers once.
+    """
+
+    def __init__(self, domain: str, selector: str, private_key, headers: Iterable[str] = SIGNED_HEADERS):
+        # Imported with the key, so the module loads without cryptography
+        from cryptography.hazmat.primitives import hashes
+        from cryptography.hazmat.primitives.asymmetric import ed25519, padding, rsa
+
+        self.domain = domain
+        self.selector = selector
+        self.headers = tuple(name.lower() for name in headers)
+        self.private_key = private_key
+        if isinstance(private_key, rsa.RSAPrivateKey):
+            self.algorithm = "rsa-sha256"
+            self._sign = lambda data: private_key.sign(data, padding.PKCS1v15(), hashes.SHA256())
+        elif isinstance(private_key, ed25519.Ed25519PrivateKey):
+            # RFC 8463: Ed25519 signs the SHA-256 hash of the header data
+            self.algorithm = "ed25519-sha256"
+            self._sign = lambda data: private_key.sign(hashlib.sha256(data).digest())
+        else:
+            raise ValueError(f"DKIM keys must be RSA or Ed25519, got {type(private_key).__name__}")
+
+    @classmethod
+    def from_config(cls, email_config: dict) -> Optional["DKIMSigner"]:
+        """Signer for the platforms.email.dkim section, or None when signing is off"""
+        settings = email_config.get('dkim') or {}
+        if not settings.get('enabled'):
+            return None
+        return cls(
+            settings['domain'],
+            settings['selector'],
+            load_private_key(settings['private_key_file']),
+            settings.get('headers', SIGNED_HEADERS),
+        )
+
+    def body_hash(self, body: bytes) -> str:
+        return base64.b64encode(hashlib.sha256(canonical_body(body)).digest()).decode("ascii")
+
+    def canonical_fields(self, headers: bytes) -> Dict[str, bytes]:
+        """Relaxed canonical form of each signed header in a header block
+
+        The last occurrence of a name wins, as it is the one verifiers pick
+        when a header is signed once.
+        """
+        fields = {}
+        for line in split_headers(headers):
+            name = line.partition(b":")[0].strip().lower().decode("ascii", "replace")
+            if name in self.headers:
+                fields[name] = canonical_header(line)
+        return fields
+
+    def signature_header(self, fields: Dict[str, bytes], body_hash: str) -> bytes:
+        """DKIM-Signature header line (with CRLF) over canonical ``fields``"""
+        started = time.perf_counter()
+        names = [name for name in self.headers if name in fields]
+        tags = (
+            f"DKIM-Signature: v=1; a={self.algorithm}; c=relaxed/simple; d={self.domain};\r\n"
+            f" s={self.selector}; t={int(time.time())}; h={':'.join(names)};\r\n"
+            f" bh={body_hash};\r\n"
+            f" b="
+        ).encode("ascii")
+        data = b"".join(fields[name] + b"\r\n" for name in names) + canonical_header(tags)
+        signature = base64.b64encode(self._sign(data))
+        SIGN_SECONDS.observe(time.perf_counter() - started)
+        return tags + signature + b"\r\n"
+
+    def sign(self, message: bytes, body_hash: Optional[str] = None) -> bytes:
+        """Message bytes with a DKIM-Signature header in front"""
+        headers, body = split_message(message)
+        if body_hash is None:
+            body_hash = self.body_hash(body)
+        return self.signature_header(self.canonical_fields(headers), body_hash) + message
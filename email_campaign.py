@@ -3,27 +3,44 @@ Email module for Senior Advertising Bot
 Handles email campaigns with senior-friendly formatting
 """
 
-import smtplib
-import ssl
 from email.mime.text import MIMEText
 from email.mime.multipart import MIMEMultipart
-from email.mime.base import MIMEBase
-from email import encoders
+from email.message import Message
 import logging
-from typing import List, Optional
+import threading
+from itertools import islice
+from typing import Callable, Dict, Iterable, Iterator, List, Optional, Tuple, Union
+
+from campaign_outbox import CampaignOutbox, campaign_key
+from campaign_shards import ShardedCampaign
+from dkim_signer import DKIMSigner
+from email_delivery import DeliveryEngine, DeliveryResult, DeliverySummary
+from email_templates import CompiledEmailTemplate
+from message_variants import VariantSet
+from rate_scheduler import DomainRateScheduler
+from recipient_parser import ParseSummary, Recipient, RecipientParser, parse_recipient
+from recipient_sources import RecipientSource
+from recipient_store import RecipientStore, normalize_address
+from suppression import SuppressionIndex, open_suppression_index
 
 class SeniorEmailCampaign:
     def __init__(self, config: dict):
         self.config = config
         self.logger = logging.getLogger(__name__)
+        self.last_results: List[DeliveryResult] = []
+        self.last_rate_stats: Optional[dict] = None
+        self.last_summary: Optional[DeliverySummary] = None
+        self.last_variant_counts: Dict[str, int] = {}
+        self.last_parse_summary: Optional[ParseSummary] = None
+        self._store: Optional[RecipientStore] = None
+        self._recipient_index = None
+        self.last_suppressed = 0
+        # Whether the last campaign got through its whole recipient list
+        self.last_complete = False
         
-    def create_senior_friendly_email(self, subject: str, message: str, recipient_name: str = "Friend") -> MIMEMultipart:
-        """Create an email formatted for senior audiences"""
-        
-        # Create multipart message
-        msg = MIMEMultipart("alternative")
-        msg["Subject"] = subject
-        msg["From"] = self.config['platforms']['email']['username']
+    def render_email_bodies(self, message: str, recipient_name: str = "Friend") -> Tuple[str, str]:
+        """Render the plain text and HTML bodies of a senior-friendly email"""
+        html_message = message.replace('\n', '<br>')
         
         # Create HTML version with large, clear formatting
         html_content = f"""
@@ -33,7 +50,7 @@ class SeniorEmailCampaign:
                 <h2 style="color: #2c5aa0; font-size: 24px;">Hello {recipient_name}!</h2>
                 
                 <div style="background-color: #f9f9f9; padding: 20px; border-radius: 10px; margin: 20px 0;">
-                    {message.replace('\n', '<br>')}
+                    {html_message}
                 </div>
                 
                 <div style="margin: 30px 0; padding: 15px; background-color: #e8f4f8; border-left: 4px solid #2c5aa0;">
@@ -73,6 +90,18 @@ You received this email because you expressed interest in services for seniors.
 If you'd prefer not to receive these emails, simply reply with "UNSUBSCRIBE"
         """
         
+        return text_content, html_content
+    
+    def create_senior_friendly_email(self, subject: str, message: str, recipient_name: str = "Friend") -> MIMEMultipart:
+        """Create an email formatted for senior audiences"""
+        
+        # Create multipart message
+        msg = MIMEMultipart("alternative")
+        msg["Subject"] = subject
+        msg["From"] = self.config['platforms']['email']['username']
+        
+        text_content, html_content = self.render_email_bodies(message, recipient_name)
+        
         # Attach both versions
         part1 = MIMEText(text_content, "plain")
         part2 = MIMEText(html_content, "html")
@@ -82,67 +111,374 @@ If you'd prefer not to receive these emails, simply reply with "UNSUBSCRIBE"
         
         return msg
     
-    def send_email_campaign(self, recipients: List[str], subject: str, message: str) -> bool:
-        """Send email campaign to list of recipients"""
+    def send_email_campaign(
+        self,
+        recipients: Union[List[str], RecipientSource, Iterable[str]],
+        subject: str,
+        message: Union[str, VariantSet],
+        on_result: Optional[Callable[[int, DeliveryResult], None]] = None,
+        campaign_id: Optional[str] = None,
+        cancel: Optional[threading.Event] = None,
+    ) -> bool:
+        """Send email campaign to a list or streamed RecipientSource of recipients"""
         
         if not self.config['platforms']['email']['enabled']:
             self.logger.info("Email campaigns disabled in config")
             return False
+        
+        self.last_summary = None
+        self.last_rate_stats = None
+        self.last_variant_counts = {}
+        self.last_complete = False
+        shards = self.config['platforms']['email'].get('shards', 1)
+        if shards > 1:
+            return self.send_sharded_campaign(recipients, subject, message, shards, on_result, campaign_id, cancel)
             
+        variants = message if isinstance(message, VariantSet) else None
         try:
-            # Create secure connection
-            context = ssl.create_default_context()
-            server = smtplib.SMTP(
-                self.config['platforms']['email']['smtp_server'],
-                self.config['platforms']['email']['smtp_port']
-            )
-            server.starttls(context=context)
-            server.login(
-                self.config['platforms']['email']['username'],
-                self.config['platforms']['email']['password']
-            )
+            engine = DeliveryEngine(self.config)
+            try:
+                signer = DKIMSigner.from_config(self.config['platforms']['email'])
+            except (OSError, ValueError, KeyError, ImportError) as e:
+                raise ValueError(f"cannot set up DKIM signing: {e}") from e
+            # Body, contact block, footer and DKIM body hash are done once per campaign (and variant)
+            if variants is not None:
+                templates = {variant.id: CompiledEmailTemplate(self, subject, variant.text, signer=signer)
+                             for variant in variants.variants}
+            else:
+                template = CompiledEmailTemplate(self, subject, message, signer=signer)
+        except Exception as e:
+            self.logger.error(f"Email campaign failed: {e}")
+            return False
+        
+        def build_message(recipient: Recipient) -> Tuple[str, Union[bytes, Message]]:
+            name = recipient.name or "Friend"
+            if variants is not None:
+                return recipient.address, templates[variants.assign(recipient.address).id].render(name, recipient.address)
+            return recipient.address, template.render(name, recipient.address)
+        
+        bulk = self.config['platforms']['email'].get('bulk_envelope') or {}
+        if bulk.get('enabled'):
+            # Not personalized: one "Friend" message per variant, shared by every batch
+            if variants is not None:
+                bulk_bodies = {variant_id: compiled.render_bulk() for variant_id, compiled in templates.items()}
+            else:
+                bulk_body = template.render_bulk()
             
-            success_count = 0
+            def bulk_message(recipient: Recipient) -> Tuple[str, bytes]:
+                if variants is not None:
+                    return recipient.address, bulk_bodies[variants.assign(recipient.address).id]
+                return recipient.address, bulk_body
+        
+        # Results in list order end up in last_results only for a list with no on_result
+        collected: List[Tuple[int, DeliveryResult]] = []
+        if on_result is None and isinstance(recipients, list):
+            on_result = lambda index, result: collected.append((index, result))
+        
+        # Rows are parsed, validated and deduplicated a chunk at a time; on_result indexes are rows
+        parser = RecipientParser.from_config(self.config['platforms']['email'])
+        self.last_parse_summary = None
+        outbox = suppressions = stream = None
+        self.last_suppressed = 0
+        try:
+            outbox = self.open_outbox(subject, variants.key if variants is not None else message, campaign_id)
+            if outbox is None:
+                jobs = parser.parse(recipients)
+                if variants is not None:
+                    # No outbox to store the assignment in; this is enough to recompute it
+                    self.logger.info(f"Message variants: {variants.describe()}")
+            else:
+                jobs = self._outbox_jobs(outbox, recipients, parser)
+                if variants is not None:
+                    outbox.record_variants({variant.id: variant.text for variant in variants.variants})
+                report = on_result
+                
+                def on_result(index: int, result: DeliveryResult):
+                    outbox.record(index, result)
+                    if report:
+                        report(index, result)
+            stream = jobs
+            self.last_parse_summary = parser.summary
+            
+            if variants is not None:
+                on_result = self._variant_recorder(variants, on_result)
             
-            for recipient in recipients:
-                try:
-                    # Extract name if email is in "Name <email@domain.com>" format
-                    if "<" in recipient:
-                        name = recipient.split("<")[0].strip()
-                        email = recipient.split("<")[1].replace(">", "").strip()
-                    else:
-                        name = "Friend"
-                        email = recipient
-                    
-                    msg = self.create_senior_friendly_email(subject, message, name)
-                    msg["To"] = email
-                    
-                    server.send_message(msg)
-                    success_count += 1
-                    self.logger.info(f"Email sent successfully to {email}")
-                    
-                except Exception as e:
-                    self.logger.error(f"Failed to send email to {recipient}: {e}")
+            # Read-only: the index is brought up to date before the campaign starts
+            suppressions = open_suppression_index(self.config['platforms']['email'])
+            if suppressions is not None:
+                jobs = self._unsuppressed_jobs(suppressions, jobs, on_result)
             
-            server.quit()
-            self.logger.info(f"Email campaign completed: {success_count}/{len(recipients)} sent successfully")
-            return success_count > 0
+            # Interleave recipient domains within the compliance rate limits
+            scheduler = DomainRateScheduler.from_config(self.config)
+            throttle = None
+            if scheduler is not None:
+                jobs = scheduler.schedule((job, job[1].address) for job in jobs)
+                # Retries skip the stream, so they take their tokens on the way back in
+                throttle = lambda recipient: scheduler.acquire(recipient.address)
             
+            # Pooled, TLS-upgraded connections shared by concurrent workers
+            if bulk.get('enabled'):
+                summary = engine.deliver_bulk(jobs, bulk_message, on_result, bulk.get('batch_size', 50), cancel,
+                                              throttle)
+            else:
+                summary = engine.deliver(jobs, build_message, on_result, indexed=True, cancel=cancel,
+                                         throttle=throttle)
+        except Exception as e:
+            self.logger.error(f"Email campaign failed: {e}")
+            return False
+        finally:
+            if stream is not None:
+                # Delivery may stop part way; release the parser's index here, not in the collector
+                stream.close()
+            if outbox is not None:
+                outbox.close()
+            if suppressions is not None:
+                suppressions.close()
+        
+        # Delivery reads the whole stream unless it is cancelled
+        self.last_complete = cancel is None or not cancel.is_set()
+        if scheduler is not None:
+            self.last_rate_stats = scheduler.stats()
+        self.last_summary = summary
+        collected.sort(key=lambda item: item[0])
+        self.last_results = [result for _, result in collected]
+        self.log_campaign_summary()
+        if outbox is not None and outbox.error is not None:
+            self.last_complete = False
+            self.logger.error(f"Email campaign stopped: its outbox could not be written: {outbox.error}")
+            return False
+        if outbox is not None and summary.attempted == 0:
+            # Nothing left to send for a campaign that already finished
+            return outbox.completed
+        return summary.sent > 0
+    
+    def send_sharded_campaign(
+        self,
+        recipients: Iterable[str],
+        subject: str,
+        message: Union[str, VariantSet],
+        shards: int,
+        on_result: Optional[Callable[[int, DeliveryResult], None]] = None,
+        campaign_id: Optional[str] = None,
+        cancel: Optional[threading.Event] = None,
+    ) -> bool:
+        """Send a campaign from ``shards`` worker processes
+        
+        Each address always lands in the same shard, and each worker has its
+        own SMTP pool, outbox and suppression check. Rate limits are divided
+        between the shards. Results and counts are gathered here, so
+        ``on_result``, ``last_results`` and the logged summary look the same
+        as for a single-process campaign.
+        """
+        collected: List[Tuple[int, DeliveryResult]] = []
+        if on_result is None and isinstance(recipients, list):
+            on_result = lambda index, result: collected.append((index, result))
+        if self.config['platforms']['email'].get('outbox'):
+            campaign_id = campaign_id or campaign_key(subject, message.key if isinstance(message, VariantSet) else message)
+        
+        # Parsed and deduplicated here, so the report and counts cover the whole list
+        parser = RecipientParser.from_config(self.config['platforms']['email'])
+        parsed = parser.parse(recipients)
+        self.last_parse_summary = parser.summary
+        
+        self.logger.info(f"Sending campaign from {shards} worker processes")
+        try:
+            outcome = ShardedCampaign(self.config, shards).run(parsed, subject, message, on_result, campaign_id, cancel)
         except Exception as e:
             self.logger.error(f"Email campaign failed: {e}")
             return False
+        
+        self.last_summary = outcome.summary
+        self.last_suppressed = outcome.suppressed
+        self.last_rate_stats = outcome.rate_stats
+        self.last_variant_counts = outcome.variant_counts
+        collected.sort(key=lambda item: item[0])
+        self.last_results = [result for _, result in collected]
+        self.last_complete = not outcome.crashed and not outcome.unfinished
+        if outcome.crashed:
+            self.logger.error(f"Campaign shards {outcome.crashed} crashed")
+        if outcome.unfinished:
+            self.logger.error(f"Campaign shards {outcome.unfinished} did not finish their recipients")
+        self.log_campaign_summary()
+        return outcome.ok
+    
+    def _variant_recorder(
+        self,
+        variants: VariantSet,
+        on_result: Optional[Callable[[int, DeliveryResult], None]],
+    ) -> Callable[[int, DeliveryResult], None]:
+        """Wrap ``on_result`` so every result carries its variant and sends are counted per variant
+        
+        Each recipient gets the variant their address hashes to, so the
+        assignment is stable across reruns and shards.
+        """
+        counts = self.last_variant_counts
+        counts.update((variant.id, 0) for variant in variants.variants)
+        lock = threading.Lock()
+        
+        def record(index: int, result: DeliveryResult):
+            result.variant = variants.assign(result.email).id
+            if result.success:
+                with lock:
+                    counts[result.variant] += 1
+            if on_result:
+                on_result(index, result)
+        
+        return record
+    
+    def log_campaign_summary(self):
+        """Log rate limiting, suppression and delivery counts of the last campaign"""
+        if self.last_rate_stats is not None:
+            self.logger.info(
+                f"Rate limits: {len(self.last_rate_stats['domains'])} domains, "
+                f"throttled {self.last_rate_stats['throttled_seconds']}s, "
+                f"average wait {self.last_rate_stats['avg_wait_seconds']}s"
+            )
+        if self.last_suppressed:
+            self.logger.info(f"Skipped {self.last_suppressed} unsubscribed or bounced recipients")
+        if self.last_variant_counts:
+            sent = ", ".join(f"{variant} {count}" for variant, count in self.last_variant_counts.items())
+            self.logger.info(f"Sent per message variant: {sent}")
+        summary = self.last_summary
+        if summary.retried:
+            self.logger.info(f"Retried {summary.retried} transient failures")
+        self.logger.info(f"Email campaign completed: {summary.sent}/{summary.attempted} sent successfully")
+    
+    def open_outbox(self, subject: str, message: str, campaign_id: Optional[str] = None) -> Optional[CampaignOutbox]:
+        """Outbox for this campaign when platforms.email.outbox is configured
+        
+        Every message's state is checkpointed under ``campaign_id``, by
+        default derived from the subject and message, so rerunning the same
+        campaign resumes it instead of starting over.
+        """
+        email_config = self.config['platforms']['email']
+        if not email_config.get('outbox'):
+            return None
+        
+        outbox = CampaignOutbox(
+            email_config['outbox'],
+            campaign_id or campaign_key(subject, message),
+            subject,
+            commit_every=email_config.get('outbox_commit_every', 500)
+        )
+        if outbox.completed:
+            self.logger.info(f"Campaign {outbox.campaign_id} already went through its list; retrying leftovers only")
+        elif outbox.position:
+            self.logger.info(f"Resuming campaign {outbox.campaign_id} after {outbox.position} recipients")
+        return outbox
+    
+    def _outbox_jobs(
+        self,
+        outbox: CampaignOutbox,
+        recipients: Iterable[Union[str, Recipient]],
+        parser: RecipientParser,
+    ) -> Iterator[Tuple[int, Recipient]]:
+        """Leftovers from an interrupted run, then the recipient stream from where it stopped
+        
+        Positions are source rows, so a resumed campaign skips the rows it
+        already queued without parsing them (a SQLiteSource skips them in its
+        query). Addresses seen are kept in the outbox database, so the rest
+        is still deduplicated against them.
+        """
+        parsed = None
+        if not outbox.completed:
+            if isinstance(recipients, RecipientSource):
+                remaining = recipients.resume(outbox.position)
+            else:
+                remaining = islice(iter(recipients), outbox.position, None)
+            parsed = parser.parse(remaining, outbox.position, outbox.path, outbox.campaign_id)
+        return self._outbox_stream(outbox, parsed)
+    
+    def _outbox_stream(
+        self,
+        outbox: CampaignOutbox,
+        parsed: Optional[Iterator[Tuple[int, Recipient]]],
+    ) -> Iterator[Tuple[int, Recipient]]:
+        try:
+            # Stop queueing once checkpoints fail: a rerun could not tell what was sent
+            for seq, entry in outbox.pending():
+                if outbox.error is not None:
+                    return
+                recipient, reason = parse_recipient(entry)
+                if recipient is None:
+                    # Queued by a version that did not validate entries
+                    outbox.record(seq, DeliveryResult(entry, "", False, reason))
+                    continue
+                yield seq, recipient
+            if parsed is None:
+                return
+            
+            for seq, recipient in parsed:
+                if outbox.error is not None:
+                    return
+                outbox.enqueue(seq, str(recipient))
+                yield seq, recipient
+            outbox.complete()
+        finally:
+            # The parser's address index must be closed on the thread that opened it
+            if parsed is not None:
+                parsed.close()
+    
+    def _unsuppressed_jobs(
+        self,
+        suppressions: SuppressionIndex,
+        jobs: Iterable[Tuple[int, Recipient]],
+        on_result: Optional[Callable[[int, DeliveryResult], None]],
+    ) -> Iterator[Tuple[int, Recipient]]:
+        """Drop suppressed recipients, reporting each as a failed result
+        
+        The index (platforms.email.suppression) holds unsubscribes and hard
+        bounces; each skipped recipient's result fails with "suppressed".
+        """
+        for index, recipient in jobs:
+            if recipient.address not in suppressions:
+                yield index, recipient
+                continue
+            self.last_suppressed += 1
+            if on_result:
+                on_result(index, DeliveryResult(str(recipient), recipient.address, False, "suppressed"))
+    
+    def recipient_store(self) -> Optional[RecipientStore]:
+        """Persistent store named by platforms.email.recipient_store, if any"""
+        path = self.config['platforms']['email'].get('recipient_store')
+        if not path:
+            return None
+        if self._store is None or self._store.path != path:
+            self._store = RecipientStore(path)
+        return self._store
     
     def add_recipient(self, email: str, name: str = ""):
         """Add a new recipient to the mailing list"""
-        recipients = self.config['platforms']['email']['recipients']
-        
         if name:
             formatted_email = f"{name} <{email}>"
         else:
             formatted_email = email
+        
+        recipient, reason = parse_recipient(email)
+        if recipient is None:
+            self.logger.warning(f"Not a valid email address ({reason}): {email}")
+            return False
+        address = recipient.address
+        
+        store = self.recipient_store()
+        if store is not None:
+            added = store.add(email, name)
+        else:
+            recipients = self.config['platforms']['email']['recipients']
+            cached = self._recipient_index
+            if cached is None or cached[0] is not recipients or cached[2] != len(recipients):
+                # Normalized addresses already in the inline list, for O(1) dedupe
+                index = {normalize_address(entry) for entry in recipients}
+                cached = (recipients, index, len(recipients))
+            index = cached[1]
             
-        if formatted_email not in recipients:
-            recipients.append(formatted_email)
+            added = address not in index
+            if added:
+                recipients.append(formatted_email)
+                index.add(address)
+            self._recipient_index = (recipients, index, len(recipients))
+        
+        if added:
             self.logger.info(f"Added new recipient: {formatted_email}")
             return True
         else:
@@ -0,0 +1,268 @@
+"""
+Compiled email templates for Senior Advertising Bot
+Renders and encodes the campaign-invariant parts of an email once, then
+splices in each recipient's name and address at the byte level
+"""
+
+import base64
+import copy
+import hashlib
+import io
+import logging
+import random
+import re
+import sys
+import time
+from email.generator import BytesGenerator
+from email.message import Message
+from email.utils import getaddresses
+from typing import Dict, List, Optional, Union
+
+from dkim_signer import DKIMSigner, canonical_body, canonical_header
+from metrics import RENDER_SECONDS, SERIALIZE_SECONDS
+
+# Placeholders that never occur in real campaign content
+NAME_MARKER = "\x00recipient_name\x00"
+PART_MARKER = "\x00part{}\x00"
+TO_MARKER = "\x00to\x00"
+
+# To header of a bulk-envelope message, so no recipient sees the others
+UNDISCLOSED_RECIPIENTS = "undisclosed-recipients:;"
+
+# Bytes per base64 output line used by email.base64mime (76 chars / 4 * 3)
+BASE64_LINE_BYTES = 57
+
+NEWLINES = re.compile(r"\r\n|\r|\n")
+FROM_LINE = re.compile(r"^From ", re.MULTILINE)
+SIMPLE_ADDRESS = re.compile(r"[^\s<>(),;:\"\[\]\\@]+@[^\s<>(),;:\"\[\]\\@]+")
+
+RENDER_SPLICED = RENDER_SECONDS.labels("spliced")
+RENDER_MIME = RENDER_SECONDS.labels("mime")
+
+# Body hashes kept per template; recipients without a name all share "Friend"
+BODY_HASH_CACHE_SIZE = 1024
+
+
+def make_boundary() -> str:
+    """Random multipart boundary in the same format the email generator uses"""
+    return ("=" * 15) + ("%019d" % random.randrange(sys.maxsize)) + "=="
+
+
+def serialize_for_smtp(msg: Message) -> bytes:
+    """Flatten a message exactly as smtplib's send_message does for ASCII addresses"""
+    msg_copy = msg
+    if "Bcc" in msg or "Resent-Bcc" in msg:
+        msg_copy = copy.copy(msg)
+        del msg_copy["Bcc"]
+        del msg_copy["Resent-Bcc"]
+    started = time.perf_counter()
+    with io.BytesIO() as bytesmsg:
+        BytesGenerator(bytesmsg).flatten(msg_copy, linesep="\r\n")
+        data = bytesmsg.getvalue()
+    SERIALIZE_SECONDS.observe(time.perf_counter() - started)
+    return data
+
+
+def _encode_7bit(text: str, line_start: bool = True) -> bytes:
+    # What the generator writes for a us-ascii text part
+    if not line_start:
+        # Text continues a line, so its first characters can't be mangled
+        return _encode_7bit(" " + text)[1:]
+    return NEWLINES.sub("\r\n", FROM_LINE.sub(">From ", text)).encode("ascii")
+
+
+def _encode_base64(data: bytes) -> bytes:
+    # What the generator writes for a utf-8 text part: 57-byte lines, CRLF endings
+    return base64.encodebytes(data).replace(b"\n", b"\r\n")
+
+
+class _CompiledPart:
+    """One text/plain or text/html part split around the recipient name"""
+
+    def __init__(self, prefix: str, suffix: str):
+        self.ascii = (prefix + suffix).isascii()
+        self.last_line = NEWLINES.split(prefix)[-1]
+        if self.ascii:
+            self.head = _encode_7bit(prefix)
+            self.suffix = _encode_7bit(suffix, line_start=False)
+            self.prefix_tail = b""
+        else:
+            # Encode the whole base64 lines before the name once; only the
+            # remainder of the prefix is re-encoded with each recipient
+            prefix_bytes = prefix.encode("utf-8")
+            aligned = len(prefix_bytes) // BASE64_LINE_BYTES * BASE64_LINE_BYTES
+            self.head = _encode_base64(prefix_bytes[:aligned])
+            self.prefix_tail = prefix_bytes[aligned:]
+            self.suffix = suffix.encode("utf-8")
+
+    def accepts(self, name: str) -> bool:
+        """Whether the name can be spliced without changing the part's encoding"""
+        if "\r" in name or "\n" in name:
+            return False
+        if self.ascii:
+            return name.isascii() and not (self.last_line + name[:5]).startswith("From ")
+        return True
+
+    def render(self, name: str) -> bytes:
+        return self.head + self.tail(name)
+
+    def tail(self, name: str) -> bytes:
+        """Everything after the fixed ``head``"""
+        if self.ascii:
+            return name.encode("ascii") + self.suffix
+        return _encode_base64(self.prefix_tail + name.encode("utf-8") + self.suffix)
+
+
+class CompiledEmailTemplate:
+    """Pre-encoded email for one campaign subject and message
+
+    ``render`` returns the bytes ``send_message`` would have put on the wire
+    for ``create_senior_friendly_email``'s output with the same boundary.
+    Recipients whose name or address would change the encoding fall back to
+    the regular MIME path, so the output stays byte-identical either way.
+
+    With a ``signer`` every byte message gets a DKIM-Signature header. The
+    fixed headers are canonicalized once, the body is hashed from a saved
+    hash state once per distinct name, and only the To header and the
+    signature itself are computed per recipient. Messages that need
+    SMTPUTF8 are returned as Message objects and go out unsigned.
+    """
+
+    def __init__(self, campaign, subject: str, message: str, boundary: Optional[str] = None,
+                 signer: Optional[DKIMSigner] = None):
+        self.campaign = campaign
+        self.subject = subject
+        self.message = message
+        self.boundary = boundary or make_boundary()
+        self.signer = signer
+        self._fixed_fields: Optional[Dict[str, bytes]] = None
+        self._body_hashes: Dict[str, str] = {}
+        self.from_addr = getaddresses([campaign.config['platforms']['email']['username']])[0][1]
+        self.logger = logging.getLogger(__name__)
+        self.compiled = False
+        self._segments: List[bytes] = []
+        self._parts: List[_CompiledPart] = []
+
+        try:
+            self._compile()
+        except Exception as e:
+            self.logger.warning(f"Falling back to per-recipient MIME rendering: {e}")
+            return
+
+        # Guard against any drift from the reference path
+        probe = ("Friend", "probe@example.com")
+        if self._splice(*probe) != serialize_for_smtp(self.build_message(*probe)):
+            self.logger.warning("Compiled template does not match MIME output, using per-recipient rendering")
+            self.compiled = False
+        elif signer is not None:
+            self._prepare_signing()
+
+    def _compile(self):
+        bodies = self.campaign.render_email_bodies(self.message, NAME_MARKER)
+        for body in bodies:
+            pieces = body.split(NAME_MARKER)
+            if len(pieces) != 2:
+                raise ValueError("recipient name must appear exactly once per part")
+            self._parts.append(_CompiledPart(*pieces))
+
+        # Build the real MIME tree once with placeholders for every variable piece
+        skeleton = self.build_message("Friend", TO_MARKER)
+        for index, part in enumerate(skeleton.get_payload()):
+            part.set_payload(PART_MARKER.format(index))
+        flat = serialize_for_smtp(skeleton)
+
+        markers = [TO_MARKER] + [PART_MARKER.format(i) for i in range(len(self._parts))]
+        segments = []
+        for marker in markers:
+            head, sep, flat = flat.partition(marker.encode("ascii"))
+            if not sep:
+                raise ValueError(f"placeholder {marker!r} missing from serialized message")
+            segments.append(head)
+        segments.append(flat)
+        self._segments = segments
+        self.compiled = True
+
+    def _prepare_signing(self):
+        segments = self._segments
+        fixed, _, self._to_prefix = segments[0].rpartition(b"\r\n")
+        # The To value is followed by the blank line ending the headers
+        if not segments[1].startswith(b"\r\n\r\n") or not segments[-1].strip(b"\r\n"):
+            return
+        self._fixed_fields = self.signer.canonical_fields(fixed + b"\r\n")
+        self._body_start = hashlib.sha256(segments[1][4:] + self._parts[0].head)
+        self._body_end = canonical_body(segments[-1])
+
+    def body_hash(self, recipient_name: str) -> str:
+        """DKIM body hash of a spliced message, computed once per name"""
+        body_hash = self._body_hashes.get(recipient_name)
+        if body_hash is None:
+            digest = self._body_start.copy()
+            digest.update(self._parts[0].tail(recipient_name))
+            for index, part in enumerate(self._parts[1:], 2):
+                digest.update(self._segments[index])
+                digest.update(part.render(recipient_name))
+            digest.update(self._body_end)
+            body_hash = base64.b64encode(digest.digest()).decode("ascii")
+            if len(self._body_hashes) >= BODY_HASH_CACHE_SIZE:
+                self._body_hashes.clear()
+            self._body_hashes[recipient_name] = body_hash
+        return body_hash
+
+    def _sign_spliced(self, recipient_name: str, email: str, data: bytes) -> bytes:
+        if self._fixed_fields is None:
+            return self.signer.sign(data)
+        fields = dict(self._fixed_fields)
+        fields["to"] = canonical_header(self._to_prefix + email.encode("ascii"))
+        return self.signer.signature_header(fields, self.body_hash(recipient_name)) + data
+
+    def build_message(self, recipient_name: str, email: str) -> Message:
+        """Full MIME message through the regular path, using this template's boundary"""
+        msg = self.campaign.create_senior_friendly_email(self.subject, self.message, recipient_name)
+        msg["To"] = email
+        msg.set_boundary(self.boundary)
+        return msg
+
+    def can_splice(self, recipient_name: str, email: str) -> bool:
+        return (
+            self.compiled
+            and len(email) <= 70
+            and email.isascii()
+            and SIMPLE_ADDRESS.fullmatch(email) is not None
+            and all(part.accepts(recipient_name) for part in self._parts)
+        )
+
+    def _splice(self, recipient_name: str, email: str) -> bytes:
+        segments = self._segments
+        out = [segments[0], email.encode("ascii")]
+        for index, part in enumerate(self._parts):
+            out.append(segments[index + 1])
+            out.append(part.render(recipient_name))
+        out.append(segments[-1])
+        return b"".join(out)
+
+    def render_bulk(self, recipient_name: str = "Friend") -> bytes:
+        """Wire bytes of the one message sent to a whole batch of recipients"""
+        data = serialize_for_smtp(self.build_message(recipient_name, UNDISCLOSED_RECIPIENTS))
+        return self.signer.sign(data) if self.signer is not None else data
+
+    def render(self, recipient_name: str, email: str) -> Union[bytes, Message]:
+        """Wire bytes for one recipient, or a Message when bytes can't be spliced"""
+        started = time.perf_counter()
+        if self.can_splice(recipient_name, email):
+            data = self._splice(recipient_name, email)
+            RENDER_SPLICED.observe(time.perf_counter() - started)
+            if self.signer is not None:
+                return self._sign_spliced(recipient_name, email, data)
+            return data
+        msg = self.build_message(recipient_name, email)
+        try:
+            "".join([self.from_addr, email]).encode("ascii")
+        except UnicodeEncodeError:
+            # Needs SMTPUTF8 negotiation, which only send_message handles
+            RENDER_MIME.observe(time.perf_counter() - started)
+            return msg
+        data = serialize_for_smtp(msg)
+        RENDER_MIME.observe(time.perf_counter() - started)
+        if self.signer is not None:
+            return self.signer.sign(data)
+        return data
@@ -0,0 +1,229 @@
+"""
+Facebook Graph client for Senior Advertising Bot
+Posts to many groups per round trip with Graph batch requests over a pooled,
+keep-alive session, backing off when Facebook rate-limits us and resending
+only posts that certainly did not go through
+"""
+
+import json
+import logging
+import random
+import threading
+import time
+from dataclasses import dataclass
+from typing import Callable, Dict, List, Optional
+from urllib.parse import urlencode
+
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.exceptions import NewConnectionError
+
+# Graph accepts at most 50 operations per batch request
+MAX_BATCH_SIZE = 50
+
+# Graph error codes that mean "slow down" rather than "this post is bad"
+RATE_LIMIT_CODES = {4, 17, 32, 341, 368, 613, 80001}
+# Operations failing with these were turned away without running, so resending
+# them cannot post twice; "unknown error" (1) and HTTP 5xx may have posted
+NOT_EXECUTED_CODES = {2} | RATE_LIMIT_CODES
+MAYBE_POSTED = "may have been posted, not resent"
+
+
+def request_not_sent(error: requests.RequestException) -> bool:
+    """Whether a failed request certainly never reached the server"""
+    if isinstance(error, requests.ConnectTimeout):
+        return True
+    if isinstance(error, requests.ConnectionError) and error.args:
+        return isinstance(getattr(error.args[0], "reason", None), NewConnectionError)
+    return False
+
+
+@dataclass
+class GroupPostResult:
+    """Outcome of posting the message to one group"""
+    group_id: str
+    success: bool
+    post_id: Optional[str] = None
+    error: Optional[str] = None
+    attempts: int = 0
+
+
+class FacebookGraphClient:
+    def __init__(
+        self,
+        access_token: str,
+        api_version: str = "v19.0",
+        base_url: str = "https://graph.facebook.com",
+        batch_size: int = MAX_BATCH_SIZE,
+        max_retries: int = 5,
+        backoff_seconds: float = 2.0,
+        pool_size: int = 4,
+        timeout: float = 30.0,
+        sleep: Callable[[float], None] = time.sleep,
+    ):
+        self.access_token = access_token
+        self.url = f"{base_url.rstrip('/')}/{api_version}/"
+        self.batch_size = max(1, min(batch_size, MAX_BATCH_SIZE))
+        self.max_retries = max_retries
+        self.backoff_seconds = backoff_seconds
+        self.timeout = timeout
+        self.sleep = sleep
+        self.logger = logging.getLogger(__name__)
+
+        # One keep-alive pool reused for every batch instead of fresh connections
+        self.session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=pool_size)
+        self.session.mount("https://", adapter)
+        self.session.mount("http://", adapter)
+
+    @classmethod
+    def from_config(cls, facebook_config: dict, **kwargs) -> "FacebookGraphClient":
+        return cls(
+            facebook_config.get('access_token', ''),
+            api_version=facebook_config.get('api_version', 'v19.0'),
+            base_url=facebook_config.get('base_url', 'https://graph.facebook.com'),
+            batch_size=facebook_config.get('batch_size', MAX_BATCH_SIZE),
+            max_retries=facebook_config.get('max_retries', 5),
+            **kwargs
+        )
+
+    def close(self):
+        self.session.close()
+
+    def _backoff(self, attempt: int) -> float:
+        # Exponential backoff with full jitter
+        return random.uniform(0, self.backoff_seconds * (2 ** attempt))
+
+    def _send_batch(self, group_ids: List[str], message: str) -> requests.Response:
+        body = urlencode({"message": message})
+        batch = [
+            {"method": "POST", "relative_url": f"{group_id}/feed", "body": body}
+            for group_id in group_ids
+        ]
+        return self.session.post(
+            self.url,
+            data={"access_token": self.access_token, "batch": json.dumps(batch), "include_headers": "false"},
+            timeout=self.timeout,
+        )
+
+    def post_to_groups(
+        self,
+        group_ids: List[str],
+        message: str,
+        cancel: Optional[threading.Event] = None,
+    ) -> List[GroupPostResult]:
+        """Post ``message`` to every group, returning one result per group in order
+
+        Posts are not idempotent, so only operations Graph reports as not
+        executed (rate-limited, unavailable or timed out inside the batch)
+        and batches that never left this machine are resent. A read timeout,
+        dropped connection or 5xx after a batch was sent is reported as a
+        failure rather than risk posting to a group twice.
+        """
+        results: Dict[str, GroupPostResult] = {
+            str(group_id): GroupPostResult(str(group_id), False) for group_id in group_ids
+        }
+        pending = list(results)
+        attempt = 0
+
+        while pending:
+            if cancel is not None and cancel.is_set():
+                for group_id in pending:
+                    results[group_id].error = results[group_id].error or "cancelled"
+                break
+
+            retry: List[str] = []
+            throttled = False
+            for start in range(0, len(pending), self.batch_size):
+                chunk = pending[start:start + self.batch_size]
+                for group_id in chunk:
+                    results[group_id].attempts += 1
+                try:
+                    response = self._send_batch(chunk, message)
+                except requests.RequestException as e:
+                    not_sent = request_not_sent(e)
+                    for group_id in chunk:
+                        results[group_id].error = str(e) if not_sent else f"{e} ({MAYBE_POSTED})"
+                    if not_sent:
+                        retry.extend(chunk)
+                    continue
+
+                if response.status_code == 429:
+                    # The whole batch was turned away before any operation ran
+                    throttled = True
+                    for group_id in chunk:
+                        results[group_id].error = "HTTP 429"
+                    retry.extend(chunk)
+                    continue
+                try:
+                    items = response.json() if response.status_code == 200 else None
+                except ValueError:
+                    items = None
+                if not isinstance(items, list):
+                    error = self._error_message(response)
+                    if response.status_code >= 500 or response.status_code == 200:
+                        error = f"{error} ({MAYBE_POSTED})"
+                    for group_id in chunk:
+                        results[group_id].error = error
+                    continue
+
+                for group_id, item in zip(chunk, items):
+                    if self._handle_item(results[group_id], item):
+                        retry.append(group_id)
+                        throttled = throttled or self._is_rate_limited(item)
+
+            if not retry:
+                break
+            if attempt >= self.max_retries:
+                self.logger.warning(f"Giving up on {len(retry)} Facebook groups after {attempt + 1} attempts")
+                break
+
+            delay = self._backoff(attempt if throttled else 0)
+            self.logger.info(f"Retrying {len(retry)} Facebook groups in {delay:.1f}s")
+            if cancel is not None:
+                # Woken early by a cancelled cycle; the loop then reports the rest as cancelled
+                cancel.wait(delay)
+            else:
+                self.sleep(delay)
+            attempt += 1
+            pending = retry
+
+        return list(results.values())
+
+    def _handle_item(self, result: GroupPostResult, item: Optional[dict]) -> bool:
+        """Apply one batch response item; True if it was not executed and can be resent"""
+        if item is None:
+            # Graph returns null for operations it did not get to before the batch timed out
+            result.error = "no response for this group"
+            return True
+
+        try:
+            body = json.loads(item.get("body") or "{}")
+        except ValueError:
+            body = {}
+
+        if item.get("code") == 200 and "error" not in body:
+            result.success = True
+            result.post_id = body.get("id")
+            result.error = None
+            return False
+
+        error = body.get("error", {})
+        result.error = error.get("message") or f"HTTP {item.get('code')}"
+        return item.get("code") == 429 or error.get("code") in NOT_EXECUTED_CODES
+
+    def _is_rate_limited(self, item: Optional[dict]) -> bool:
+        if not item:
+            return False
+        if item.get("code") == 429:
+            return True
+        try:
+            return json.loads(item.get("body") or "{}").get("error", {}).get("code") in RATE_LIMIT_CODES
+        except ValueError:
+            return False
+
+    def _error_message(self, response: requests.Response) -> str:
+        try:
+            return response.json()["error"]["message"]
+        except (ValueError, KeyError, TypeError):
+            return f"HTTP {response.status_code}"
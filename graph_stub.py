@@ -0,0 +1,180 @@
+"""
+Local Graph API stub for Senior Advertising Bot
+A small stand-in for Facebook's Graph batch endpoint used to measure and
+exercise group posting without touching real groups
+"""
+
+import json
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Dict, List, Optional
+from urllib.parse import parse_qs
+
+
+class _StubHandler(BaseHTTPRequestHandler):
+    """Answers batch POSTs the way Graph does: one item per operation"""
+
+    def log_message(self, format, *args):
+        pass
+
+    def respond(self, status: int, payload) -> bool:
+        body = json.dumps(payload).encode("utf-8")
+        try:
+            self.send_response(status)
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+        except ConnectionError:
+            # Client gave up waiting, e.g. a read timeout
+            return False
+        return True
+
+    def do_POST(self):
+        stub = self.server.stub
+        length = int(self.headers.get("Content-Length") or 0)
+        form = parse_qs(self.rfile.read(length).decode("utf-8"))
+        try:
+            batch = json.loads(form["batch"][0])
+        except (KeyError, IndexError, ValueError):
+            self.respond(400, {"error": {"message": "batch parameter is required", "code": 100}})
+            return
+
+        request = stub._request_received()
+        if stub.delay:
+            time.sleep(stub.delay)
+        if request <= stub.throttle_requests:
+            stub._fault()
+            self.respond(429, {"error": {"message": "Application request limit reached", "code": 4}})
+            return
+
+        items: List[Optional[dict]] = [stub._operation(operation) for operation in batch]
+        if request <= stub.throttle_requests + stub.fail_requests:
+            # The operations ran but the reply is lost, as with a crashing proxy
+            stub._fault()
+            self.respond(502, {"error": {"message": "Bad gateway", "code": 1}})
+            return
+        if request <= stub.throttle_requests + stub.fail_requests + stub.stall_requests:
+            stub._fault()
+            time.sleep(stub.stall_seconds)
+        self.respond(200, items)
+
+
+class GraphStub:
+    """Threaded HTTP server that accepts Graph batch posts and discards them
+
+    Every executed post is counted per group in ``posts``, so a client that
+    posts twice to one group shows up as a count above one. For exercising
+    error handling it can also inject faults: answer the first
+    ``throttle_requests`` batches with HTTP 429 before running anything,
+    run and then answer the next ``fail_requests`` with HTTP 502, run and
+    then stall the next ``stall_requests`` for ``stall_seconds`` (a client
+    read timeout), rate-limit every ``rate_limit_every``-th operation with
+    error 613 and leave every ``null_every``-th operation unexecuted as null.
+    """
+
+    def __init__(self, host: str = "127.0.0.1", port: int = 0, delay: float = 0.0,
+                 throttle_requests: int = 0, fail_requests: int = 0, stall_requests: int = 0,
+                 stall_seconds: float = 2.0, rate_limit_every: int = 0, null_every: int = 0):
+        self.delay = delay
+        self.throttle_requests = throttle_requests
+        self.fail_requests = fail_requests
+        self.stall_requests = stall_requests
+        self.stall_seconds = stall_seconds
+        self.rate_limit_every = rate_limit_every
+        self.null_every = null_every
+        self.faults_injected = 0
+        self.request_count = 0
+        self.operation_count = 0
+        self.posts: Dict[str, int] = {}
+        self._lock = threading.Lock()
+        self._server = ThreadingHTTPServer((host, port), _StubHandler)
+        self._server.daemon_threads = True
+        self._server.stub = self
+        self._thread: Optional[threading.Thread] = None
+
+    @property
+    def host(self) -> str:
+        return self._server.server_address[0]
+
+    @property
+    def port(self) -> int:
+        return self._server.server_address[1]
+
+    @property
+    def post_count(self) -> int:
+        with self._lock:
+            return sum(self.posts.values())
+
+    def double_posted(self) -> List[str]:
+        """Groups that received the same campaign more than once"""
+        with self._lock:
+            return [group_id for group_id, count in self.posts.items() if count > 1]
+
+    def facebook_config(self, group_ids: List[str], **overrides) -> dict:
+        """Facebook platform settings that point a client at this stub"""
+        facebook_config = {
+            "enabled": True,
+            "access_token": "stub",
+            "base_url": f"http://{self.host}:{self.port}",
+            "api_version": "v19.0",
+            "group_ids": list(group_ids),
+        }
+        facebook_config.update(overrides)
+        return facebook_config
+
+    def start(self) -> "GraphStub":
+        self._thread = threading.Thread(target=self._server.serve_forever, daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self._server.shutdown()
+        self._server.server_close()
+        if self._thread:
+            self._thread.join()
+
+    def __enter__(self) -> "GraphStub":
+        return self.start()
+
+    def __exit__(self, *exc_info):
+        self.stop()
+
+    def _request_received(self) -> int:
+        with self._lock:
+            self.request_count += 1
+            return self.request_count
+
+    def _fault(self):
+        with self._lock:
+            self.faults_injected += 1
+
+    def _operation(self, operation: dict) -> Optional[dict]:
+        """Run one batch operation, returning its response item"""
+        with self._lock:
+            self.operation_count += 1
+            count = self.operation_count
+            if self.null_every and count % self.null_every == 0:
+                self.faults_injected += 1
+                return None
+            if self.rate_limit_every and count % self.rate_limit_every == 0:
+                self.faults_injected += 1
+                error = {"error": {"message": "Rate limit reached for this group", "code": 613}}
+                return {"code": 400, "body": json.dumps(error)}
+            group_id = str(operation.get("relative_url", "")).partition("/")[0]
+            self.posts[group_id] = self.posts.get(group_id, 0) + 1
+            post_id = f"{group_id}_{self.posts[group_id]}"
+        return {"code": 200, "body": json.dumps({"id": post_id})}
+
+
+if __name__ == "__main__":
+    stub = GraphStub(port=8090)
+    print(f"Graph stub listening on http://{stub.host}:{stub.port} (Ctrl+C to stop)")
+    stub.start()
+    try:
+        while True:
+            time.sleep(5)
+            print(f"Received {stub.request_count} batches, {stub.post_count} posts")
+    except KeyboardInterrupt:
+        stub.stop()
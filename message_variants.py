@@ -0,0 +1,119 @@
+"""
+Message variants for Senior Advertising Bot
+Renders every advertising message template once per configuration and
+assigns each recipient a variant from a hash of their address, so anyone
+can tell later which wording a person received
+"""
+
+import hashlib
+import json
+import random
+import threading
+from dataclasses import dataclass
+from typing import Dict, Tuple
+
+# Config fields the templates are built from; changing any makes a new set
+VARIANT_FIELDS = ("business_name", "target_message", "contact_info")
+
+# Keeps assignment independent of other address hashes, such as campaign shards
+ASSIGNMENT_PERSON = b"senior-variant"
+
+
+@dataclass(frozen=True)
+class MessageVariant:
+    """One rendered wording of the advertising message"""
+    id: str
+    text: str
+
+
+def variant_key(business_name: str, target_message: str, contact_info: str) -> str:
+    """Hash of the config fields a variant set is rendered from"""
+    fields = json.dumps([business_name, target_message, contact_info], ensure_ascii=False)
+    return hashlib.sha256(fields.encode("utf-8")).hexdigest()[:16]
+
+
+def render_variants(business_name: str, target_message: str, contact_info: str) -> Tuple[MessageVariant, ...]:
+    """Every message template filled in with the business details"""
+    templates = [
+        ("welcome",
+         f"🌟 {business_name} - {target_message}\n\n"
+         f"We understand the importance of clear communication and reliable service.\n"
+         f"{contact_info}\n\n"
+         f"Feel free to call or email with any questions!"),
+
+        ("hello",
+         f"Hello! 👋 {business_name} here.\n\n"
+         f"{target_message}\n\n"
+         f"We believe in taking time to explain everything clearly.\n"
+         f"{contact_info}\n\n"
+         f"Looking forward to helping you!"),
+
+        ("good_day",
+         f"Good day! ☀️\n\n"
+         f"{business_name} specializes in {target_message}\n\n"
+         f"• Clear explanations\n• Patient service\n• Fair pricing\n\n"
+         f"{contact_info}"),
+    ]
+    return tuple(MessageVariant(name, text) for name, text in templates)
+
+
+class VariantSet:
+    """The variants rendered for one configuration, identified by ``key``"""
+
+    def __init__(self, key: str, variants: Tuple[MessageVariant, ...]):
+        if not variants:
+            raise ValueError("A variant set needs at least one variant")
+        self.key = key
+        self.variants = variants
+        self.by_id: Dict[str, MessageVariant] = {variant.id: variant for variant in variants}
+
+    def assign(self, address: str) -> MessageVariant:
+        """Variant for one recipient; the same address always gets the same one"""
+        if len(self.variants) == 1:
+            return self.variants[0]
+        digest = hashlib.blake2b(address.strip().lower().encode("utf-8"), digest_size=8,
+                                 person=ASSIGNMENT_PERSON).digest()
+        return self.variants[int.from_bytes(digest, "big") % len(self.variants)]
+
+    def describe(self) -> str:
+        """Set key, assignment salt and a digest of each variant's text: enough to
+        work out later which wording any address received"""
+        digests = ", ".join(
+            f"{variant.id}={hashlib.sha256(variant.text.encode('utf-8')).hexdigest()[:12]}" for variant in self.variants
+        )
+        return f"variant set {self.key}, salt {ASSIGNMENT_PERSON.decode('ascii')}: {digests}"
+
+    def choose(self) -> MessageVariant:
+        """Any variant, for posts that go to everyone at once"""
+        return random.choice(self.variants)
+
+    def __len__(self) -> int:
+        return len(self.variants)
+
+
+class VariantCache:
+    """Variant sets by config hash, so templates are rendered once per configuration"""
+
+    def __init__(self, max_entries: int = 8):
+        self.max_entries = max_entries
+        self._sets: Dict[str, VariantSet] = {}
+        self._lock = threading.Lock()
+
+    def get(self, business_name: str, target_message: str, contact_info: str) -> VariantSet:
+        key = variant_key(business_name, target_message, contact_info)
+        variant_set = self._sets.get(key)
+        if variant_set is None:
+            variant_set = VariantSet(key, render_variants(business_name, target_message, contact_info))
+            with self._lock:
+                if len(self._sets) >= self.max_entries:
+                    # Old configurations are not coming back often; drop the oldest
+                    self._sets.pop(next(iter(self._sets)))
+                variant_set = self._sets.setdefault(key, variant_set)
+        return variant_set
+
+    def for_config(self, config: dict) -> VariantSet:
+        return self.get(*(config.get(field, "") for field in VARIANT_FIELDS))
+
+
+VARIANTS = VariantCache()
+
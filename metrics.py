@@ -0,0 +1,359 @@
+"""
+Metrics for Senior Advertising Bot
+Counters and latency histograms for each send stage, exported in Prometheus
+text format to a file or a local HTTP endpoint
+"""
+
+import logging
+import os
+import tempfile
+import threading
+import time
+from bisect import bisect_left
+from contextlib import contextmanager
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Dict, Iterator, List, Optional, Sequence, Tuple
+
+# Seconds; spans a spliced render (tens of microseconds) up to a slow platform
+DEFAULT_BUCKETS = (
+    0.00001, 0.000025, 0.00005, 0.0001, 0.00025, 0.0005, 0.001, 0.0025, 0.005,
+    0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0, 300.0,
+)
+
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+
+def _escape(value: str) -> str:
+    return value.replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _format_value(value: float) -> str:
+    if value == float("inf"):
+        return "+Inf"
+    return repr(float(value)) if isinstance(value, float) and not value.is_integer() else str(int(value))
+
+
+class CounterValue:
+    """One labelled series of a counter"""
+    __slots__ = ("value", "_lock")
+
+    def __init__(self):
+        self.value = 0.0
+        self._lock = threading.Lock()
+
+    def inc(self, amount: float = 1.0):
+        with self._lock:
+            self.value += amount
+
+    def state(self) -> float:
+        with self._lock:
+            return self.value
+
+    def merge(self, state: float):
+        self.inc(state)
+
+    @staticmethod
+    def difference(state: float, earlier: float) -> float:
+        return state - earlier
+
+
+class HistogramValue:
+    """One labelled series of a histogram"""
+    __slots__ = ("buckets", "counts", "sum", "count", "_lock")
+
+    def __init__(self, buckets: Sequence[float]):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)
+        self.sum = 0.0
+        self.count = 0
+        self._lock = threading.Lock()
+
+    def observe(self, value: float):
+        index = bisect_left(self.buckets, value)
+        with self._lock:
+            self.counts[index] += 1
+            self.sum += value
+            self.count += 1
+
+    def state(self) -> Tuple[List[int], float, int]:
+        with self._lock:
+            return list(self.counts), self.sum, self.count
+
+    def merge(self, state: Tuple[List[int], float, int]):
+        counts, total, count = state
+        with self._lock:
+            for index, bucket_count in enumerate(counts):
+                self.counts[index] += bucket_count
+            self.sum += total
+            self.count += count
+
+    @staticmethod
+    def difference(state: Tuple[List[int], float, int],
+                   earlier: Tuple[List[int], float, int]) -> Tuple[List[int], float, int]:
+        return [now - then for now, then in zip(state[0], earlier[0])], state[1] - earlier[1], state[2] - earlier[2]
+
+    @contextmanager
+    def time(self) -> Iterator[None]:
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - started)
+
+    def quantile(self, q: float) -> float:
+        """Upper bucket bound below which ``q`` of the observations fall"""
+        target = q * self.count
+        seen = 0
+        for bound, count in zip(self.buckets, self.counts):
+            seen += count
+            if count and seen >= target:
+                return bound
+        return float("inf") if self.count else 0.0
+
+
+class Metric:
+    """A named metric with zero or more label dimensions
+
+    ``labels`` returns the series for one set of label values and caches it,
+    so hot paths should bind the series once and reuse it. A metric without
+    labels forwards ``inc``/``observe``/``time`` to its single series.
+    """
+
+    kind = ""
+
+    def __init__(self, name: str, help_text: str, labelnames: Sequence[str] = ()):
+        self.name = name
+        self.help = help_text
+        self.labelnames = tuple(labelnames)
+        self._series: Dict[Tuple[str, ...], object] = {}
+        self._lock = threading.Lock()
+
+    def _new_series(self):
+        raise NotImplementedError
+
+    def labels(self, *values: str, **named: str):
+        if named:
+            values = tuple(named[name] for name in self.labelnames)
+        key = tuple(str(value) for value in values)
+        if len(key) != len(self.labelnames):
+            raise ValueError(f"{self.name} expects labels {self.labelnames}, got {key}")
+        series = self._series.get(key)
+        if series is None:
+            with self._lock:
+                series = self._series.setdefault(key, self._new_series())
+        return series
+
+    def series(self) -> List[Tuple[Tuple[str, ...], object]]:
+        with self._lock:
+            return list(self._series.items())
+
+    def snapshot(self, since: Optional[dict] = None) -> dict:
+        """Picklable state of every series, less what the earlier snapshot ``since`` held
+
+        Worker processes hand these back so the parent can ``merge`` them.
+        """
+        states = {}
+        for values, series in self.series():
+            state = series.state()
+            if since and values in since:
+                state = series.difference(state, since[values])
+            states[values] = state
+        return states
+
+    def merge(self, snapshot: dict):
+        """Add the series of a snapshot taken in another process"""
+        for values, state in snapshot.items():
+            self.labels(*values).merge(state)
+
+    def _label_text(self, values: Tuple[str, ...], extra: Tuple[Tuple[str, str], ...] = ()) -> str:
+        pairs = list(zip(self.labelnames, values)) + list(extra)
+        if not pairs:
+            return ""
+        return "{" + ",".join(f'{name}="{_escape(value)}"' for name, value in pairs) + "}"
+
+
+class Counter(Metric):
+    kind = "counter"
+
+    def _new_series(self) -> CounterValue:
+        return CounterValue()
+
+    def inc(self, amount: float = 1.0):
+        self.labels().inc(amount)
+
+    def render(self) -> List[str]:
+        return [
+            f"{self.name}{self._label_text(values)} {_format_value(series.value)}"
+            for values, series in self.series()
+        ]
+
+
+class Histogram(Metric):
+    kind = "histogram"
+
+    def __init__(self, name: str, help_text: str, labelnames: Sequence[str] = (),
+                 buckets: Sequence[float] = DEFAULT_BUCKETS):
+        super().__init__(name, help_text, labelnames)
+        self.buckets = tuple(sorted(buckets))
+
+    def _new_series(self) -> HistogramValue:
+        return HistogramValue(self.buckets)
+
+    def observe(self, value: float):
+        self.labels().observe(value)
+
+    def time(self):
+        return self.labels().time()
+
+    def render(self) -> List[str]:
+        lines = []
+        for values, series in self.series():
+            with series._lock:
+                counts, total, count = list(series.counts), series.sum, series.count
+            cumulative = 0
+            for bound, bucket_count in zip(self.buckets + (float("inf"),), counts):
+                cumulative += bucket_count
+                le = (("le", _format_value(bound)),)
+                lines.append(f"{self.name}_bucket{self._label_text(values, le)} {cumulative}")
+            lines.append(f"{self.name}_sum{self._label_text(values)} {_format_value(total)}")
+            lines.append(f"{self.name}_count{self._label_text(values)} {count}")
+        return lines
+
+
+class MetricsRegistry:
+    def __init__(self):
+        self._metrics: Dict[str, Metric] = {}
+        self._lock = threading.Lock()
+
+    def _register(self, metric: Metric) -> Metric:
+        with self._lock:
+            existing = self._metrics.get(metric.name)
+            if existing is not None:
+                if type(existing) is not type(metric) or existing.labelnames != metric.labelnames:
+                    raise ValueError(f"Metric {metric.name} already registered with a different shape")
+                return existing
+            self._metrics[metric.name] = metric
+            return metric
+
+    def counter(self, name: str, help_text: str, labelnames: Sequence[str] = ()) -> Counter:
+        return self._register(Counter(name, help_text, labelnames))
+
+    def histogram(self, name: str, help_text: str, labelnames: Sequence[str] = (),
+                  buckets: Sequence[float] = DEFAULT_BUCKETS) -> Histogram:
+        return self._register(Histogram(name, help_text, labelnames, buckets))
+
+    def get(self, name: str) -> Optional[Metric]:
+        return self._metrics.get(name)
+
+    def render(self) -> str:
+        """Every metric in Prometheus text exposition format"""
+        lines = []
+        with self._lock:
+            metrics = sorted(self._metrics.values(), key=lambda metric: metric.name)
+        for metric in metrics:
+            lines.append(f"# HELP {metric.name} {metric.help}")
+            lines.append(f"# TYPE {metric.name} {metric.kind}")
+            lines.extend(metric.render())
+        return "\n".join(lines) + "\n"
+
+    def write_textfile(self, path: str):
+        """Atomically replace ``path`` with the current metrics (for textfile collectors)"""
+        directory = os.path.dirname(os.path.abspath(path))
+        fd, tmp_path = tempfile.mkstemp(dir=directory, prefix=".metrics-")
+        try:
+            with os.fdopen(fd, "w") as f:
+                f.write(self.render())
+            os.replace(tmp_path, path)
+        except Exception:
+            os.unlink(tmp_path)
+            raise
+
+
+REGISTRY = MetricsRegistry()
+
+
+class MetricsServer:
+    """Serves ``/metrics`` from a registry on a background thread"""
+
+    def __init__(self, registry: MetricsRegistry = REGISTRY, host: str = "127.0.0.1", port: int = 9108):
+        self.registry = registry
+        self.logger = logging.getLogger(__name__)
+        registry_ref = registry
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                if self.path.split("?")[0] not in ("/", "/metrics"):
+                    self.send_error(404)
+                    return
+                body = registry_ref.render().encode("utf-8")
+                self.send_response(200)
+                self.send_header("Content-Type", CONTENT_TYPE)
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, *args):
+                pass
+
+        self.server = ThreadingHTTPServer((host, port), Handler)
+        self.server.daemon_threads = True
+        self.host, self.port = self.server.server_address[:2]
+        self._thread: Optional[threading.Thread] = None
+
+    def start(self) -> "MetricsServer":
+        self._thread = threading.Thread(target=self.server.serve_forever, name="metrics", daemon=True)
+        self._thread.start()
+        self.logger.info(f"Serving metrics on http://{self.host}:{self.port}/metrics")
+        return self
+
+    def stop(self):
+        self.server.shutdown()
+        self.server.server_close()
+
+
+# Stage metrics shared by the send path and the advertising cycle
+RENDER_SECONDS = REGISTRY.histogram(
+    "campaign_render_seconds", "Time to produce one message, by path", ["path"]
+)
+SERIALIZE_SECONDS = REGISTRY.histogram(
+    "campaign_serialize_seconds", "Time to flatten a MIME message to wire bytes"
+)
+SIGN_SECONDS = REGISTRY.histogram(
+    "campaign_dkim_sign_seconds", "Time to sign the headers of one message"
+)
+SMTP_CONNECT_SECONDS = REGISTRY.histogram(
+    "smtp_connect_seconds", "Time to open an SMTP connection, including STARTTLS"
+)
+SMTP_LOGIN_SECONDS = REGISTRY.histogram(
+    "smtp_login_seconds", "Time to authenticate an SMTP connection"
+)
+SMTP_CONNECTIONS = REGISTRY.counter(
+    "smtp_connections_total", "SMTP connections opened, by outcome", ["result"]
+)
+SEND_SECONDS = REGISTRY.histogram(
+    "campaign_send_seconds", "Time for the SMTP transaction of one message"
+)
+MESSAGES = REGISTRY.counter(
+    "campaign_messages_total", "Campaign messages by outcome", ["result"]
+)
+RETRIES = REGISTRY.counter(
+    "campaign_retries_total", "Messages scheduled for another attempt after a transient failure"
+)
+PLATFORM_SECONDS = REGISTRY.histogram(
+    "platform_seconds", "Time each platform took in an advertising cycle", ["platform"]
+)
+PLATFORM_RUNS = REGISTRY.counter(
+    "platform_runs_total", "Platform runs in advertising cycles, by status", ["platform", "status"]
+)
+CYCLES = REGISTRY.counter(
+    "advertising_cycles_total", "Advertising cycles run"
+)
+COMMUNITY_SECONDS = REGISTRY.histogram(
+    "community_post_seconds", "Time to post to one community site, by host", ["host"]
+)
+COMMUNITY_POSTS = REGISTRY.counter(
+    "community_posts_total", "Community site posts by host and outcome", ["host", "result"]
+)
+COMMUNITY_BREAKER_CHANGES = REGISTRY.counter(
+    "community_breaker_changes_total", "Circuit breaker state changes, by host and new state", ["host", "state"]
+)
@@ -0,0 +1,117 @@
+"""
+Platform fan-out for Senior Advertising Bot
+Runs the enabled platforms of an advertising cycle concurrently, each with
+its own timeout and cancellation, and reports how long every one took
+"""
+
+import logging
+import threading
+import time
+from dataclasses import dataclass, field
+from typing import Any, Callable, List, Optional
+
+from metrics import PLATFORM_RUNS, PLATFORM_SECONDS
+
+OK = "ok"
+ERROR = "error"
+TIMEOUT = "timeout"
+DISABLED = "disabled"
+
+
+@dataclass
+class PlatformTask:
+    """One platform's work for a cycle; ``run`` receives a cancellation event"""
+    name: str
+    run: Callable[[threading.Event], Any]
+    timeout: float = 600.0
+    enabled: bool = True
+
+
+@dataclass
+class PlatformResult:
+    name: str
+    status: str
+    elapsed: float = 0.0
+    value: Any = None
+    error: Optional[str] = None
+
+
+@dataclass
+class CycleReport:
+    """Aggregated timing for one advertising cycle"""
+    results: List[PlatformResult] = field(default_factory=list)
+    elapsed: float = 0.0
+
+    def result(self, name: str) -> Optional[PlatformResult]:
+        return next((result for result in self.results if result.name == name), None)
+
+    def summary(self) -> str:
+        parts = [f"{result.name}={result.status} ({result.elapsed:.2f}s)" for result in self.results]
+        return f"Cycle took {self.elapsed:.2f}s: " + ", ".join(parts)
+
+
+class _Running:
+    def __init__(self, task: PlatformTask):
+        self.task = task
+        self.cancel = threading.Event()
+        self.done = threading.Event()
+        self.started = time.perf_counter()
+        self.finished = self.started
+        self.value = None
+        self.error: Optional[BaseException] = None
+
+
+class PlatformFanout:
+    def __init__(self):
+        self.logger = logging.getLogger(__name__)
+
+    def _start(self, running: _Running):
+        def target():
+            try:
+                running.value = running.task.run(running.cancel)
+            except BaseException as e:
+                running.error = e
+            finally:
+                running.finished = time.perf_counter()
+                running.done.set()
+
+        # Daemon threads: a platform stuck past its timeout can't block shutdown
+        threading.Thread(target=target, name=f"platform-{running.task.name}", daemon=True).start()
+
+    def run(self, tasks: List[PlatformTask]) -> CycleReport:
+        """Run all enabled tasks at once and wait for each up to its own timeout
+
+        A task that overruns is signalled through its cancellation event and
+        reported as timed out; the cycle does not wait for it any further.
+        """
+        started = time.perf_counter()
+        running = [_Running(task) for task in tasks if task.enabled]
+        for item in running:
+            self._start(item)
+
+        results = {}
+        for item in running:
+            remaining = item.started + item.task.timeout - time.perf_counter()
+            if item.done.wait(max(0.0, remaining)):
+                elapsed = item.finished - item.started
+                if item.error is not None:
+                    self.logger.error(f"{item.task.name} failed: {item.error}")
+                    results[item.task.name] = PlatformResult(item.task.name, ERROR, elapsed, error=str(item.error))
+                else:
+                    results[item.task.name] = PlatformResult(item.task.name, OK, elapsed, item.value)
+            else:
+                item.cancel.set()
+                self.logger.warning(f"{item.task.name} timed out after {item.task.timeout}s, cancelling")
+                results[item.task.name] = PlatformResult(
+                    item.task.name, TIMEOUT, time.perf_counter() - item.started,
+                    error=f"timed out after {item.task.timeout}s"
+                )
+
+        report = CycleReport(elapsed=time.perf_counter() - started)
+        for task in tasks:
+            result = results.get(task.name) or PlatformResult(task.name, DISABLED)
+            report.results.append(result)
+            PLATFORM_RUNS.labels(task.name, result.status).inc()
+            if result.status != DISABLED:
+                PLATFORM_SECONDS.labels(task.name).observe(result.elapsed)
+        return report
@@ -0,0 +1,224 @@
+"""
+Rate scheduler for Senior Advertising Bot
+Per-domain and global token buckets that interleave recipients across mail
+providers so sends stay inside each provider's limits
+"""
+
+import time
+from collections import deque
+from typing import Callable, Deque, Dict, Iterable, Iterator, Optional, Tuple, TypeVar
+
+T = TypeVar("T")
+
+# Slack for float rounding so a refill that lands just short of a token counts
+EPSILON = 1e-9
+
+
+def recipient_domain(address: str) -> str:
+    """Mail provider domain of an address ("" when there is none)"""
+    return address.rpartition("@")[2].strip().rstrip(">").lower()
+
+
+class TokenBucket:
+    """Classic token bucket: ``rate`` tokens per second, holding up to ``capacity``"""
+
+    def __init__(self, rate: float, capacity: Optional[float] = None, clock: Callable[[], float] = time.monotonic):
+        if rate <= 0:
+            raise ValueError("Token bucket rate must be positive")
+        self.rate = rate
+        self.capacity = capacity if capacity is not None else max(1.0, rate)
+        self.clock = clock
+        self.tokens = self.capacity
+        self.updated = clock()
+
+    def _refill(self, now: float):
+        if now > self.updated:
+            self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+            self.updated = now
+
+    def wait_time(self, now: Optional[float] = None) -> float:
+        """Seconds until one token is available"""
+        self._refill(self.clock() if now is None else now)
+        return 0.0 if self.tokens >= 1 - EPSILON else (1 - self.tokens) / self.rate
+
+    def take(self, now: Optional[float] = None) -> bool:
+        """Spend one token if available"""
+        self._refill(self.clock() if now is None else now)
+        if self.tokens >= 1 - EPSILON:
+            self.tokens = max(0.0, self.tokens - 1)
+            return True
+        return False
+
+
+class _DomainQueue:
+    __slots__ = ("bucket", "items", "sent", "wait_total", "wait_max")
+
+    def __init__(self, bucket: TokenBucket):
+        self.bucket = bucket
+        self.items: Deque[Tuple[object, float]] = deque()
+        self.sent = 0
+        self.wait_total = 0.0
+        self.wait_max = 0.0
+
+
+class DomainRateScheduler:
+    """Queues messages by recipient domain and releases them round-robin
+
+    A message leaves the scheduler only when both its domain's bucket and the
+    global bucket have a token, so one busy provider never blocks the others
+    and total throughput stays at the global limit while enough domains have
+    work queued. ``clock`` and ``sleep`` are injectable for tests.
+    """
+
+    def __init__(
+        self,
+        global_rate: float,
+        domain_rate: float,
+        domain_rates: Optional[Dict[str, float]] = None,
+        lookahead: int = 5000,
+        clock: Callable[[], float] = time.monotonic,
+        sleep: Callable[[float], None] = time.sleep,
+    ):
+        self.clock = clock
+        self.sleep = sleep
+        self.domain_rate = domain_rate
+        self.domain_rates = {domain.lower(): rate for domain, rate in (domain_rates or {}).items()}
+        self.lookahead = max(1, lookahead)
+        self.global_bucket = TokenBucket(global_rate, clock=clock)
+        self.domains: Dict[str, _DomainQueue] = {}
+        self.ready: Deque[str] = deque()  # domains with queued items, in service order
+        self.depth = 0
+        self.max_depth = 0
+        self.throttled_seconds = 0.0
+
+    @classmethod
+    def from_config(cls, config: dict, **kwargs) -> Optional["DomainRateScheduler"]:
+        """Scheduler from the compliance section, or None when rate limits are off"""
+        compliance = config.get('compliance', {})
+        if not compliance.get('respect_rate_limits'):
+            return None
+        limits = compliance.get('rate_limits', {})
+        return cls(
+            global_rate=limits.get('global_per_minute', 600) / 60,
+            domain_rate=limits.get('per_domain_per_minute', 120) / 60,
+            domain_rates={domain: per_minute / 60 for domain, per_minute in limits.get('domains', {}).items()},
+            lookahead=limits.get('lookahead', 5000),
+            **kwargs
+        )
+
+    def _queue(self, domain: str) -> _DomainQueue:
+        queue = self.domains.get(domain)
+        if queue is None:
+            rate = self.domain_rates.get(domain, self.domain_rate)
+            queue = self.domains[domain] = _DomainQueue(TokenBucket(rate, clock=self.clock))
+        return queue
+
+    def push(self, item: T, address: str):
+        """Queue an item for the domain of ``address``"""
+        domain = recipient_domain(address)
+        queue = self._queue(domain)
+        if not queue.items:
+            self.ready.append(domain)
+        queue.items.append((item, self.clock()))
+        self.depth += 1
+        self.max_depth = max(self.max_depth, self.depth)
+
+    def pop(self) -> Optional[T]:
+        """Next item allowed to go out now, or None if every queue is throttled"""
+        if not self.depth:
+            return None
+        now = self.clock()
+        if self.global_bucket.wait_time(now) > 0:
+            return None
+
+        for _ in range(len(self.ready)):
+            domain = self.ready.popleft()
+            queue = self.domains[domain]
+            if not queue.bucket.take(now):
+                self.ready.append(domain)
+                continue
+
+            self.global_bucket.take(now)
+            item, queued_at = queue.items.popleft()
+            if queue.items:
+                self.ready.append(domain)
+            self.depth -= 1
+            waited = now - queued_at
+            queue.sent += 1
+            queue.wait_total += waited
+            queue.wait_max = max(queue.wait_max, waited)
+            return item
+        return None
+
+    def next_ready_in(self) -> float:
+        """Seconds until ``pop`` could return an item"""
+        if not self.depth:
+            return 0.0
+        now = self.clock()
+        domain_wait = min(self.domains[domain].bucket.wait_time(now) for domain in self.ready)
+        return max(self.global_bucket.wait_time(now), domain_wait)
+
+    def get(self) -> T:
+        """Block (via ``sleep``) until an item may go out; the scheduler must not be empty"""
+        while True:
+            item = self.pop()
+            if item is not None:
+                return item
+            wait = self.next_ready_in()
+            self.throttled_seconds += wait
+            self.sleep(wait)
+
+    def acquire(self, address: str):
+        """Block (via ``sleep``) until one more message to ``address`` may go out
+
+        For messages that do not pass through ``schedule``, such as retries,
+        so they spend tokens from the same domain and global buckets.
+        """
+        bucket = self._queue(recipient_domain(address)).bucket
+        while True:
+            now = self.clock()
+            wait = max(self.global_bucket.wait_time(now), bucket.wait_time(now))
+            if wait <= 0:
+                bucket.take(now)
+                self.global_bucket.take(now)
+                return
+            self.throttled_seconds += wait
+            self.sleep(wait)
+
+    def schedule(self, items: Iterable[Tuple[T, str]]) -> Iterator[T]:
+        """Rate-limited, domain-interleaved stream of ``(item, address)`` pairs
+
+        Reads at most ``lookahead`` items ahead of what has been released.
+        """
+        for item, address in items:
+            self.push(item, address)
+            while self.depth >= self.lookahead:
+                yield self.get()
+            released = self.pop()
+            while released is not None:
+                yield released
+                released = self.pop()
+        while self.depth:
+            yield self.get()
+
+    def stats(self) -> dict:
+        """Queue depth and wait times, overall and per domain"""
+        sent = sum(queue.sent for queue in self.domains.values())
+        wait_total = sum(queue.wait_total for queue in self.domains.values())
+        return {
+            "queue_depth": self.depth,
+            "max_queue_depth": self.max_depth,
+            "sent": sent,
+            "throttled_seconds": round(self.throttled_seconds, 3),
+            "avg_wait_seconds": round(wait_total / sent, 3) if sent else 0.0,
+            "max_wait_seconds": round(max((q.wait_max for q in self.domains.values()), default=0.0), 3),
+            "domains": {
+                domain: {
+                    "queued": len(queue.items),
+                    "sent": queue.sent,
+                    "avg_wait_seconds": round(queue.wait_total / queue.sent, 3) if queue.sent else 0.0,
+                    "max_wait_seconds": round(queue.wait_max, 3),
+                }
+                for domain, queue in self.domains.items()
+            },
+        }
@@ -0,0 +1,306 @@
+"""
+Recipient parsing for Senior Advertising Bot
+Parses, validates, lowercases and dedupes recipient entries a chunk at a time
+before they reach the send loop, and reports every rejected row
+"""
+
+import csv
+import logging
+import os
+import re
+import sqlite3
+import tempfile
+import time
+from dataclasses import dataclass
+from email.utils import getaddresses, parseaddr
+from itertools import islice
+from typing import Dict, Iterable, Iterator, List, NamedTuple, Optional, Tuple, Union
+
+from recipient_sources import DEFAULT_CHUNK_SIZE
+
+# Entries containing any of these need the full RFC 5322 parser
+COMPLEX_CHARS = frozenset('"(),;\\')
+
+# Dot-atom local part: printable ASCII without specials; dots are checked separately
+LOCAL_PART = re.compile(r"[!#$%&'*+/=?^`{|}~a-z0-9._-]{1,64}")
+# One ASCII domain label: letters or digits at both ends, hyphens inside
+DOMAIN = re.compile(r"(?:[a-z0-9](?:[a-z0-9-]{0,61}[a-z0-9])?\.)+[a-z0-9](?:[a-z0-9-]{0,61}[a-z0-9])?")
+MAX_ADDRESS_LENGTH = 254
+# Lists repeat a few thousand domains at most, so each is checked once
+DOMAIN_CACHE_SIZE = 100000
+
+# Addresses per lookup, under SQLite's limit on bound parameters
+QUERY_BATCH = 500
+
+INDEX_SCHEMA = """
+CREATE TABLE IF NOT EXISTS seen_addresses (
+    scope TEXT NOT NULL,
+    address TEXT NOT NULL,
+    row INTEGER NOT NULL,
+    PRIMARY KEY (scope, address)
+) WITHOUT ROWID;
+"""
+
+MISSING = "no address"
+MULTIPLE = "more than one address"
+INVALID = "invalid address"
+DUPLICATE = "duplicate"
+
+
+class Recipient(NamedTuple):
+    """A parsed recipient: display name (possibly empty) and lowercased address"""
+    name: str
+    address: str
+
+    def __str__(self) -> str:
+        # Recipient entry format, quoting names that would not parse back unquoted
+        if not self.name:
+            return self.address
+        if COMPLEX_CHARS.isdisjoint(self.name) and "<" not in self.name and ">" not in self.name:
+            return f"{self.name} <{self.address}>"
+        escaped = self.name.replace("\\", "\\\\").replace('"', '\\"')
+        return f'"{escaped}" <{self.address}>'
+
+
+_domains: Dict[str, Optional[str]] = {}
+
+
+def normalize_domain(domain: str) -> Optional[str]:
+    """Lowercase ASCII form of a domain (IDNs in punycode), or None if it is not valid"""
+    try:
+        return _domains[domain]
+    except KeyError:
+        pass
+    normalized: Optional[str] = domain
+    if not domain.isascii():
+        try:
+            normalized = domain.encode("idna").decode("ascii")
+        except UnicodeError:
+            normalized = None
+    if normalized is not None and (len(normalized) > 253 or not DOMAIN.fullmatch(normalized)):
+        normalized = None
+    if len(_domains) >= DOMAIN_CACHE_SIZE:
+        _domains.clear()
+    _domains[domain] = normalized
+    return normalized
+
+
+def parse_recipient(entry: Union[str, Recipient]) -> Tuple[Optional[Recipient], Optional[str]]:
+    """(recipient, None) for a valid entry, else (None, reason)"""
+    if isinstance(entry, Recipient):
+        return entry, None
+    if COMPLEX_CHARS.isdisjoint(entry):
+        # Plain "Name <email>" or a bare address, as split_recipient does it
+        name, bracket, rest = entry.partition("<")
+        if not bracket:
+            name, email = "", entry
+        else:
+            email, closing, tail = rest.partition(">")
+            if not closing or tail.strip() or ">" in name:
+                name, email = parseaddr(entry)
+        name, email = name.strip(), email.strip()
+    else:
+        # Quoted names, comments or lists: the full parser, which also spots several addresses
+        pairs = [pair for pair in getaddresses([entry]) if pair[1]]
+        if len(pairs) > 1:
+            return None, MULTIPLE
+        name, email = pairs[0] if pairs else ("", "")
+        name, email = name.strip(), email.strip()
+    if not email:
+        return None, MISSING
+
+    local, at, domain = email.lower().rpartition("@")
+    if (not at or not LOCAL_PART.fullmatch(local)
+            or local[0] == "." or local[-1] == "." or ".." in local):
+        return None, INVALID
+    domain = normalize_domain(domain)
+    if domain is None:
+        return None, INVALID
+    address = f"{local}@{domain}"
+    if len(address) > MAX_ADDRESS_LENGTH:
+        return None, INVALID
+    return Recipient(name, address), None
+
+
+@dataclass
+class ParseSummary:
+    """Counts from parsing one recipient stream"""
+    rows: int = 0
+    accepted: int = 0
+    duplicates: int = 0
+    invalid: int = 0
+    seconds: float = 0.0
+    report_path: Optional[str] = None
+
+    @property
+    def rejected(self) -> int:
+        return self.duplicates + self.invalid
+
+
+def _last_reported_row(path: str) -> int:
+    """Row number of the last entry in a rejected-rows report, 0 if there is none"""
+    with open(path, "rb") as f:
+        f.seek(0, os.SEEK_END)
+        f.seek(max(0, f.tell() - 4096))
+        tail = f.read().decode("utf-8", "replace").splitlines()
+    for line in reversed(tail):
+        try:
+            return int(next(csv.reader([line]))[0])
+        except (ValueError, IndexError, StopIteration):
+            continue
+    return 0
+
+
+class AddressIndex:
+    """Addresses already read from a recipient stream, kept in SQLite
+
+    Each address maps to the first row it was read from, so a row read
+    again after a restart is not mistaken for a duplicate of itself. Memory
+    stays bounded by SQLite's page cache however long the list is. Without
+    a ``path`` the index lives in a temporary file removed on close.
+    """
+
+    def __init__(self, path: Optional[str] = None, scope: str = ""):
+        self.scope = scope
+        self.temporary = path is None
+        if path is None:
+            fd, path = tempfile.mkstemp(prefix="recipients-", suffix=".db")
+            os.close(fd)
+        self.path = path
+        self.conn = sqlite3.connect(path, timeout=30)
+        if self.temporary:
+            self.conn.execute("PRAGMA journal_mode=OFF")
+            self.conn.execute("PRAGMA synchronous=OFF")
+        else:
+            self.conn.execute("PRAGMA journal_mode=WAL")
+            self.conn.execute("PRAGMA synchronous=NORMAL")
+        self.conn.executescript(INDEX_SCHEMA)
+
+    def close(self):
+        self.conn.close()
+        if self.temporary:
+            os.unlink(self.path)
+
+    def first_rows(self, entries: List[Tuple[str, int]]) -> Dict[str, int]:
+        """Record ``(address, row)`` pairs and return the first row of each address"""
+        before = self.conn.total_changes
+        with self.conn:
+            self.conn.executemany(
+                "INSERT OR IGNORE INTO seen_addresses (scope, address, row) VALUES (?, ?, ?)",
+                [(self.scope, address, row) for address, row in entries]
+            )
+        if self.conn.total_changes - before == len(entries):
+            # All new, the usual case: no need to look anything up
+            return dict(entries)
+        addresses = list({address for address, _ in entries})
+        first: Dict[str, int] = {}
+        for start in range(0, len(addresses), QUERY_BATCH):
+            batch = addresses[start:start + QUERY_BATCH]
+            cursor = self.conn.execute(
+                f"SELECT address, row FROM seen_addresses WHERE scope = ? "
+                f"AND address IN ({', '.join('?' * len(batch))})", (self.scope, *batch)
+            )
+            first.update(cursor.fetchall())
+        return first
+
+
+class RecipientParser:
+    """Turns recipient entries into deduplicated Recipient pairs
+
+    Entries are read and parsed ``chunk_size`` at a time and addresses are
+    deduplicated against an on-disk AddressIndex, so any stream is handled
+    in constant memory. Rejected rows (1-based) go to ``report_path`` as CSV
+    with their reason. Entries that are already Recipient pairs pass
+    through unchecked.
+    """
+
+    def __init__(self, dedupe: bool = True, report_path: Optional[str] = None,
+                 chunk_size: int = DEFAULT_CHUNK_SIZE):
+        self.dedupe = dedupe
+        self.report_path = report_path
+        self.chunk_size = max(1, chunk_size)
+        self.logger = logging.getLogger(__name__)
+        self.summary = ParseSummary(report_path=report_path)
+
+    @classmethod
+    def from_config(cls, email_config: dict) -> "RecipientParser":
+        return cls(
+            dedupe=email_config.get('dedupe_recipients', True),
+            report_path=email_config.get('rejected_report') or None,
+        )
+
+    def parse(self, entries: Iterable[Union[str, Recipient]], start: int = 0,
+              index_path: Optional[str] = None, scope: str = "") -> Iterator[Tuple[int, Recipient]]:
+        """``(row, recipient)`` for valid, first-seen entries in stream order
+
+        Rows are 0-based positions in the source, counting from ``start``
+        when ``entries`` resumes a stream part way. With ``index_path`` the
+        addresses seen are kept there under ``scope``, so a resumed stream
+        is deduplicated against the rows read before it; the rejected
+        report is then appended to. ``summary`` fills in as rows are read.
+        """
+        self.summary = ParseSummary(report_path=self.report_path)
+        return self._parse(iter(entries), self.summary, start, index_path, scope)
+
+    def _parse(self, entries: Iterator[Union[str, Recipient]], summary: ParseSummary, start: int,
+               index_path: Optional[str], scope: str) -> Iterator[Tuple[int, Recipient]]:
+        index = AddressIndex(index_path, scope) if self.dedupe else None
+        report = writer = None
+        # Rows an interrupted run already reported, as it reads ahead of what it sent
+        reported = 0
+        if self.report_path:
+            append = start > 0 and os.path.exists(self.report_path)
+            if append:
+                reported = _last_reported_row(self.report_path)
+            report = open(self.report_path, "a" if append else "w", newline="", encoding="utf-8")
+            writer = csv.writer(report)
+            if not append:
+                writer.writerow(["row", "entry", "reason"])
+
+        try:
+            while True:
+                started = time.perf_counter()
+                chunk = list(islice(entries, self.chunk_size))
+                if not chunk:
+                    break
+
+                first = start + summary.rows
+                parsed = [parse_recipient(entry) for entry in chunk]
+                if index is not None:
+                    seen = index.first_rows([
+                        (recipient.address, row)
+                        for row, (recipient, _) in enumerate(parsed, first) if recipient is not None
+                    ])
+
+                accepted = []
+                rejected = []
+                for row, entry, (recipient, reason) in zip(range(first, first + len(chunk)), chunk, parsed):
+                    if recipient is not None and index is not None and seen[recipient.address] != row:
+                        recipient, reason = None, DUPLICATE
+                    if recipient is None:
+                        rejected.append((row + 1, str(entry), reason))
+                    else:
+                        accepted.append((row, recipient))
+
+                summary.rows += len(chunk)
+                summary.accepted += len(accepted)
+                for row in rejected:
+                    if row[2] == DUPLICATE:
+                        summary.duplicates += 1
+                    else:
+                        summary.invalid += 1
+                if writer and rejected:
+                    writer.writerows(row for row in rejected if row[0] > reported)
+                summary.seconds += time.perf_counter() - started
+                yield from accepted
+        finally:
+            if index is not None:
+                index.close()
+            if report:
+                report.close()
+            if summary.rejected:
+                self.logger.info(
+                    f"Recipients parsed: {summary.accepted}/{summary.rows} accepted, "
+                    f"{summary.duplicates} duplicates, {summary.invalid} invalid"
+                    + (f" (see {self.report_path})" if self.report_path else "")
+                )
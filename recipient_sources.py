@@ -0,0 +1,222 @@
+"""
+Recipient sources for Senior Advertising Bot
+Streams mailing-list entries in chunks from config, CSV, JSONL, SQLite or Excel
+so large lists never have to be held in memory
+"""
+
+import csv
+import json
+import re
+import sqlite3
+from itertools import islice
+from typing import Iterable, Iterator, List, Optional, Tuple
+
+DEFAULT_CHUNK_SIZE = 1000
+
+# Table and column names are interpolated into SQL, so keep them to identifiers
+SQL_IDENTIFIER = re.compile(r"[A-Za-z_][A-Za-z0-9_]*")
+
+
+def format_recipient(email: str, name: Optional[str] = None) -> str:
+    """Recipient entry in the "Name <email@domain.com>" format used by config.json"""
+    email = (email or "").strip()
+    name = (name or "").strip()
+    return f"{name} <{email}>" if name else email
+
+
+class RecipientSource:
+    """Iterable of recipient entries read lazily in chunks"""
+
+    def __init__(self, chunk_size: int = DEFAULT_CHUNK_SIZE):
+        self.chunk_size = max(1, chunk_size)
+
+    def chunks(self) -> Iterator[List[str]]:
+        """Yield lists of at most ``chunk_size`` recipient entries"""
+        raise NotImplementedError
+
+    def __iter__(self) -> Iterator[str]:
+        for chunk in self.chunks():
+            yield from chunk
+
+    def resume(self, position: int) -> Iterator[str]:
+        """Entries from ``position`` onwards, for picking up an interrupted campaign"""
+        return islice(iter(self), position, None)
+
+    def entries_with_timezone(self) -> Iterator[Tuple[str, Optional[str]]]:
+        """(entry, timezone name) pairs; None when the source has no timezone data"""
+        for entry in self:
+            yield entry, None
+
+
+class _RowSource(RecipientSource):
+    """Source whose rows carry an email field and an optional name field"""
+
+    def __init__(self, path: str, email_field: str = "email", name_field: Optional[str] = "name",
+                 chunk_size: int = DEFAULT_CHUNK_SIZE, timezone_field: Optional[str] = None):
+        super().__init__(chunk_size)
+        self.path = path
+        self.email_field = email_field
+        self.name_field = name_field
+        self.timezone_field = timezone_field
+
+    def rows(self) -> Iterator[dict]:
+        raise NotImplementedError
+
+    def entry(self, row) -> Optional[str]:
+        """Recipient entry for one row, or None to skip blank rows"""
+        if isinstance(row, str):
+            return row.strip() or None
+        email = row.get(self.email_field)
+        if not email:
+            return None
+        name = row.get(self.name_field) if self.name_field else None
+        return format_recipient(str(email), str(name) if name else None)
+
+    def chunks(self) -> Iterator[List[str]]:
+        entries = (entry for entry in map(self.entry, self.rows()) if entry)
+        while True:
+            chunk = list(islice(entries, self.chunk_size))
+            if not chunk:
+                return
+            yield chunk
+
+    def entries_with_timezone(self) -> Iterator[Tuple[str, Optional[str]]]:
+        if not self.timezone_field:
+            yield from super().entries_with_timezone()
+            return
+        for row in self.rows():
+            entry = self.entry(row)
+            if entry:
+                timezone = row.get(self.timezone_field) if isinstance(row, dict) else None
+                yield entry, (str(timezone).strip() or None) if timezone else None
+
+
+class ListSource(RecipientSource):
+    """Recipients held in memory, such as config['platforms']['email']['recipients']"""
+
+    def __init__(self, recipients: Iterable[str], chunk_size: int = DEFAULT_CHUNK_SIZE):
+        super().__init__(chunk_size)
+        self.recipients = recipients
+
+    def chunks(self) -> Iterator[List[str]]:
+        entries = iter(self.recipients)
+        while True:
+            chunk = list(islice(entries, self.chunk_size))
+            if not chunk:
+                return
+            yield chunk
+
+
+class CSVSource(_RowSource):
+    """CSV file with a header row"""
+
+    def rows(self) -> Iterator[dict]:
+        with open(self.path, newline="", encoding="utf-8-sig") as f:
+            yield from csv.DictReader(f)
+
+
+class JSONLSource(_RowSource):
+    """One JSON object (or recipient string) per line"""
+
+    def rows(self) -> Iterator[dict]:
+        with open(self.path, encoding="utf-8") as f:
+            for line in f:
+                line = line.strip()
+                if line:
+                    yield json.loads(line)
+
+
+class SQLiteSource(_RowSource):
+    """Table in a SQLite database, read with fetchmany"""
+
+    def __init__(self, path: str, table: str = "recipients", email_field: str = "email",
+                 name_field: Optional[str] = "name", chunk_size: int = DEFAULT_CHUNK_SIZE,
+                 timezone_field: Optional[str] = None):
+        super().__init__(path, email_field, name_field, chunk_size, timezone_field)
+        for identifier in filter(None, (table, email_field, name_field, timezone_field)):
+            if not SQL_IDENTIFIER.fullmatch(identifier):
+                raise ValueError(f"Invalid SQLite identifier: {identifier!r}")
+        self.table = table
+        self.offset = 0
+
+    def resume(self, position: int) -> Iterator[str]:
+        # Let SQLite skip the rows instead of reading them into Python
+        self.offset = position
+        try:
+            yield from self
+        finally:
+            self.offset = 0
+
+    def rows(self) -> Iterator[dict]:
+        columns = [self.email_field] + [field for field in (self.name_field, self.timezone_field) if field]
+        conn = sqlite3.connect(self.path)
+        try:
+            # Blank addresses are filtered here so row offsets match entry positions
+            cursor = conn.execute(
+                f"SELECT {', '.join(columns)} FROM {self.table} "
+                f"WHERE {self.email_field} IS NOT NULL AND {self.email_field} != '' "
+                f"ORDER BY rowid LIMIT -1 OFFSET ?",
+                (self.offset,)
+            )
+            while True:
+                batch = cursor.fetchmany(self.chunk_size)
+                if not batch:
+                    return
+                for values in batch:
+                    yield dict(zip(columns, values))
+        finally:
+            conn.close()
+
+
+class ExcelSource(_RowSource):
+    """Worksheet of an .xlsx workbook, opened in openpyxl's read-only mode"""
+
+    def __init__(self, path: str, sheet: Optional[str] = None, email_field: str = "email",
+                 name_field: Optional[str] = "name", chunk_size: int = DEFAULT_CHUNK_SIZE,
+                 timezone_field: Optional[str] = None):
+        super().__init__(path, email_field, name_field, chunk_size, timezone_field)
+        self.sheet = sheet
+
+    def rows(self) -> Iterator[dict]:
+        try:
+            from openpyxl import load_workbook
+        except ImportError:
+            raise ImportError("Reading Excel recipient lists requires openpyxl (pip install openpyxl)")
+
+        workbook = load_workbook(self.path, read_only=True, data_only=True)
+        try:
+            worksheet = workbook[self.sheet] if self.sheet else workbook.active
+            values = worksheet.iter_rows(values_only=True)
+            header = next(values, None)
+            if header is None:
+                return
+            header = [str(cell).strip() if cell is not None else "" for cell in header]
+            for row in values:
+                yield dict(zip(header, row))
+        finally:
+            workbook.close()
+
+
+SOURCE_TYPES = {
+    "csv": CSVSource,
+    "jsonl": JSONLSource,
+    "sqlite": SQLiteSource,
+    "excel": ExcelSource,
+}
+
+
+def open_recipient_source(email_config: dict) -> RecipientSource:
+    """Build the recipient source described by the email platform config
+
+    Without a ``recipient_source`` entry (or with type "config") the inline
+    ``recipients`` list is used, as before.
+    """
+    spec = dict(email_config.get('recipient_source') or {})
+    source_type = spec.pop('type', 'config')
+    spec.pop('note', None)
+
+    if source_type == 'config':
+        return ListSource(email_config.get('recipients', []), spec.get('chunk_size', DEFAULT_CHUNK_SIZE))
+    if source_type not in SOURCE_TYPES:
+        raise ValueError(f"Unknown recipient source type: {source_type}")
+    return SOURCE_TYPES[source_type](**spec)
@@ -0,0 +1,155 @@
+"""
+Recipient store for Senior Advertising Bot
+Persistent mailing list in SQLite with a unique index on the normalized address
+"""
+
+import logging
+import sqlite3
+from dataclasses import dataclass
+from email.utils import parseaddr
+from itertools import islice
+from typing import Iterable, Iterator, Optional, Tuple, Union
+
+from recipient_parser import COMPLEX_CHARS, parse_recipient
+from recipient_sources import DEFAULT_CHUNK_SIZE, SQLiteSource, format_recipient
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS recipients (
+    id INTEGER PRIMARY KEY,
+    address TEXT NOT NULL,
+    email TEXT NOT NULL,
+    name TEXT,
+    added_at TEXT NOT NULL DEFAULT CURRENT_TIMESTAMP
+);
+CREATE UNIQUE INDEX IF NOT EXISTS recipients_address ON recipients(address);
+"""
+
+
+def split_recipient(entry: str) -> Tuple[str, str]:
+    """Split a "Name <email@domain.com>" entry into (name, email)"""
+    if COMPLEX_CHARS.isdisjoint(entry):
+        # Plain "Name <email>" or bare address: skip parseaddr, which is slow
+        name, bracket, rest = entry.partition("<")
+        if not bracket:
+            return "", entry.strip()
+        email, closing, tail = rest.partition(">")
+        if closing and not tail.strip() and ">" not in name:
+            return name.strip(), email.strip()
+    name, email = parseaddr(entry)
+    return name.strip(), email.strip()
+
+
+def normalize_address(email: str) -> Optional[str]:
+    """Canonical form used for dedupe, or None if it is not an email address
+
+    The same validation and form (lowercase, IDN domains in punycode) as the
+    send path, so the store never holds an address a campaign would reject.
+    """
+    recipient, _ = parse_recipient(email)
+    return recipient.address if recipient is not None else None
+
+
+def _row(email: str, name: Optional[str] = None) -> Optional[Tuple[str, str, Optional[str]]]:
+    """(address, email, name) to store for an entry, or None if it is not valid"""
+    recipient, _ = parse_recipient(email)
+    if recipient is None:
+        return None
+    return recipient.address, split_recipient(email)[1], (name or recipient.name).strip() or None
+
+
+@dataclass
+class ImportSummary:
+    """Counts from a bulk import"""
+    added: int = 0
+    duplicates: int = 0
+    invalid: int = 0
+
+
+class RecipientStore:
+    def __init__(self, path: str = "recipients.db"):
+        self.path = path
+        self.logger = logging.getLogger(__name__)
+        self.conn = sqlite3.connect(path)
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.execute("PRAGMA synchronous=NORMAL")
+        self.conn.executescript(SCHEMA)
+
+    def close(self):
+        self.conn.close()
+
+    def __enter__(self) -> "RecipientStore":
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    def __len__(self) -> int:
+        return self.conn.execute("SELECT COUNT(*) FROM recipients").fetchone()[0]
+
+    def __contains__(self, email: str) -> bool:
+        address = normalize_address(email)
+        if address is None:
+            return False
+        row = self.conn.execute("SELECT 1 FROM recipients WHERE address = ?", (address,)).fetchone()
+        return row is not None
+
+    def add(self, email: str, name: str = "") -> bool:
+        """Add one recipient; False if the address is invalid or already stored"""
+        row = _row(email, name)
+        if row is None:
+            return False
+        with self.conn:
+            cursor = self.conn.execute(
+                "INSERT OR IGNORE INTO recipients (address, email, name) VALUES (?, ?, ?)", row
+            )
+        return cursor.rowcount == 1
+
+    def bulk_import(
+        self,
+        entries: Iterable[Union[str, Tuple[str, str]]],
+        batch_size: int = 10000,
+    ) -> ImportSummary:
+        """Normalize and dedupe recipients in batches, one transaction per batch
+
+        ``entries`` may hold "Name <email>" strings (as any RecipientSource
+        yields) or ``(email, name)`` pairs.
+        """
+        summary = ImportSummary()
+        entries = iter(entries)
+
+        while True:
+            batch = list(islice(entries, batch_size))
+            if not batch:
+                break
+
+            rows = []
+            for entry in batch:
+                row = _row(entry) if isinstance(entry, str) else _row(entry[0] or "", entry[1])
+                if row is None:
+                    summary.invalid += 1
+                    continue
+                rows.append(row)
+
+            before = self.conn.total_changes
+            with self.conn:
+                self.conn.executemany(
+                    "INSERT OR IGNORE INTO recipients (address, email, name) VALUES (?, ?, ?)", rows
+                )
+            added = self.conn.total_changes - before
+            summary.added += added
+            summary.duplicates += len(rows) - added
+
+        self.logger.info(
+            f"Imported recipients: {summary.added} added, "
+            f"{summary.duplicates} duplicates, {summary.invalid} invalid"
+        )
+        return summary
+
+    def source(self, chunk_size: int = DEFAULT_CHUNK_SIZE) -> SQLiteSource:
+        """Stream the stored recipients to a campaign"""
+        return SQLiteSource(self.path, "recipients", "email", "name", chunk_size)
+
+    def __iter__(self) -> Iterator[str]:
+        cursor = self.conn.execute("SELECT email, name FROM recipients ORDER BY id")
+        for email, name in cursor:
+            yield format_recipient(email, name)
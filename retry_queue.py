@@ -0,0 +1,118 @@
+"""
+Retry queue for Senior Advertising Bot
+Holds messages that failed transiently until their jittered exponential
+backoff has passed, and tracks how much work is still in the pipeline
+"""
+
+import heapq
+import itertools
+import random
+import threading
+import time
+from typing import Callable, List, Optional, Tuple
+
+# Longest the feeder waits before looking at its cancel event again
+POLL_SECONDS = 1.0
+
+
+class RetryPolicy:
+    """How many attempts a message gets and how long to back off between them
+
+    The n-th retry waits between half and all of ``base_delay * 2**(n-1)``,
+    capped at ``max_delay``, so workers that failed together on one server
+    hiccup do not all come back at the same instant.
+    """
+
+    def __init__(self, max_attempts: int = 4, base_delay: float = 2.0, max_delay: float = 60.0,
+                 rng: Callable[[], float] = random.random):
+        self.max_attempts = max(1, max_attempts)
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self.rng = rng
+
+    @classmethod
+    def from_config(cls, email_config: dict) -> "RetryPolicy":
+        settings = email_config.get('retry') or {}
+        return cls(
+            max_attempts=settings.get('max_attempts', 4),
+            base_delay=settings.get('base_delay_seconds', 2.0),
+            max_delay=settings.get('max_delay_seconds', 60.0),
+        )
+
+    def delay(self, attempt: int) -> float:
+        """Seconds to wait after failed attempt number ``attempt`` (1-based)"""
+        ceiling = min(self.max_delay, self.base_delay * 2 ** (attempt - 1))
+        return ceiling / 2 * (1 + self.rng())
+
+    def should_retry(self, attempt: int, transient: bool) -> bool:
+        return transient and attempt < self.max_attempts
+
+
+class RetryQueue:
+    """Jobs waiting out their backoff, ordered by when they are due
+
+    The feeder calls ``begin`` for every job it hands to a worker and the
+    worker calls ``end`` when the attempt is over, after ``push`` if it is
+    to be retried, so ``next_due`` can tell "nothing due yet" from "all done".
+    """
+
+    def __init__(self, clock: Callable[[], float] = time.monotonic):
+        self.clock = clock
+        self._heap: List[Tuple[float, int, object]] = []
+        self._order = itertools.count()
+        self._in_flight = 0
+        self._cond = threading.Condition()
+
+    def __len__(self) -> int:
+        with self._cond:
+            return len(self._heap)
+
+    def begin(self):
+        with self._cond:
+            self._in_flight += 1
+
+    def end(self):
+        with self._cond:
+            self._in_flight -= 1
+            self._cond.notify_all()
+
+    def push(self, job, delay: float):
+        with self._cond:
+            heapq.heappush(self._heap, (self.clock() + delay, next(self._order), job))
+            self._cond.notify_all()
+
+    def due(self) -> list:
+        """Jobs whose backoff has passed, without waiting"""
+        with self._cond:
+            return self._pop_due(self.clock())
+
+    def next_due(self, timeout: float = POLL_SECONDS) -> Optional[list]:
+        """Wait up to ``timeout`` for due jobs; None once nothing is queued or in flight"""
+        deadline = self.clock() + timeout
+        with self._cond:
+            while True:
+                now = self.clock()
+                ready = self._pop_due(now)
+                if ready:
+                    return ready
+                if not self._heap and self._in_flight == 0:
+                    return None
+                if now >= deadline:
+                    return []
+                wait = deadline - now
+                if self._heap:
+                    wait = min(wait, self._heap[0][0] - now)
+                self._cond.wait(wait)
+
+    def drain(self) -> list:
+        """Every waiting job, due or not"""
+        with self._cond:
+            jobs = [job for _, _, job in sorted(self._heap)]
+            self._heap.clear()
+            return jobs
+
+    def _pop_due(self, now: float) -> list:
+        ready = []
+        while self._heap and self._heap[0][0] <= now:
+            ready.append(heapq.heappop(self._heap)[2])
+        return ready
@@ -4,29 +4,52 @@ A respectful automation tool for reaching senior communities
 """
 
 import time
-import random
-from datetime import datetime, timedelta
-from typing import List, Dict, Optional
+from typing import List, Dict, Optional, Union
 import json
+import os
 import logging
+import sqlite3
+import threading
+
+from community_poster import CLOSED, CommunitySitePoster
+from email_campaign import SeniorEmailCampaign
+from async_logging import configure_logging
+from bot_config import BotConfig, ConfigWatcher, changed_sections
+from campaign_outbox import campaign_key
+from facebook_client import FacebookGraphClient
+from message_variants import VARIANTS, VariantSet
+from metrics import CYCLES, REGISTRY, MetricsServer
+from platform_fanout import DISABLED, OK, CycleReport, PlatformFanout, PlatformTask
+from recipient_sources import open_recipient_source
+from suppression import ingest_suppressions
+from window_scheduler import WindowScheduler
 
 class SeniorAdvertisingBot:
-    def __init__(self, config_file: str = "config.json"):
+    def __init__(self, config_file: str = "config.json", clock=None):
         """Initialize the senior advertising bot"""
-        self.config = self.load_config(config_file)
+        self.config_watcher = self.load_config(config_file)
         self.setup_logging()
-        self.senior_friendly_times = [
-            (9, 11),   # Morning coffee time
-            (13, 15),  # After lunch
-            (18, 20),  # Early evening
-        ]
-        
-    def load_config(self, config_file: str) -> Dict:
-        """Load bot configuration"""
-        try:
-            with open(config_file, 'r') as f:
-                return json.load(f)
-        except FileNotFoundError:
+        self.clock = clock
+        # Morning coffee time, after lunch and early evening unless configured otherwise
+        self.window_scheduler = WindowScheduler.from_config(self.config, clock=clock)
+        self.fanout = PlatformFanout()
+        self.last_cycle_report: Optional[CycleReport] = None
+        # Kept across cycles so keep-alive pools and circuit breakers carry over
+        self.community_poster: Optional[CommunitySitePoster] = None
+        self.metrics_server: Optional[MetricsServer] = None
+        
+    @property
+    def settings(self) -> BotConfig:
+        """Current validated configuration; replaced whole when config.json changes"""
+        return self.config_watcher.current
+    
+    @property
+    def config(self) -> Dict:
+        return self.settings.raw
+    
+    def load_config(self, config_file: str) -> ConfigWatcher:
+        """Load and validate bot configuration, watching the file for changes"""
+        if not os.path.exists(config_file):
             # Create default config
             default_config = {
                 "business_name": "Your Business",
@@ -45,124 +68,256 @@ class SeniorAdvertisingBot:
             }
             with open(config_file, 'w') as f:
                 json.dump(default_config, f, indent=2)
-            return default_config
+        return ConfigWatcher(config_file)
+    
+    def reload_config(self) -> bool:
+        """Pick up changes to config.json; True if a new configuration was loaded"""
+        previous = self.settings
+        if not self.config_watcher.check():
+            return False
+        
+        changes = changed_sections(previous, self.settings)
+        if changes.get('logging'):
+            self.setup_logging()
+        if changes.get('posting_schedule'):
+            scheduler = WindowScheduler.from_config(self.config, clock=self.clock)
+            scheduler.carry_over(self.window_scheduler)
+            self.window_scheduler = scheduler
+        if changes.get('platforms.community_sites') and self.community_poster is not None:
+            self.community_poster.close()
+            self.community_poster = None
+        
+        changed = ", ".join(sorted(name for name, differs in changes.items() if differs))
+        self.logger.info(f"Reloaded {self.config_watcher.path} (changed: {changed})")
+        return True
     
     def setup_logging(self):
         """Setup logging for bot activities"""
-        logging.basicConfig(
-            level=logging.INFO,
-            format='%(asctime)s - %(levelname)s - %(message)s',
-            handlers=[
-                logging.FileHandler('senior_bot.log'),
-                logging.StreamHandler()
-            ]
-        )
+        # Queue-backed by default: a background thread writes senior_bot.log and the console
+        configure_logging(self.config.get('logging'))
         self.logger = logging.getLogger(__name__)
     
     def is_senior_friendly_time(self) -> bool:
         """Check if current time is appropriate for senior outreach"""
-        current_hour = datetime.now().hour
-        
-        # Avoid very early morning or late night
-        if current_hour < 8 or current_hour > 21:
-            return False
-            
-        # Prefer specific senior-friendly times
-        for start, end in self.senior_friendly_times:
-            if start <= current_hour <= end:
-                return True
-        return False
+        # Quiet hours and the configured senior-friendly windows, in the bot's timezone
+        return self.window_scheduler.is_open()
     
     def create_senior_friendly_message(self, template: str = None) -> str:
         """Create respectful, clear messaging for seniors"""
         if template:
             return template
-            
-        templates = [
-            f"🌟 {self.config['business_name']} - {self.config['target_message']}\n\n"
-            f"We understand the importance of clear communication and reliable service.\n"
-            f"{self.config['contact_info']}\n\n"
-            f"Feel free to call or email with any questions!",
-            
-            f"Hello! 👋 {self.config['business_name']} here.\n\n"
-            f"{self.config['target_message']}\n\n"
-            f"We believe in taking time to explain everything clearly.\n"
-            f"{self.config['contact_info']}\n\n"
-            f"Looking forward to helping you!",
-            
-            f"Good day! ☀️\n\n"
-            f"{self.config['business_name']} specializes in {self.config['target_message']}\n\n"
-            f"• Clear explanations\n• Patient service\n• Fair pricing\n\n"
-            f"{self.config['contact_info']}"
-        ]
         
-        return random.choice(templates)
+        return self.message_variants().choose().text
     
-    def post_to_facebook_groups(self, message: str):
+    def message_variants(self) -> VariantSet:
+        """Every message template, rendered once per business_name/target_message/contact_info"""
+        settings = self.settings
+        return VARIANTS.get(settings.business_name, settings.target_message, settings.contact_info)
+    
+    def post_to_facebook_groups(self, message: str, cancel: Optional[threading.Event] = None):
         """Post to Facebook groups (requires Facebook API setup)"""
-        if not self.config['platforms']['facebook']['enabled']:
+        facebook = self.settings.facebook
+        if not facebook.enabled:
             self.logger.info("Facebook posting disabled in config")
-            return
+            return []
             
-        # Note: This would require Facebook Graph API setup
-        # For now, this is a placeholder showing the structure
-        self.logger.info("Facebook posting would happen here")
-        self.logger.info(f"Message: {message[:50]}...")
-    
-    def send_email_campaign(self, message: str):
-        """Send email to senior mailing list"""
-        if not self.config['platforms']['email']['enabled']:
+        if not facebook.group_ids or not facebook.access_token:
+            self.logger.info("Facebook posting needs group_ids and an access_token in config")
+            return []
+        
+        # Batched Graph requests over one pooled session
+        client = FacebookGraphClient.from_config(facebook.raw)
+        try:
+            results = client.post_to_groups(list(facebook.group_ids), message, cancel)
+        finally:
+            client.close()
+        
+        for result in results:
+            if result.success:
+                self.logger.info(f"Posted to Facebook group {result.group_id}")
+            else:
+                self.logger.error(f"Failed to post to Facebook group {result.group_id}: {result.error}")
+        posted = sum(1 for result in results if result.success)
+        self.logger.info(f"Facebook posting completed: {posted}/{len(results)} groups")
+        return results
+    
+    def send_email_campaign(self, message: Union[str, VariantSet], timezones: Optional[List[str]] = None,
+                            cancel: Optional[threading.Event] = None, campaign_id: Optional[str] = None):
+        """Send email to senior mailing list
+        
+        With ``timezones`` only recipients whose local window is open in one
+        of them are mailed, batched by timezone. Given a VariantSet, each
+        recipient gets the variant assigned to their address. ``campaign_id``
+        names the outbox the run is checkpointed in, if one is configured.
+        Returns whether the run finished: something was sent, or every
+        recipient was worked through.
+        """
+        # One snapshot for the whole campaign, even if config.json changes meanwhile
+        settings = self.settings
+        if not settings.email.enabled:
             self.logger.info("Email campaigns disabled in config")
             return
             
-        # Email implementation would go here
-        self.logger.info("Email campaign would be sent here")
-        self.logger.info(f"Message: {message[:50]}...")
+        # Replies and bounces are ingested once here; the send path only reads the index
+        try:
+            ingest_suppressions(settings.email.raw)
+        except (OSError, sqlite3.Error) as e:
+            self.logger.error(f"Email campaign not sent: could not update the suppression list: {e}")
+            return False
+        
+        # Recipients are streamed from the configured source, not loaded whole
+        recipients = open_recipient_source(settings.email.raw)
+        if timezones is not None:
+            batches = self.window_scheduler.batch_by_timezone(recipients.entries_with_timezone(), timezones)
+            recipients = (recipient for _, batch in batches for recipient in batch)
+        subject = settings.email.subject or f"A friendly hello from {settings.business_name}"
+        
+        self.logger.info(f"Sending email campaign: {subject}")
+        campaign = SeniorEmailCampaign(settings.raw)
+        sent = campaign.send_email_campaign(
+            recipients, subject, message, campaign_id=campaign_id, cancel=cancel
+        )
+        return bool(sent) or campaign.last_complete
     
-    def post_to_community_sites(self, message: str):
+    def post_to_community_sites(self, message: str, cancel: Optional[threading.Event] = None):
         """Post to senior community websites/forums"""
-        if not self.config['platforms']['community_sites']['enabled']:
+        community_sites = self.settings.community_sites
+        if not community_sites.enabled:
             self.logger.info("Community site posting disabled in config")
             return
             
-        # Community site posting implementation
-        self.logger.info("Community site posting would happen here")
-        self.logger.info(f"Message: {message[:50]}...")
+        if self.community_poster is None:
+            self.community_poster = CommunitySitePoster.from_config(community_sites.raw)
+        results = self.community_poster.post(message, cancel)
+        for result in results:
+            if result.success:
+                self.logger.info(f"Posted to {result.url} in {result.elapsed:.2f}s")
+            elif result.skipped:
+                self.logger.warning(f"Skipped {result.url}: {result.error}")
+            else:
+                self.logger.error(f"Failed to post to {result.url}: {result.error}")
+        posted = sum(1 for result in results if result.success)
+        self.logger.info(f"Community site posting completed: {posted}/{len(results)} sites")
+        tripped = {name: state for name, state in self.community_poster.breaker_states().items() if state != CLOSED}
+        if tripped:
+            self.logger.warning(f"Community site circuits not closed: {tripped}")
+        return results
     
     def run_advertising_cycle(self):
         """Run one complete advertising cycle"""
+        self.reload_config()
         self.logger.info("Starting advertising cycle...")
         
-        if not self.is_senior_friendly_time():
+        now = self.window_scheduler.now()
+        if not self.window_scheduler.can_post(now):
+            self.logger.info("Daily post limit reached. Waiting until tomorrow...")
+            return
+        
+        timezones = self.window_scheduler.due_timezones(now)
+        if not timezones:
             self.logger.info("Not an optimal time for senior outreach. Waiting...")
             return
         
-        message = self.create_senior_friendly_message()
-        self.logger.info(f"Generated message: {message}")
+        # Broadcast posts use one variant; email recipients each get the one their address picks
+        variants = self.message_variants()
+        chosen = variants.choose()
+        message = chosen.text
+        self.logger.info(f"Generated message ({chosen.id}, set {variants.key}): {message}")
+        # One outbox per window and timezone batch: a crashed run resumes, the next window starts afresh
+        campaign_id = campaign_key(self.window_scheduler.window_key(timezones, now), variants.key)
         
-        # Post to enabled platforms
-        self.post_to_facebook_groups(message)
-        self.send_email_campaign(message)
-        self.post_to_community_sites(message)
+        # A window retried because its email run did not finish only needs the email
+        broadcast = not all(self.window_scheduler.is_retry(name, now) for name in timezones)
+        if not broadcast:
+            self.logger.info(f"Retrying the unfinished email run for {', '.join(timezones)}")
         
-        self.logger.info("Advertising cycle completed")
+        # Post to enabled platforms concurrently, each with its own timeout
+        settings = self.settings
+        report = self.fanout.run([
+            PlatformTask(
+                "facebook",
+                lambda cancel: self.post_to_facebook_groups(message, cancel),
+                settings.facebook.cycle_timeout,
+                settings.facebook.enabled and broadcast
+            ),
+            PlatformTask(
+                "email",
+                lambda cancel: self.send_email_campaign(variants, timezones, cancel, campaign_id),
+                settings.email.cycle_timeout,
+                settings.email.enabled
+            ),
+            PlatformTask(
+                "community_sites",
+                lambda cancel: self.post_to_community_sites(message, cancel),
+                settings.community_sites.cycle_timeout,
+                settings.community_sites.enabled and broadcast
+            ),
+        ])
+        self.last_cycle_report = report
+        CYCLES.inc()
+        
+        # Windows stay open for another try when the email run timed out or failed,
+        # including failures it caught itself and reported by returning False
+        email = report.result("email")
+        if email.status == DISABLED or (email.status == OK and email.value):
+            self.window_scheduler.record_cycle(timezones, now, count_post=broadcast)
+        else:
+            self.window_scheduler.record_cycle([], now, unfinished=timezones, count_post=broadcast)
+            outcome = email.status if email.status != OK else "an unfinished campaign"
+            self.logger.warning(
+                f"Email run ended with {outcome}; retrying {', '.join(timezones)} "
+                f"in {self.window_scheduler.retry_delay.total_seconds() / 60:.0f} minutes"
+            )
+        self.logger.info(report.summary())
+        self.logger.info(f"Advertising cycle completed for {', '.join(timezones)}")
+        self.export_metrics()
+    
+    def start_metrics_server(self):
+        """Serve /metrics on localhost when metrics.port is configured"""
+        port = self.settings.metrics_port
+        if port and self.metrics_server is None:
+            try:
+                self.metrics_server = MetricsServer(REGISTRY, port=port).start()
+            except OSError as e:
+                self.logger.error(f"Could not serve metrics on port {port}: {e}")
+    
+    def export_metrics(self):
+        """Write the Prometheus metrics file when metrics.textfile is configured"""
+        path = self.settings.metrics_textfile
+        if not path:
+            return
+        try:
+            REGISTRY.write_textfile(path)
+        except OSError as e:
+            self.logger.error(f"Could not write metrics to {path}: {e}")
+    
+    def wait_for_next_cycle(self):
+        """Sleep straight to the next window that is due somewhere
+        
+        The config file is checked every reload_check_seconds while waiting,
+        and a changed schedule moves the wake-up time without a restart.
+        """
+        announce = True
+        while True:
+            now = self.window_scheduler.now()
+            next_cycle = self.window_scheduler.next_cycle_time(now)
+            total_wait = max(0.0, (next_cycle - now).total_seconds())
+            if announce:
+                self.logger.info(f"Waiting until {next_cycle:%Y-%m-%d %H:%M %Z} ({total_wait / 3600:.1f} hours) for next cycle...")
+            if total_wait <= 0:
+                return
+            time.sleep(min(total_wait, self.settings.reload_check_seconds))
+            announce = self.reload_config()
     
     def start_scheduled_posting(self):
         """Start the scheduled posting loop"""
         self.logger.info("Starting scheduled posting...")
+        self.start_metrics_server()
         
         while True:
             try:
                 self.run_advertising_cycle()
-                
-                # Wait for next cycle
-                wait_hours = self.config['posting_schedule']['frequency_hours']
-                wait_minutes = random.randint(0, 30)  # Add some randomness
-                
-                total_wait = (wait_hours * 3600) + (wait_minutes * 60)
-                self.logger.info(f"Waiting {wait_hours} hours {wait_minutes} minutes until next cycle...")
-                
-                time.sleep(total_wait)
+                self.wait_for_next_cycle()
                 
             except KeyboardInterrupt:
                 self.logger.info("Bot stopped by user")
@@ -8,6 +8,12 @@ import getpass
 import os
 from pathlib import Path
 
+from recipient_sources import ListSource, open_recipient_source
+from recipient_store import RecipientStore
+
+# File extensions the recipient importer understands
+IMPORT_TYPES = {'.csv': 'csv', '.jsonl': 'jsonl', '.xlsx': 'excel', '.db': 'sqlite', '.sqlite': 'sqlite'}
+
 def setup_bot():
     """Interactive setup for the senior advertising bot"""
     print("🤖 Welcome to Senior Advertising Bot Setup!")
@@ -94,8 +100,15 @@ def setup_bot():
         
         # Recipients
         print("\nEmail Recipients:")
+        store_path = email_config.get('recipient_store', 'recipients.db')
+        store = RecipientStore(store_path)
+        
+        # Move any recipients still listed in config.json into the store
+        if email_config.get('recipients'):
+            store.bulk_import(email_config['recipients'])
+        
         print("Enter email addresses one by one (press Enter with empty line to finish)")
-        recipients = email_config.get('recipients', [])
+        added = 0
         
         while True:
             recipient = input("Email address (or press Enter to finish): ").strip()
@@ -103,16 +116,21 @@ def setup_bot():
                 break
             name = input(f"Name for {recipient} (optional): ").strip()
             
-            if name:
-                recipients.append(f"{name} <{recipient}>")
+            if store.add(recipient, name):
+                added += 1
             else:
-                recipients.append(recipient)
+                print(f"  Skipped {recipient}: already on the list or not a valid address.")
+        
+        total = len(store)
+        store.close()
         
-        email_config['recipients'] = recipients
+        email_config['recipient_store'] = store_path
+        email_config['recipient_source'] = {'type': 'sqlite', 'path': store_path}
+        email_config['recipients'] = []
         email_config['enabled'] = True
         config['platforms']['email'] = email_config
         
-        print(f"✅ Email setup complete! {len(recipients)} recipients added.")
+        print(f"✅ Email setup complete! {added} recipients added ({total} on the list).")
     
     # Posting schedule
     print("\n⏰ STEP 3: Posting Schedule")
@@ -170,12 +188,44 @@ def create_sample_recipients():
     print("Sample recipients file created: sample_recipients.txt")
     print("You can use this as a template for your actual recipients.")
 
+def import_recipients():
+    """Bulk import recipients from a file into the recipient store"""
+    config_file = "config.json"
+    config = {}
+    if os.path.exists(config_file):
+        with open(config_file, 'r') as f:
+            config = json.load(f)
+    email_config = config.get('platforms', {}).get('email', {})
+    store_path = email_config.get('recipient_store', 'recipients.db')
+    
+    path = input("Recipients file (.csv, .jsonl, .xlsx, .db or one address per line): ").strip()
+    if not os.path.exists(path):
+        print(f"File not found: {path}")
+        return
+    
+    source_type = IMPORT_TYPES.get(Path(path).suffix.lower())
+    with RecipientStore(store_path) as store:
+        if source_type:
+            summary = store.bulk_import(open_recipient_source({'recipient_source': {'type': source_type, 'path': path}}))
+        else:
+            with open(path, 'r', encoding='utf-8') as f:
+                summary = store.bulk_import(ListSource(line.strip() for line in f if line.strip()))
+        total = len(store)
+    
+    print(f"✅ Imported {summary.added} new recipients into {store_path} ({total} on the list).")
+    print(f"   Skipped {summary.duplicates} duplicates and {summary.invalid} invalid entries.")
+    
+    if not email_config.get('recipient_store'):
+        print("Run bot setup to switch email campaigns over to this recipient list.")
+
 if __name__ == "__main__":
-    choice = input("Choose an option:\n1. Run bot setup\n2. Create sample recipients file\n3. Exit\nEnter choice (1-3): ")
+    choice = input("Choose an option:\n1. Run bot setup\n2. Create sample recipients file\n3. Import recipients from a file\n4. Exit\nEnter choice (1-4): ")
     
     if choice == "1":
         setup_bot()
     elif choice == "2":
         create_sample_recipients()
+    elif choice == "3":
+        import_recipients()
     else:
         print("Goodbye!")
\ No newline at end of file
@@ -0,0 +1,126 @@
+"""
+Local community site stub for Senior Advertising Bot
+A small stand-in forum used to measure and exercise community site posting,
+including slow, failing and slow-drip servers, without posting anywhere real
+"""
+
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Optional
+
+BODY = b"<html><body>Thanks for your post</body></html>"
+
+
+class _StubHandler(BaseHTTPRequestHandler):
+    """Accepts a form POST and answers with a short page"""
+
+    def log_message(self, format, *args):
+        pass
+
+    def do_POST(self):
+        site = self.server.site
+        length = int(self.headers.get("Content-Length") or 0)
+        self.rfile.read(length)
+        site._post_received()
+        if site.delay:
+            time.sleep(site.delay)
+        try:
+            self.answer(site)
+        except ConnectionError:
+            # Client gave up, e.g. on its total time limit
+            pass
+
+    def answer(self, site: "SiteStub"):
+        if site.drip == "headers":
+            # Status line and headers a byte at a time, each within the socket timeout
+            head = (f"HTTP/1.1 {site.status} OK\r\nContent-Length: {len(BODY)}\r\n"
+                    + "X-Padding: " + "." * 40 + "\r\n\r\n").encode("ascii")
+            for byte in head:
+                self.wfile.write(bytes([byte]))
+                self.wfile.flush()
+                time.sleep(site.drip_seconds)
+            self.wfile.write(BODY)
+            return
+
+        self.send_response(site.status)
+        self.send_header("Content-Type", "text/html")
+        self.send_header("Content-Length", str(len(BODY)))
+        self.end_headers()
+        if site.drip == "body":
+            for byte in BODY:
+                self.wfile.write(bytes([byte]))
+                self.wfile.flush()
+                time.sleep(site.drip_seconds)
+        else:
+            self.wfile.write(BODY)
+
+
+class SiteStub:
+    """Threaded HTTP server that accepts community site posts and discards them
+
+    Every post is answered with ``status`` after ``delay`` seconds. With
+    ``drip`` set to ``"body"`` or ``"headers"`` that part of the response is
+    sent one byte every ``drip_seconds``, the slow-drip pattern that keeps a
+    per-read socket timeout from ever firing.
+    """
+
+    def __init__(self, host: str = "127.0.0.1", port: int = 0, delay: float = 0.0,
+                 status: int = 200, drip: str = "", drip_seconds: float = 0.05):
+        if drip not in ("", "body", "headers"):
+            raise ValueError(f"drip must be body or headers, got {drip!r}")
+        self.delay = delay
+        self.status = status
+        self.drip = drip
+        self.drip_seconds = drip_seconds
+        self.post_count = 0
+        self._lock = threading.Lock()
+        self._server = ThreadingHTTPServer((host, port), _StubHandler)
+        self._server.daemon_threads = True
+        self._server.site = self
+        self._thread: Optional[threading.Thread] = None
+
+    @property
+    def host(self) -> str:
+        return self._server.server_address[0]
+
+    @property
+    def port(self) -> int:
+        return self._server.server_address[1]
+
+    @property
+    def url(self) -> str:
+        return f"http://{self.host}:{self.port}/post"
+
+    def start(self) -> "SiteStub":
+        self._thread = threading.Thread(target=self._server.serve_forever, daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self._server.shutdown()
+        self._server.server_close()
+        if self._thread:
+            self._thread.join()
+
+    def __enter__(self) -> "SiteStub":
+        return self.start()
+
+    def __exit__(self, *exc_info):
+        self.stop()
+
+    def _post_received(self):
+        with self._lock:
+            self.post_count += 1
+
+
+if __name__ == "__main__":
+    site = SiteStub(port=8091)
+    print(f"Community site stub listening on {site.url} (Ctrl+C to stop)")
+    site.start()
+    try:
+        while True:
+            time.sleep(5)
+            print(f"Received {site.post_count} posts")
+    except KeyboardInterrupt:
+        site.stop()
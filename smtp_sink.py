@@ -0,0 +1,227 @@
+"""
+Local SMTP sink for Senior Advertising Bot
+A small stand-in SMTP server used to measure and exercise email campaigns
+without sending real mail
+"""
+
+import socketserver
+import threading
+import time
+from typing import Dict, Iterable, Optional
+
+
+class _SinkHandler(socketserver.StreamRequestHandler):
+    """Speaks just enough SMTP for smtplib to deliver messages"""
+
+    def reply(self, line: str):
+        self.wfile.write(line.encode("ascii") + b"\r\n")
+
+    def handle(self):
+        try:
+            self.converse()
+        except ConnectionError:
+            # Client went away mid-conversation, e.g. a killed campaign
+            pass
+
+    def converse(self):
+        sink = self.server.sink
+        sink._connection_opened()
+        self.reply("220 localhost Senior SMTP sink ready")
+        recipients = 0
+        messages = 0
+
+        while True:
+            raw = self.rfile.readline()
+            if not raw:
+                break
+            line = raw.decode("utf-8", "replace").rstrip("\r\n")
+            command = line[:4].upper()
+
+            if command in ("EHLO", "HELO"):
+                self.wfile.write(
+                    b"250-localhost\r\n"
+                    b"250-AUTH PLAIN LOGIN\r\n"
+                    b"250-8BITMIME\r\n"
+                    b"250-PIPELINING\r\n"
+                    b"250 SIZE 52428800\r\n"
+                )
+            elif command == "AUTH":
+                parts = line.split()
+                if len(parts) == 2 and parts[1].upper() == "LOGIN":
+                    # Username and password prompts, both accepted
+                    self.reply("334 VXNlcm5hbWU6")
+                    self.rfile.readline()
+                    self.reply("334 UGFzc3dvcmQ6")
+                    self.rfile.readline()
+                if sink._login():
+                    self.reply("235 2.7.0 Authentication successful")
+                else:
+                    self.reply("454 4.7.0 Temporary authentication failure")
+            elif command == "MAIL":
+                recipients = 0
+                if sink.session_messages and messages >= sink.session_messages:
+                    sink._fault("session", 1)
+                    self.reply("530 5.7.0 Authentication required")
+                else:
+                    self.reply("250 2.1.0 OK")
+            elif command == "RCPT":
+                address = line.partition("<")[2].partition(">")[0].lower()
+                if address in sink.reject:
+                    sink._refused()
+                    self.reply("550 5.1.1 Mailbox unavailable")
+                elif sink._fault("defer", sink.defer_every):
+                    self.reply("451 4.3.0 Try again later")
+                else:
+                    recipients += 1
+                    self.reply("250 2.1.5 OK")
+            elif command == "DATA":
+                self.reply("354 End data with <CR><LF>.<CR><LF>")
+                size = 0
+                while True:
+                    chunk = self.rfile.readline()
+                    if not chunk or chunk == b".\r\n":
+                        break
+                    size += len(chunk)
+                if sink.delay:
+                    time.sleep(sink.delay)
+                if sink._fault("drop", sink.drop_every):
+                    # Hang up instead of confirming, as a crashing server would
+                    break
+                messages += 1
+                sink._message_received(recipients, size)
+                self.reply("250 2.0.0 Message accepted")
+            elif command == "RSET":
+                recipients = 0
+                self.reply("250 2.0.0 OK")
+            elif command == "NOOP":
+                self.reply("250 2.0.0 OK")
+            elif command == "QUIT":
+                self.reply("221 2.0.0 Bye")
+                break
+            else:
+                self.reply("502 5.5.2 Command not recognized")
+
+
+class _ThreadingSinkServer(socketserver.ThreadingTCPServer):
+    daemon_threads = True
+    allow_reuse_address = True
+
+
+class SMTPSink:
+    """Threaded SMTP server that accepts and discards every message
+
+    Addresses in ``reject`` are refused at RCPT TO with a 550 reply. For
+    exercising error handling it can also inject faults: hang up instead of
+    confirming every ``drop_every``-th message, answer every
+    ``defer_every``-th RCPT TO with 451, refuse the first ``fail_logins``
+    logins with 454, and answer MAIL with 530 (session no longer
+    authenticated) once a connection has sent ``session_messages`` messages.
+    """
+
+    def __init__(self, host: str = "127.0.0.1", port: int = 0, delay: float = 0.0,
+                 reject: Iterable[str] = (), drop_every: int = 0, defer_every: int = 0,
+                 fail_logins: int = 0, session_messages: int = 0):
+        self.delay = delay
+        self.reject = {address.lower() for address in reject}
+        self.drop_every = drop_every
+        self.defer_every = defer_every
+        self.fail_logins = fail_logins
+        self.session_messages = session_messages
+        self.faults_injected = 0
+        self.login_attempts = 0
+        self._events: Dict[str, int] = {}
+        self.message_count = 0
+        self.recipient_count = 0
+        self.refused_count = 0
+        self.bytes_received = 0
+        self.connection_count = 0
+        self.login_count = 0
+        self._lock = threading.Lock()
+        self._server = _ThreadingSinkServer((host, port), _SinkHandler)
+        self._server.sink = self
+        self._thread: Optional[threading.Thread] = None
+
+    @property
+    def host(self) -> str:
+        return self._server.server_address[0]
+
+    @property
+    def port(self) -> int:
+        return self._server.server_address[1]
+
+    def email_config(self, **overrides) -> dict:
+        """Email platform settings that point a campaign at this sink"""
+        email_config = {
+            "enabled": True,
+            "smtp_server": self.host,
+            "smtp_port": self.port,
+            "use_tls": False,
+            "username": "bot@seniorservices.com",
+            "password": "sink",
+            "recipients": [],
+        }
+        email_config.update(overrides)
+        return email_config
+
+    def start(self) -> "SMTPSink":
+        self._thread = threading.Thread(target=self._server.serve_forever, daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self._server.shutdown()
+        self._server.server_close()
+        if self._thread:
+            self._thread.join()
+
+    def __enter__(self) -> "SMTPSink":
+        return self.start()
+
+    def __exit__(self, *exc_info):
+        self.stop()
+
+    def _connection_opened(self):
+        with self._lock:
+            self.connection_count += 1
+
+    def _login(self) -> bool:
+        with self._lock:
+            self.login_attempts += 1
+            if self.login_attempts <= self.fail_logins:
+                self.faults_injected += 1
+                return False
+            self.login_count += 1
+            return True
+
+    def _fault(self, kind: str, every: int) -> bool:
+        """Whether this is the ``every``-th event of its kind, counting it as injected"""
+        if not every:
+            return False
+        with self._lock:
+            count = self._events[kind] = self._events.get(kind, 0) + 1
+            if count % every:
+                return False
+            self.faults_injected += 1
+            return True
+
+    def _refused(self):
+        with self._lock:
+            self.refused_count += 1
+
+    def _message_received(self, recipients: int, size: int):
+        with self._lock:
+            self.message_count += 1
+            self.recipient_count += recipients
+            self.bytes_received += size
+
+
+if __name__ == "__main__":
+    sink = SMTPSink(port=8025)
+    print(f"SMTP sink listening on {sink.host}:{sink.port} (Ctrl+C to stop)")
+    sink.start()
+    try:
+        while True:
+            time.sleep(5)
+            print(f"Received {sink.message_count} messages for {sink.recipient_count} recipients")
+    except KeyboardInterrupt:
+        sink.stop()
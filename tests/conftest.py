@@ -0,0 +1,21 @@
+import os
+import sys
+
+import pytest
+
+# The bot's modules live at the repository root rather than in a package
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from smtp_sink import SMTPSink  # noqa: E402
+
+
+@pytest.fixture
+def sink():
+    with SMTPSink() as sink:
+        yield sink
+
+
+@pytest.fixture
+def email_config(sink):
+    return sink.email_config(pool_size=2, workers=2,
+                             retry={"max_attempts": 3, "base_delay_seconds": 0.01, "max_delay_seconds": 0.05})
@@ -0,0 +1,42 @@
+import logging
+import queue
+import threading
+
+from async_logging import LOG_RECORDS_DROPPED, NonBlockingQueueHandler
+
+
+def record(level, message):
+    return logging.makeLogRecord({"levelno": level, "levelname": logging.getLevelName(level), "msg": message})
+
+
+def full_handler(block_seconds=0.05):
+    log_queue = queue.Queue(maxsize=1)
+    handler = NonBlockingQueueHandler(log_queue)
+    handler.block_seconds = block_seconds
+    handler.enqueue(record(logging.INFO, "filler"))
+    return log_queue, handler
+
+
+def test_info_is_dropped_when_queue_is_full(capsys):
+    log_queue, handler = full_handler()
+    dropped = LOG_RECORDS_DROPPED.labels().value
+    handler.enqueue(record(logging.INFO, "sent to reader@example.com"))
+    assert LOG_RECORDS_DROPPED.labels().value == dropped + 1
+    assert log_queue.qsize() == 1
+    assert capsys.readouterr().err == ""
+
+
+def test_error_waits_for_room():
+    log_queue, handler = full_handler(block_seconds=5)
+    threading.Timer(0.1, log_queue.get).start()
+    handler.enqueue(record(logging.ERROR, "SMTP login failed"))
+    assert log_queue.get_nowait().getMessage() == "SMTP login failed"
+
+
+def test_warning_goes_to_stderr_when_queue_stays_full(capsys):
+    log_queue, handler = full_handler()
+    dropped = LOG_RECORDS_DROPPED.labels().value
+    handler.enqueue(record(logging.WARNING, "circuit opened"))
+    assert "WARNING - circuit opened" in capsys.readouterr().err
+    assert LOG_RECORDS_DROPPED.labels().value == dropped
+    assert log_queue.get_nowait().getMessage() == "filler"
@@ -0,0 +1,35 @@
+import copy
+import json
+import os
+
+import pytest
+
+from bot_config import BotConfig, ConfigError
+
+CONFIG_PATH = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "config.json")
+
+
+@pytest.fixture
+def raw():
+    with open(CONFIG_PATH) as f:
+        return json.load(f)
+
+
+def with_email(raw, **email):
+    raw = copy.deepcopy(raw)
+    raw["platforms"]["email"].update(enabled=True, smtp_server="localhost", **email)
+    return raw
+
+
+def test_shipped_config_is_valid(raw):
+    BotConfig(raw)
+
+
+@pytest.mark.parametrize("username", ["", "not an address", "two@example.com, three@example.com"])
+def test_enabled_email_needs_a_sender_address(raw, username):
+    with pytest.raises(ConfigError, match="username must be an email address"):
+        BotConfig(with_email(raw, username=username))
+
+
+def test_enabled_email_with_sender_address(raw):
+    assert BotConfig(with_email(raw, username="Senior Services <bot@seniorservices.com>")).email.enabled
@@ -0,0 +1,74 @@
+import sqlite3
+import threading
+
+from campaign_outbox import SENT, CampaignOutbox
+from email_campaign import SeniorEmailCampaign
+from email_delivery import DeliveryResult
+
+
+def recipients(count):
+    return [f"Reader {i} <reader{i}@example.com>" for i in range(count)]
+
+
+def test_cancelled_campaign_resumes_without_resending(sink, email_config, tmp_path):
+    email_config.update(outbox=str(tmp_path / "outbox.db"), outbox_commit_every=10)
+    campaign = SeniorEmailCampaign({"platforms": {"email": email_config}})
+    sent = []
+    cancel = threading.Event()
+
+    def on_result(index, result):
+        if result.success:
+            sent.append(result.email)
+        if len(sent) >= 30:
+            cancel.set()
+
+    campaign.send_email_campaign(recipients(100), "Hello", "Body", on_result=on_result, cancel=cancel)
+    assert not campaign.last_complete
+    first_run = len(sent)
+    assert 30 <= first_run < 100
+
+    assert campaign.send_email_campaign(recipients(100), "Hello", "Body", on_result=on_result)
+    assert campaign.last_complete
+    assert len(sent) == len(set(sent)) == 100
+    assert sink.message_count == 100
+
+    # A third run finds nothing left to send
+    assert campaign.send_email_campaign(recipients(100), "Hello", "Body", on_result=on_result)
+    assert sink.message_count == 100
+
+
+def test_failed_checkpoint_stops_the_campaign(sink, email_config, tmp_path, monkeypatch):
+    email_config.update(outbox=str(tmp_path / "outbox.db"), outbox_commit_every=5)
+    campaign = SeniorEmailCampaign({"platforms": {"email": email_config}})
+    write = CampaignOutbox._write
+    commits = []
+
+    def failing_write(self, *batch):
+        if len(commits) >= 2:
+            raise sqlite3.OperationalError("database is locked")
+        commits.append(1)
+        write(self, *batch)
+
+    monkeypatch.setattr(CampaignOutbox, "_write", failing_write)
+    assert campaign.send_email_campaign(recipients(500), "Hello", "Body") is False
+    assert not campaign.last_complete
+    assert sink.message_count < 500
+
+
+def test_locked_database_keeps_the_batch_for_later(tmp_path):
+    path = str(tmp_path / "outbox.db")
+    outbox = CampaignOutbox(path, "campaign", commit_every=1000, busy_timeout=0.1)
+    outbox.enqueue(0, "reader@example.com")
+    outbox.record(0, DeliveryResult("reader@example.com", "reader@example.com", True))
+
+    other = sqlite3.connect(path)
+    other.execute("BEGIN IMMEDIATE")
+    assert outbox.flush() is False
+    assert isinstance(outbox.error, sqlite3.OperationalError)
+
+    other.rollback()
+    other.close()
+    assert outbox.flush() is True
+    assert outbox.counts() == {SENT: 1}
+    assert outbox.position == 1
+    outbox.close()
@@ -0,0 +1,104 @@
+import threading
+import time
+
+from community_poster import CLOSED, HALF_OPEN, OPEN, CircuitBreaker, CommunitySitePoster
+from metrics import COMMUNITY_POSTS
+from site_stub import SiteStub
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+
+
+def posts(stub, outcome):
+    return COMMUNITY_POSTS.labels(f"{stub.host}:{stub.port}", outcome).value
+
+
+def test_breaker_opens_half_opens_and_closes():
+    clock = FakeClock()
+    changes = []
+    breaker = CircuitBreaker(failure_threshold=2, reset_timeout=60, clock=clock, on_change=changes.append)
+
+    breaker.record_failure()
+    assert breaker.state == CLOSED and breaker.allow()
+    breaker.record_failure()
+    assert breaker.state == OPEN and not breaker.allow()
+
+    clock.now = 60
+    assert breaker.allow() and breaker.state == HALF_OPEN
+    breaker.record_success()
+    assert breaker.state == CLOSED and breaker.failures == 0
+    assert changes == [OPEN, HALF_OPEN, CLOSED]
+
+
+def test_failed_trial_reopens_breaker():
+    clock = FakeClock()
+    breaker = CircuitBreaker(failure_threshold=3, reset_timeout=10, clock=clock)
+    for _ in range(3):
+        breaker.record_failure()
+    clock.now = 10
+    assert breaker.allow()
+    breaker.record_failure()
+    assert breaker.state == OPEN and breaker.opened_at == 10
+    assert not breaker.allow()
+
+
+def test_posts_and_trips_failing_site():
+    with SiteStub() as healthy, SiteStub(status=503) as failing:
+        poster = CommunitySitePoster([healthy.url, failing.url], failure_threshold=2)
+        try:
+            for _ in range(3):
+                good, bad = poster.post("Hello")
+        finally:
+            poster.close()
+    assert good.success and good.status_code == 200
+    assert bad.skipped and bad.error == "circuit open"
+    assert healthy.post_count == 3 and failing.post_count == 2
+    assert poster.breaker_states()[f"{failing.host}:{failing.port}"] == OPEN
+
+
+def test_slow_drip_ends_at_total_deadline():
+    with SiteStub(drip="body", drip_seconds=0.05) as body, SiteStub(drip="headers", drip_seconds=0.05) as headers:
+        poster = CommunitySitePoster([body.url, headers.url], timeout_seconds=0.5, total_timeout_seconds=0.6)
+        started = time.perf_counter()
+        try:
+            results = poster.post("Hello")
+        finally:
+            poster.close()
+        elapsed = time.perf_counter() - started
+    assert elapsed < 1.5
+    for result in results:
+        assert not result.success
+        assert "in total" in result.error and result.elapsed < 1.0
+
+
+def test_post_leaves_no_worker_threads_behind():
+    before = threading.active_count()
+    with SiteStub(drip="headers", drip_seconds=0.05) as stub:
+        poster = CommunitySitePoster([stub.url] * 3, timeout_seconds=0.5, total_timeout_seconds=0.3)
+        try:
+            poster.post("Hello")
+        finally:
+            poster.close()
+    assert threading.active_count() <= before
+
+
+def test_overrunning_post_is_counted_once():
+    with SiteStub(delay=0.3) as stub:
+        poster = CommunitySitePoster([stub.url])
+        site = poster.sites[0]
+        claim = threading.Lock()
+        failed, posted = posts(stub, "failed"), posts(stub, "posted")
+        try:
+            overran = poster._overran(site, 0.1, claim)
+            late = poster._post_one(site, "Hello", None, claim)
+        finally:
+            poster.close()
+    assert not overran.success and late.success
+    assert posts(stub, "failed") == failed + 1
+    assert posts(stub, "posted") == posted
+    assert poster.host(f"{stub.host}:{stub.port}").breaker.failures == 1
@@ -0,0 +1,84 @@
+import base64
+import hashlib
+import re
+
+import pytest
+
+pytest.importorskip("cryptography")
+
+from cryptography.exceptions import InvalidSignature  # noqa: E402
+from cryptography.hazmat.primitives import hashes  # noqa: E402
+from cryptography.hazmat.primitives.asymmetric import ed25519, padding, rsa  # noqa: E402
+
+from dkim_signer import DKIMSigner  # noqa: E402
+
+MESSAGE = (
+    b"From: Senior Support <help@seniorservices.com>\r\n"
+    b"To: Mary Smith <mary@example.com>\r\n"
+    b"Subject:  A friendly\r\n\thello   from us \r\n"
+    b"Date: Mon, 04 May 2026 09:00:00 +0000\r\n"
+    b"Message-ID: <1@seniorservices.com>\r\n"
+    b"MIME-Version: 1.0\r\n"
+    b"Content-Type: text/plain; charset=utf-8\r\n"
+    b"X-Not-Signed: anything\r\n"
+    b"\r\n"
+    b"Hello Mary,\r\n\r\nWe are here to help.\r\n\r\n\r\n"
+)
+
+
+def relaxed(name, value):
+    # RFC 6376 section 3.4.2, written out separately from the signer's version
+    value = re.sub(r"\r\n(?=[ \t])", "", value)
+    value = re.sub(r"[ \t]+", " ", value).strip()
+    return f"{name.strip().lower()}:{value}\r\n"
+
+
+def verify(signed, public_key):
+    """Check a signed message the way a receiving server would"""
+    text = signed.decode("utf-8")
+    header_block, body = text.split("\r\n\r\n", 1)
+    fields = re.findall(r"^([^\s:]+):([^\r\n]*(?:\r\n[ \t][^\r\n]*)*)", header_block, re.MULTILINE)
+    name, signature_value = fields[0]
+    assert name == "DKIM-Signature"
+    tags = dict(tag.strip().split("=", 1) for tag in re.sub(r"\s+", "", signature_value).split(";") if tag)
+
+    body = re.sub(r"(\r\n)*$", "", body) + "\r\n"
+    assert base64.b64decode(tags["bh"]) == hashlib.sha256(body.encode("utf-8")).digest(), "body hash"
+
+    headers = {field.lower(): value for field, value in fields[1:]}
+    data = "".join(relaxed(field, headers[field]) for field in tags["h"].split(":"))
+    unsigned = re.sub(r"b=[^;]*$", "b=", signature_value.rstrip())
+    data += relaxed("DKIM-Signature", unsigned).rstrip("\r\n")
+    signature = base64.b64decode(tags["b"])
+    if tags["a"] == "rsa-sha256":
+        public_key.verify(signature, data.encode("utf-8"), padding.PKCS1v15(), hashes.SHA256())
+    else:
+        public_key.verify(signature, hashlib.sha256(data.encode("utf-8")).digest())
+    return tags
+
+
+@pytest.fixture(params=["rsa", "ed25519"])
+def private_key(request):
+    if request.param == "rsa":
+        return rsa.generate_private_key(public_exponent=65537, key_size=2048)
+    return ed25519.Ed25519PrivateKey.generate()
+
+
+def test_signature_verifies_against_public_key(private_key):
+    signer = DKIMSigner("seniorservices.com", "senior", private_key)
+    tags = verify(signer.sign(MESSAGE), private_key.public_key())
+    assert tags["d"] == "seniorservices.com" and tags["s"] == "senior"
+    assert tags["h"] == "from:to:subject:date:message-id:mime-version:content-type"
+
+
+def test_precomputed_body_hash_matches(private_key):
+    signer = DKIMSigner("seniorservices.com", "senior", private_key)
+    body = MESSAGE.partition(b"\r\n\r\n")[2]
+    verify(signer.sign(MESSAGE, signer.body_hash(body)), private_key.public_key())
+
+
+def test_tampered_header_fails(private_key):
+    signed = DKIMSigner("seniorservices.com", "senior", private_key).sign(MESSAGE)
+    tampered = signed.replace(b"mary@example.com", b"someone@example.com")
+    with pytest.raises(InvalidSignature):
+        verify(tampered, private_key.public_key())
@@ -0,0 +1,100 @@
+import logging
+import threading
+
+from email_campaign import SeniorEmailCampaign
+from email_delivery import DeliveryEngine, DeliveryResult
+from message_variants import ASSIGNMENT_PERSON, VARIANTS
+from smtp_sink import SMTPSink
+
+
+def recipients(count):
+    return [f"Reader {i} <reader{i}@example.com>" for i in range(count)]
+
+
+def test_raising_callback_does_not_stop_campaign(sink, email_config):
+    campaign = SeniorEmailCampaign({"platforms": {"email": email_config}})
+    calls = []
+
+    def on_result(index, result):
+        calls.append(index)
+        raise ValueError("callback broke")
+
+    finished = []
+    thread = threading.Thread(target=lambda: finished.append(
+        campaign.send_email_campaign(recipients(50), "Hello", "Body", on_result=on_result)), daemon=True)
+    thread.start()
+    thread.join(30)
+
+    assert not thread.is_alive(), "campaign hung after its callback raised"
+    assert finished == [True]
+    assert sorted(calls) == list(range(50))
+    assert sink.message_count == 50
+
+
+def test_feeder_aborts_when_every_worker_died(sink, email_config, monkeypatch):
+    engine = DeliveryEngine({"platforms": {"email": email_config}})
+
+    def crash(recipient, build_message):
+        raise RuntimeError("worker bug")
+
+    monkeypatch.setattr(engine, "_send_one", crash)
+    # Keep the dying threads from printing tracebacks into the test output
+    monkeypatch.setattr(threading, "excepthook", lambda args: None)
+
+    outcome = []
+
+    def run():
+        try:
+            engine.deliver((f"r{i}@example.com" for i in range(1000)), lambda r: (r, b""))
+        except RuntimeError as e:
+            outcome.append(str(e))
+
+    thread = threading.Thread(target=run, daemon=True)
+    thread.start()
+    thread.join(30)
+
+    assert not thread.is_alive(), "feeder blocked on a queue nobody reads"
+    assert outcome and "worker" in outcome[0]
+
+
+def test_callback_sees_each_result_once(sink, email_config):
+    engine = DeliveryEngine({"platforms": {"email": email_config}})
+    seen = []
+    summary = engine.deliver([f"r{i}@example.com" for i in range(20)],
+                             lambda r: (r, b"Subject: hi\r\n\r\nbody\r\n"),
+                             lambda index, result: seen.append((index, isinstance(result, DeliveryResult))))
+    assert summary.sent == 20
+    assert sorted(seen) == [(i, True) for i in range(20)]
+
+
+def test_missing_sender_fails_the_campaign(sink, email_config, caplog):
+    email_config["username"] = ""
+    campaign = SeniorEmailCampaign({"platforms": {"email": email_config}})
+    assert campaign.send_email_campaign(recipients(3), "Hello", "Body") is False
+    assert "username must be an email address" in caplog.text
+    assert sink.message_count == 0
+
+
+def test_variant_assignment_is_logged_without_outbox(sink, email_config, caplog):
+    variants = VARIANTS.get("Test", "Help", "Call us")
+    campaign = SeniorEmailCampaign({"platforms": {"email": email_config}})
+    with caplog.at_level(logging.INFO, logger="email_campaign"):
+        assert campaign.send_email_campaign(recipients(6), "Hello", variants)
+    line = next(message for message in caplog.messages if message.startswith("Message variants"))
+    assert variants.key in line and ASSIGNMENT_PERSON.decode() in line
+    assert all(f"{variant.id}=" in line for variant in variants.variants)
+
+
+def test_every_message_arrives_once_despite_faults():
+    faults = {"drop_every": 7, "defer_every": 5, "fail_logins": 1, "session_messages": 10}
+    with SMTPSink(**faults) as faulty:
+        config = faulty.email_config(pool_size=2, workers=2, retry={"max_attempts": 6, "base_delay_seconds": 0.01, "max_delay_seconds": 0.05})
+        campaign = SeniorEmailCampaign({"platforms": {"email": config}})
+        assert campaign.send_email_campaign(recipients(60), "Hello", "Body")
+
+    summary = campaign.last_summary
+    assert faulty.faults_injected > 0 and summary.retried > 0
+    assert summary.sent == 60 and not summary.failed
+    # Dropped connections hang up before the sink counts the message, so
+    # anything over 60 here would be a retry that sent a message twice
+    assert faulty.recipient_count == faulty.message_count == 60
@@ -0,0 +1,80 @@
+import threading
+import time
+
+import pytest
+
+from facebook_client import MAYBE_POSTED, FacebookGraphClient
+from graph_stub import GraphStub
+
+GROUPS = [f"group{i}" for i in range(120)]
+
+
+def post(stub, group_ids=GROUPS, cancel=None, **kwargs):
+    client = FacebookGraphClient.from_config(stub.facebook_config(group_ids, max_retries=8),
+                                             backoff_seconds=0.001, **kwargs)
+    try:
+        return client.post_to_groups(group_ids, "Hello", cancel)
+    finally:
+        client.close()
+
+
+def test_posts_every_group_once_in_batches():
+    with GraphStub() as stub:
+        results = post(stub)
+    assert all(result.success for result in results)
+    assert [result.group_id for result in results] == GROUPS
+    assert stub.posts == {group_id: 1 for group_id in GROUPS}
+    assert stub.request_count == 3
+
+
+def test_throttled_batch_is_resent():
+    with GraphStub(throttle_requests=2) as stub:
+        results = post(stub)
+    assert all(result.success for result in results)
+    assert not stub.double_posted()
+    assert stub.post_count == len(GROUPS)
+
+
+@pytest.mark.parametrize("faults", [{"null_every": 7}, {"rate_limit_every": 5}])
+def test_only_unexecuted_operations_are_resent(faults):
+    with GraphStub(**faults) as stub:
+        results = post(stub)
+    assert all(result.success for result in results)
+    assert not stub.double_posted()
+    # One resend per operation the stub turned away, and no others
+    assert stub.faults_injected
+    assert sum(result.attempts - 1 for result in results) == stub.faults_injected
+
+
+def test_lost_reply_is_not_resent():
+    with GraphStub(fail_requests=1) as stub:
+        results = post(stub)
+    unknown = [result for result in results if not result.success]
+    assert len(unknown) == 50
+    assert all(MAYBE_POSTED in result.error and result.attempts == 1 for result in unknown)
+    # The batch ran on the server, so nothing was posted twice
+    assert not stub.double_posted()
+    assert stub.post_count == len(GROUPS)
+
+
+def test_read_timeout_is_not_resent():
+    with GraphStub(stall_requests=1, stall_seconds=1.0) as stub:
+        results = post(stub, timeout=0.2)
+    assert sum(not result.success for result in results) == 50
+    assert not stub.double_posted()
+
+
+def test_cancel_wakes_backoff():
+    cancel = threading.Event()
+    with GraphStub(throttle_requests=100) as stub:
+        client = FacebookGraphClient.from_config(stub.facebook_config(GROUPS[:10], max_retries=8),
+                                                 backoff_seconds=30)
+        threading.Timer(0.2, cancel.set).start()
+        started = time.perf_counter()
+        try:
+            results = client.post_to_groups(GROUPS[:10], "Hello", cancel)
+        finally:
+            client.close()
+    assert time.perf_counter() - started < 5
+    assert all(result.error == "HTTP 429" and not result.success for result in results)
+    assert stub.post_count == 0
@@ -0,0 +1,38 @@
+from email_campaign import SeniorEmailCampaign
+from metrics import MESSAGES, SEND_SECONDS, MetricsRegistry
+
+
+def test_snapshot_since_and_merge():
+    registry = MetricsRegistry()
+    latency = registry.histogram("latency_seconds", "Latency", ["path"], buckets=(0.1, 1.0))
+    requests = registry.counter("requests_total", "Requests", ["result"])
+    latency.labels("a").observe(0.05)
+    requests.labels("ok").inc()
+    baseline = latency.snapshot(), requests.snapshot()
+
+    latency.labels("a").observe(0.5)
+    latency.labels("b").observe(5.0)
+    requests.labels("ok").inc(2)
+
+    parent = MetricsRegistry()
+    merged_latency = parent.histogram("latency_seconds", "Latency", ["path"], buckets=(0.1, 1.0))
+    merged_requests = parent.counter("requests_total", "Requests", ["result"])
+    merged_latency.merge(latency.snapshot(baseline[0]))
+    merged_requests.merge(requests.snapshot(baseline[1]))
+    merged_latency.merge(latency.snapshot(baseline[0]))
+
+    assert merged_latency.labels("a").state() == ([0, 2, 0], 1.0, 2)
+    assert merged_latency.labels("b").state() == ([0, 0, 2], 10.0, 2)
+    assert merged_requests.labels("ok").value == 2
+
+
+def test_sharded_campaign_reports_stage_metrics(sink, email_config):
+    email_config["shards"] = 2
+    sends, sent = SEND_SECONDS.labels().count, MESSAGES.labels("sent").value
+    campaign = SeniorEmailCampaign({"platforms": {"email": email_config}})
+
+    assert campaign.send_email_campaign([f"r{i}@example.com" for i in range(40)], "Hello", "Body")
+    assert sink.message_count == 40
+    # Sends happened in the worker processes but show up in this one's registry
+    assert SEND_SECONDS.labels().count - sends == 40
+    assert MESSAGES.labels("sent").value - sent == 40
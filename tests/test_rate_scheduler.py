@@ -0,0 +1,102 @@
+from email_campaign import SeniorEmailCampaign
+from rate_scheduler import DomainRateScheduler, TokenBucket
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+
+    def sleep(self, seconds):
+        self.now += seconds
+
+
+def scheduler(clock, **kwargs):
+    return DomainRateScheduler(clock=clock, sleep=clock.sleep, **kwargs)
+
+
+def release_times(clock, scheduler, addresses):
+    released = []
+    for address in scheduler.schedule((address, address) for address in addresses):
+        released.append((clock(), address))
+    return released
+
+
+def test_token_bucket_refills_at_rate():
+    clock = FakeClock()
+    bucket = TokenBucket(2.0, clock=clock)
+    assert bucket.take() and bucket.take()
+    assert not bucket.take()
+    assert bucket.wait_time() == 0.5
+    clock.now = 0.5
+    assert bucket.take()
+
+
+def test_domain_rate_is_respected():
+    clock = FakeClock()
+    released = release_times(clock, scheduler(clock, global_rate=100, domain_rate=1),
+                             [f"r{i}@slow.example" for i in range(5)])
+    times = [when for when, _ in released]
+    assert times == [0.0, 1.0, 2.0, 3.0, 4.0]
+
+
+def test_global_rate_caps_many_domains():
+    clock = FakeClock()
+    released = release_times(clock, scheduler(clock, global_rate=2, domain_rate=100),
+                             [f"r@d{i}.example" for i in range(10)])
+    assert len(released) == 10
+    # Two go out from the full bucket, then one every half second
+    assert released[-1][0] == 4.0
+
+
+def test_busy_domain_does_not_block_others():
+    clock = FakeClock()
+    addresses = [f"r{i}@busy.example" for i in range(10)] + ["r@quiet.example"]
+    released = release_times(clock, scheduler(clock, global_rate=100, domain_rate=1), addresses)
+    quiet = next(when for when, address in released if address.endswith("quiet.example"))
+    assert quiet < 1.0
+
+
+def test_per_domain_override():
+    clock = FakeClock()
+    released = release_times(
+        clock, scheduler(clock, global_rate=100, domain_rate=1, domain_rates={"FAST.example": 4}),
+        [f"r{i}@fast.example" for i in range(8)])
+    assert released[-1][0] == 1.0
+
+
+def test_acquire_shares_buckets_with_schedule():
+    clock = FakeClock()
+    limiter = scheduler(clock, global_rate=100, domain_rate=1)
+    assert list(limiter.schedule([("first", "a@slow.example")])) == ["first"]
+    limiter.acquire("b@slow.example")
+    assert clock() == 1.0
+    limiter.acquire("c@other.example")
+    assert clock() == 1.0
+    assert limiter.throttled_seconds == 1.0
+
+
+def test_retries_pass_through_scheduler(sink, email_config, monkeypatch):
+    sink.defer_every = 3
+    acquired = []
+    original = DomainRateScheduler.acquire
+
+    def acquire(self, address):
+        acquired.append(address)
+        original(self, address)
+
+    monkeypatch.setattr(DomainRateScheduler, "acquire", acquire)
+    config = {
+        "platforms": {"email": email_config},
+        "compliance": {"respect_rate_limits": True,
+                       "rate_limits": {"global_per_minute": 60000, "per_domain_per_minute": 60000}},
+    }
+    campaign = SeniorEmailCampaign(config)
+
+    assert campaign.send_email_campaign([f"r{i}@example.com" for i in range(12)], "Hello", "Body")
+    assert sink.faults_injected
+    # One token per resend, none for first attempts, which come through schedule()
+    assert len(acquired) == campaign.last_summary.retried == sink.faults_injected
+    assert sink.message_count == 12
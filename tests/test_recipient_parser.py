@@ -0,0 +1,89 @@
+import csv
+import os
+
+import pytest
+
+from recipient_parser import (DUPLICATE, INVALID, MISSING, MULTIPLE, AddressIndex, Recipient, RecipientParser,
+                              parse_recipient)
+
+
+@pytest.mark.parametrize("entry, expected", [
+    ("reader@example.com", Recipient("", "reader@example.com")),
+    ("  Reader@Example.COM ", Recipient("", "reader@example.com")),
+    ("Mary Smith <Mary@Example.com>", Recipient("Mary Smith", "mary@example.com")),
+    ('"Smith, Mary" <mary@example.com>', Recipient("Smith, Mary", "mary@example.com")),
+    ("mary@example.com (Mary)", Recipient("Mary", "mary@example.com")),
+    ("reader@Bücher.example", Recipient("", "reader@xn--bcher-kva.example")),
+    ("o'brien+news@example.co.uk", Recipient("", "o'brien+news@example.co.uk")),
+])
+def test_valid_entries(entry, expected):
+    assert parse_recipient(entry) == (expected, None)
+
+
+@pytest.mark.parametrize("entry, reason", [
+    ("", MISSING),
+    ("Mary Smith", INVALID),
+    ("a@example.com, b@example.com", MULTIPLE),
+    ("no-at-sign.example.com", INVALID),
+    (".reader@example.com", INVALID),
+    ("re..ader@example.com", INVALID),
+    ("reader@-example.com", INVALID),
+    ("reader@example", INVALID),
+    ("x" * 65 + "@example.com", INVALID),
+    ("reader@" + "a" * 250 + ".com", INVALID),
+])
+def test_invalid_entries(entry, reason):
+    assert parse_recipient(entry) == (None, reason)
+
+
+def test_recipient_round_trips_through_str():
+    for recipient in (Recipient("", "a@example.com"), Recipient("Mary Smith", "m@example.com"),
+                      Recipient('Smith, "Mary"', "m@example.com")):
+        assert parse_recipient(str(recipient)) == (recipient, None)
+
+
+def test_address_index_keeps_first_row(tmp_path):
+    path = str(tmp_path / "index.db")
+    index = AddressIndex(path, scope="campaign")
+    assert index.first_rows([("a@example.com", 0), ("b@example.com", 1)]) == {"a@example.com": 0, "b@example.com": 1}
+    assert index.first_rows([("a@example.com", 5), ("c@example.com", 6)]) == {"a@example.com": 0, "c@example.com": 6}
+    # Re-reading a row after a restart is not a duplicate of itself
+    assert index.first_rows([("b@example.com", 1)]) == {"b@example.com": 1}
+    index.close()
+
+    other = AddressIndex(path, scope="other")
+    assert other.first_rows([("a@example.com", 9)]) == {"a@example.com": 9}
+    other.close()
+
+
+def test_temporary_index_is_removed():
+    index = AddressIndex()
+    index.first_rows([("a@example.com", 0)])
+    index.close()
+    assert not os.path.exists(index.path)
+
+
+def test_parser_dedupes_across_chunks_and_reports_rejects(tmp_path):
+    report = tmp_path / "rejected.csv"
+    parser = RecipientParser(report_path=str(report), chunk_size=3)
+    entries = ["a@example.com", "bad", "B <b@example.com>", "A@example.com", "c@example.com", "b@example.com"]
+    parsed = list(parser.parse(entries))
+
+    assert parsed == [(0, Recipient("", "a@example.com")), (2, Recipient("B", "b@example.com")),
+                      (4, Recipient("", "c@example.com"))]
+    assert (parser.summary.accepted, parser.summary.duplicates, parser.summary.invalid) == (3, 2, 1)
+    with open(report, newline="", encoding="utf-8") as f:
+        rows = list(csv.reader(f))
+    assert rows == [["row", "entry", "reason"], ["2", "bad", INVALID], ["4", "A@example.com", DUPLICATE],
+                    ["6", "b@example.com", DUPLICATE]]
+
+
+def test_resumed_parse_skips_rows_read_before(tmp_path):
+    index_path = str(tmp_path / "index.db")
+    entries = [f"r{i}@example.com" for i in range(6)] + ["r1@example.com"]
+    first = RecipientParser(chunk_size=2).parse(entries[:4], index_path=index_path, scope="c")
+    assert [row for row, _ in first] == [0, 1, 2, 3]
+
+    # Rows 2 and 3 are read again, as after a crash before they were sent
+    resumed = RecipientParser(chunk_size=2).parse(entries[2:], start=2, index_path=index_path, scope="c")
+    assert [row for row, _ in resumed] == [2, 3, 4, 5]
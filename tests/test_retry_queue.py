@@ -0,0 +1,54 @@
+from retry_queue import RetryPolicy, RetryQueue
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+
+
+def test_backoff_doubles_within_jitter_and_caps():
+    low = RetryPolicy(base_delay=2.0, max_delay=10.0, rng=lambda: 0.0)
+    high = RetryPolicy(base_delay=2.0, max_delay=10.0, rng=lambda: 0.999999)
+    assert [low.delay(n) for n in (1, 2, 3, 4, 5)] == [1.0, 2.0, 4.0, 5.0, 5.0]
+    assert [round(high.delay(n), 3) for n in (1, 2, 3, 4, 5)] == [2.0, 4.0, 8.0, 10.0, 10.0]
+
+
+def test_should_retry_only_transient_failures_below_the_limit():
+    policy = RetryPolicy(max_attempts=3)
+    assert policy.should_retry(1, transient=True)
+    assert policy.should_retry(2, transient=True)
+    assert not policy.should_retry(3, transient=True)
+    assert not policy.should_retry(1, transient=False)
+    assert RetryPolicy(max_attempts=0).max_attempts == 1
+
+
+def test_from_config_reads_retry_settings():
+    policy = RetryPolicy.from_config({"retry": {"max_attempts": 6, "base_delay_seconds": 0.5}})
+    assert (policy.max_attempts, policy.base_delay, policy.max_delay) == (6, 0.5, 60.0)
+
+
+def test_queue_releases_jobs_when_due_in_order():
+    clock = FakeClock()
+    retries = RetryQueue(clock=clock)
+    retries.push("late", 5.0)
+    retries.push("early", 1.0)
+    retries.push("also early", 1.0)
+    assert retries.due() == []
+
+    clock.now = 1.0
+    assert retries.due() == ["early", "also early"]
+    assert len(retries) == 1
+    clock.now = 5.0
+    assert retries.next_due(timeout=0) == ["late"]
+
+
+def test_next_due_tells_waiting_from_done():
+    retries = RetryQueue(clock=FakeClock())
+    retries.begin()
+    # A job is still being attempted, so it may yet come back
+    assert retries.next_due(timeout=0) == []
+    retries.end()
+    assert retries.next_due(timeout=0) is None
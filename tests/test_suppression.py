@@ -0,0 +1,41 @@
+import sqlite3
+
+from recipient_parser import parse_recipient
+from suppression import BOUNCE, UNSUBSCRIBE, SuppressionIndex
+
+
+def lookup(entry):
+    # The form the send path checks, as the campaign parses it
+    return parse_recipient(entry)[0].address
+
+
+def test_idn_addresses_match_parsed_recipients(tmp_path):
+    with SuppressionIndex(str(tmp_path / "suppressions.db")) as index:
+        assert index.add("Reader <Reader@Bücher.Example>", UNSUBSCRIBE)
+        assert not index.add("reader@xn--bcher-kva.example", BOUNCE)
+        assert lookup("reader@bücher.example") in index
+        assert lookup("other@bücher.example") not in index
+        assert len(index) == 1
+
+
+def test_invalid_addresses_are_skipped(tmp_path):
+    with SuppressionIndex(str(tmp_path / "suppressions.db")) as index:
+        added = index.add_many([("not an address", BOUNCE), ("a..b@example.com", BOUNCE),
+                                (" Someone@Example.com ", BOUNCE)])
+        assert added == 1
+        assert "someone@example.com" in index
+
+
+def test_unicode_entries_from_older_lists_are_normalized(tmp_path):
+    path = str(tmp_path / "suppressions.db")
+    SuppressionIndex(path).close()
+    conn = sqlite3.connect(path)
+    with conn:
+        conn.execute("INSERT INTO suppressions (address, reason) VALUES (?, ?)", ("reader@bücher.example", BOUNCE))
+    conn.close()
+
+    with SuppressionIndex(path) as index:
+        assert lookup("reader@bücher.example") in index
+        assert len(index) == 1
+    with SuppressionIndex(path, read_only=True) as index:
+        assert lookup("Reader <reader@BÜCHER.example>") in index
@@ -0,0 +1,120 @@
+import json
+from datetime import datetime, time, timedelta, timezone
+from zoneinfo import ZoneInfo
+
+import pytest
+
+import senior_advertising_bot
+from window_scheduler import WindowScheduler, parse_time_range
+
+NEW_YORK = ZoneInfo("America/New_York")
+
+
+def at(year, month, day, hour, minute=0, zone=NEW_YORK):
+    return datetime(year, month, day, hour, minute, tzinfo=zone)
+
+
+def morning_scheduler(**kwargs):
+    return WindowScheduler([(time(9), time(11))], default_timezone="America/New_York", **kwargs)
+
+
+def test_parse_time_range():
+    assert parse_time_range(" 9:00 - 11:30 ") == (time(9), time(11, 30))
+    with pytest.raises(ValueError):
+        parse_time_range("11:00-9:00")
+    with pytest.raises(ValueError):
+        parse_time_range("morning")
+
+
+def test_quiet_hours_trim_windows():
+    scheduler = WindowScheduler([(time(6), time(9)), (time(21), time(23))])
+    assert scheduler.windows == [(time(8), time(9)), (time(21), time(22))]
+
+
+def test_daily_window_keeps_wall_time_across_spring_forward():
+    scheduler = morning_scheduler()
+    saturday = at(2026, 3, 7, 9, 30)
+    assert scheduler.due_timezones(saturday) == ["America/New_York"]
+    scheduler.record_cycle(["America/New_York"], saturday)
+
+    # Only 23 real hours pass before Sunday's 9:00, which must still be due
+    sunday = scheduler.next_cycle_time(saturday)
+    assert sunday == at(2026, 3, 8, 9)
+    assert sunday.astimezone(timezone.utc) - at(2026, 3, 7, 9).astimezone(timezone.utc) == timedelta(hours=23)
+    assert scheduler.due_timezones(sunday) == ["America/New_York"]
+
+
+def test_windows_follow_each_recipient_timezone():
+    scheduler = morning_scheduler(recipient_timezones=["Europe/London"])
+    moment = datetime(2026, 6, 1, 9, 30, tzinfo=ZoneInfo("Europe/London"))
+    assert scheduler.due_timezones(moment) == ["Europe/London"]
+    assert scheduler.next_cycle_time(moment) == moment
+
+
+def test_unfinished_window_is_retried_while_open():
+    scheduler = morning_scheduler(retry_minutes=15)
+    start = at(2026, 5, 4, 9, 0)
+    scheduler.record_cycle([], start, unfinished=["America/New_York"])
+
+    assert scheduler.is_retry("America/New_York", start)
+    assert scheduler.due_timezones(start + timedelta(minutes=5)) == []
+    assert scheduler.next_cycle_time(start) == start + timedelta(minutes=15)
+    assert scheduler.due_timezones(start + timedelta(minutes=15)) == ["America/New_York"]
+
+    scheduler.record_cycle(["America/New_York"], start + timedelta(minutes=15), count_post=False)
+    assert not scheduler.is_retry("America/New_York", start + timedelta(minutes=20))
+    assert scheduler.next_cycle_time(start + timedelta(minutes=20)) == at(2026, 5, 5, 9)
+
+
+def test_retry_past_window_end_waits_for_next_window():
+    scheduler = morning_scheduler(retry_minutes=30)
+    late = at(2026, 5, 4, 10, 45)
+    scheduler.record_cycle([], late, unfinished=["America/New_York"])
+    assert scheduler.next_cycle_time(late) == at(2026, 5, 5, 9)
+
+
+def test_daily_post_limit():
+    scheduler = WindowScheduler([(time(9), time(10)), (time(13), time(14))],
+                                default_timezone="UTC", frequency_hours=0, max_posts_per_day=1)
+    morning = datetime(2026, 5, 4, 9, 30, tzinfo=timezone.utc)
+    scheduler.record_cycle(["UTC"], morning)
+    assert not scheduler.can_post(morning)
+    assert scheduler.next_cycle_time(morning) == datetime(2026, 5, 5, 9, tzinfo=timezone.utc)
+
+
+def bot(tmp_path, monkeypatch, now):
+    monkeypatch.setattr(senior_advertising_bot, "configure_logging", lambda settings: None)
+    config = {
+        "business_name": "Test", "target_message": "Help", "contact_info": "Call us",
+        "platforms": {
+            "email": {"enabled": True, "smtp_server": "127.0.0.1", "smtp_port": 2525,
+                      "username": "bot@example.com", "recipients": ["reader@example.com"]},
+        },
+        "posting_schedule": {"timezone": "America/New_York", "retry_minutes": 15,
+                             "senior_friendly_times": ["9:00-11:00"]},
+    }
+    path = tmp_path / "config.json"
+    path.write_text(json.dumps(config))
+    return senior_advertising_bot.SeniorAdvertisingBot(str(path), clock=lambda: now)
+
+
+def test_window_stays_open_when_email_run_reports_failure(tmp_path, monkeypatch):
+    now = at(2026, 5, 4, 9, 30)
+    advertiser = bot(tmp_path, monkeypatch, now)
+    # Caught failures come back as a normal False return, not an exception
+    monkeypatch.setattr(advertiser, "send_email_campaign", lambda *args: False)
+    advertiser.run_advertising_cycle()
+
+    assert advertiser.last_cycle_report.result("email").status == senior_advertising_bot.OK
+    assert advertiser.window_scheduler.is_retry("America/New_York", now)
+    assert "America/New_York" not in advertiser.window_scheduler.last_served
+
+
+def test_window_served_when_email_run_finished(tmp_path, monkeypatch):
+    now = at(2026, 5, 4, 9, 30)
+    advertiser = bot(tmp_path, monkeypatch, now)
+    monkeypatch.setattr(advertiser, "send_email_campaign", lambda *args: True)
+    advertiser.run_advertising_cycle()
+
+    assert not advertiser.window_scheduler.is_retry("America/New_York", now)
+    assert advertiser.window_scheduler.last_served["America/New_York"] == at(2026, 5, 4, 9)
@@ -0,0 +1,322 @@
+"""
+Window scheduler for Senior Advertising Bot
+Works out when senior-friendly posting windows open in each recipient
+timezone, so the bot sleeps straight to the next valid window
+"""
+
+import logging
+import os
+import re
+from datetime import date, datetime, time, timedelta, timezone, tzinfo
+from typing import Callable, Dict, Iterable, Iterator, List, Optional, Tuple
+from zoneinfo import ZoneInfo, ZoneInfoNotFoundError
+
+DEFAULT_WINDOWS = {
+    "morning": "9:00-11:00",
+    "afternoon": "13:00-15:00",
+    "evening": "18:00-20:00",
+}
+
+# Nothing goes out before 8 AM or after 10 PM when quiet hours are respected
+QUIET_HOURS_END = time(8, 0)
+QUIET_HOURS_START = time(22, 0)
+
+# System timezone file on Linux and macOS, usually a link into the zoneinfo tree
+LOCALTIME = "/etc/localtime"
+
+TIME_RANGE = re.compile(r"\s*(\d{1,2}):(\d{2})\s*-\s*(\d{1,2}):(\d{2})\s*")
+
+Window = Tuple[datetime, datetime]
+
+logger = logging.getLogger(__name__)
+
+
+def parse_time_range(text: str) -> Tuple[time, time]:
+    """Parse "9:00-11:00" into (start, end) times"""
+    match = TIME_RANGE.fullmatch(text)
+    if not match:
+        raise ValueError(f"Invalid time range {text!r}, expected H:MM-H:MM")
+    start_hour, start_minute, end_hour, end_minute = map(int, match.groups())
+    start, end = time(start_hour, start_minute), time(end_hour, end_minute)
+    if end <= start:
+        raise ValueError(f"Time range {text!r} must end after it starts")
+    return start, end
+
+
+def _zone_file(path: str) -> Optional[tzinfo]:
+    """Zone of a TZif file, by its IANA name when it is a link into a zoneinfo tree"""
+    key = os.path.realpath(path).partition("/zoneinfo/")[2]
+    if key:
+        try:
+            return ZoneInfo(key)
+        except (ZoneInfoNotFoundError, ValueError):
+            pass
+    try:
+        with open(path, "rb") as f:
+            return ZoneInfo.from_file(f, key=key or path)
+    except (OSError, ValueError):
+        return None
+
+
+def local_timezone() -> tzinfo:
+    """The system timezone with its DST rules, from $TZ or /etc/localtime
+
+    Where neither names a zone (e.g. on Windows) this falls back to today's
+    fixed UTC offset, which goes wrong at the next DST change; set
+    posting_schedule.timezone to an IANA name there.
+    """
+    name = os.environ.get("TZ", "").lstrip(":")
+    if name:
+        if os.path.isabs(name):
+            zone = _zone_file(name)
+            if zone is not None:
+                return zone
+        else:
+            try:
+                return ZoneInfo(name)
+            except (ZoneInfoNotFoundError, ValueError):
+                pass
+    if os.path.exists(LOCALTIME):
+        zone = _zone_file(LOCALTIME)
+        if zone is not None:
+            return zone
+    logger.warning("Could not find the local timezone's rules; using a fixed UTC offset. "
+                   "Set posting_schedule.timezone to an IANA name such as America/New_York.")
+    return datetime.now().astimezone().tzinfo
+
+
+class WindowScheduler:
+    """Computes posting windows per timezone from the configured time ranges
+
+    A timezone is due when one of its windows is open now, that window has
+    not been served yet, and at least ``frequency_hours`` of local wall time
+    separate it from the last window served there. A window whose cycle did
+    not finish is due again ``retry_minutes`` later while it is still open.
+    ``clock`` returns an aware datetime and is injectable for tests.
+    """
+
+    def __init__(
+        self,
+        windows: List[Tuple[time, time]],
+        default_timezone: str = "local",
+        recipient_timezones: Iterable[str] = (),
+        frequency_hours: float = 24,
+        max_posts_per_day: int = 3,
+        respect_quiet_hours: bool = True,
+        retry_minutes: float = 15,
+        clock: Optional[Callable[[], datetime]] = None,
+    ):
+        if respect_quiet_hours:
+            windows = [
+                (max(start, QUIET_HOURS_END), min(end, QUIET_HOURS_START))
+                for start, end in windows
+            ]
+            windows = [(start, end) for start, end in windows if start < end]
+        if not windows:
+            raise ValueError("No posting windows left to schedule")
+
+        self.windows = sorted(windows)
+        self.frequency = timedelta(hours=frequency_hours)
+        self.max_posts_per_day = max_posts_per_day
+        self.retry_delay = timedelta(minutes=retry_minutes)
+        self.clock = clock or (lambda: datetime.now(timezone.utc))
+        self.default_timezone = default_timezone or "local"
+        self._zones: Dict[str, tzinfo] = {}
+        self.timezones = list(dict.fromkeys([self.default_timezone, *recipient_timezones]))
+        for name in self.timezones:
+            self.zone(name)
+
+        self.last_served: Dict[str, datetime] = {}
+        self.posts_by_day: Dict[date, int] = {}
+        # Timezone -> (start of the unfinished window, when to retry it)
+        self.retries: Dict[str, Tuple[datetime, datetime]] = {}
+
+    @classmethod
+    def from_config(cls, config: dict, **kwargs) -> "WindowScheduler":
+        schedule = config.get('posting_schedule', {})
+        ranges = schedule.get('senior_friendly_times') or DEFAULT_WINDOWS
+        if isinstance(ranges, dict):
+            ranges = list(ranges.values())
+        return cls(
+            [parse_time_range(text) for text in ranges],
+            default_timezone=schedule.get('timezone', 'local'),
+            recipient_timezones=schedule.get('recipient_timezones', []),
+            frequency_hours=schedule.get('frequency_hours', 24),
+            max_posts_per_day=schedule.get('max_posts_per_day', 3),
+            respect_quiet_hours=schedule.get('respect_quiet_hours', True),
+            retry_minutes=schedule.get('retry_minutes', 15),
+            **kwargs
+        )
+
+    def now(self) -> datetime:
+        return self.clock()
+
+    def carry_over(self, previous: "WindowScheduler"):
+        """Keep what ``previous`` already served, e.g. when the schedule is reloaded"""
+        self.last_served = {name: served for name, served in previous.last_served.items() if name in self.timezones}
+        self.posts_by_day = dict(previous.posts_by_day)
+        self.retries = {name: retry for name, retry in previous.retries.items() if name in self.timezones}
+
+    def zone(self, name: Optional[str]) -> tzinfo:
+        """tzinfo for a timezone name; unknown or missing names use the default"""
+        name = name or self.default_timezone
+        cached = self._zones.get(name)
+        if cached is None:
+            if name == "local":
+                cached = local_timezone()
+            else:
+                try:
+                    cached = ZoneInfo(name)
+                except (ZoneInfoNotFoundError, ValueError):
+                    if name == self.default_timezone:
+                        raise ValueError(f"Unknown timezone: {name}")
+                    cached = self.zone(self.default_timezone)
+            self._zones[name] = cached
+        return cached
+
+    def timezone_key(self, name: Optional[str]) -> str:
+        """Configured timezone a recipient's timezone is scheduled under"""
+        return name if name in self.timezones else self.default_timezone
+
+    def windows_from(self, moment: datetime, name: Optional[str] = None, days: int = 8) -> Iterator[Window]:
+        """Windows in a timezone that end after ``moment``, in order"""
+        zone = self.zone(name)
+        local = moment.astimezone(zone)
+        for offset in range(days):
+            day = local.date() + timedelta(days=offset)
+            for start, end in self.windows:
+                window_start = datetime.combine(day, start, tzinfo=zone)
+                window_end = datetime.combine(day, end, tzinfo=zone)
+                if window_end > moment:
+                    yield window_start, window_end
+
+    def current_window(self, moment: Optional[datetime] = None, name: Optional[str] = None) -> Optional[Window]:
+        """The window open at ``moment`` in a timezone, if any"""
+        moment = moment or self.now()
+        window = next(self.windows_from(moment, name), None)
+        if window and window[0] <= moment:
+            return window
+        return None
+
+    def is_open(self, moment: Optional[datetime] = None, name: Optional[str] = None) -> bool:
+        return self.current_window(moment, name) is not None
+
+    def _eligible(self, name: str, window: Window) -> bool:
+        last = self.last_served.get(name)
+        if last is None:
+            return True
+        # Wall-clock difference, so daily posting doesn't drift across DST changes
+        return window[0].replace(tzinfo=None) - last.replace(tzinfo=None) >= self.frequency
+
+    def _retry_at(self, name: str, window: Window) -> Optional[datetime]:
+        retry = self.retries.get(name)
+        return retry[1] if retry and retry[0] == window[0] else None
+
+    def is_retry(self, name: str, moment: Optional[datetime] = None) -> bool:
+        """Whether the window open in a timezone is one whose cycle did not finish"""
+        window = self.current_window(moment, name)
+        return window is not None and self._retry_at(name, window) is not None
+
+    def posts_on(self, moment: datetime) -> int:
+        return self.posts_by_day.get(moment.astimezone(self.zone(None)).date(), 0)
+
+    def can_post(self, moment: Optional[datetime] = None) -> bool:
+        """Whether today's max_posts_per_day still allows a cycle"""
+        return self.posts_on(moment or self.now()) < self.max_posts_per_day
+
+    def due_timezones(self, moment: Optional[datetime] = None) -> List[str]:
+        """Timezones with an open window that should be served now"""
+        moment = moment or self.now()
+        if not self.can_post(moment):
+            return []
+        due = []
+        for name in self.timezones:
+            window = self.current_window(moment, name)
+            if window and self._eligible(name, window):
+                retry_at = self._retry_at(name, window)
+                if retry_at is None or retry_at <= moment:
+                    due.append(name)
+        return due
+
+    def window_key(self, timezones: Iterable[str], moment: Optional[datetime] = None) -> str:
+        """Names the windows open at ``moment`` in ``timezones``, e.g. to key one window's campaign"""
+        moment = moment or self.now()
+        parts = []
+        for name in sorted(timezones):
+            window = self.current_window(moment, name)
+            start = window[0] if window else moment.astimezone(self.zone(name))
+            parts.append(f"{name}@{start:%Y-%m-%dT%H:%M}")
+        return ",".join(parts)
+
+    def record_cycle(self, timezones: Iterable[str], moment: Optional[datetime] = None,
+                     unfinished: Iterable[str] = (), count_post: bool = True):
+        """Mark the open windows of ``timezones`` as served and count the post
+
+        Windows of ``unfinished`` timezones stay unserved and are retried
+        ``retry_minutes`` from ``moment``.
+        """
+        moment = moment or self.now()
+        for name in timezones:
+            window = self.current_window(moment, name)
+            if window:
+                self.last_served[name] = window[0]
+            self.retries.pop(name, None)
+        for name in unfinished:
+            window = self.current_window(moment, name)
+            if window:
+                self.retries[name] = (window[0], moment + self.retry_delay)
+        if count_post:
+            day = moment.astimezone(self.zone(None)).date()
+            self.posts_by_day = {day: self.posts_by_day.get(day, 0) + 1}
+
+    def next_cycle_time(self, moment: Optional[datetime] = None) -> datetime:
+        """Earliest moment at which some timezone will be due"""
+        moment = moment or self.now()
+        if not self.can_post(moment):
+            # Daily limit reached: nothing is due before tomorrow in the default timezone
+            zone = self.zone(None)
+            tomorrow = moment.astimezone(zone).date() + timedelta(days=1)
+            moment = datetime.combine(tomorrow, time(0, 0), tzinfo=zone)
+
+        candidates = []
+        for name in self.timezones:
+            for window in self.windows_from(moment, name):
+                if self._eligible(name, window) and self.last_served.get(name) != window[0]:
+                    start = self._retry_at(name, window) or window[0]
+                    if start < window[1]:
+                        candidates.append(max(moment, start))
+                        break
+        if not candidates:
+            raise RuntimeError("No posting window found in the coming week")
+        return min(candidates)
+
+    def seconds_until_next_cycle(self, moment: Optional[datetime] = None) -> float:
+        moment = moment or self.now()
+        return max(0.0, (self.next_cycle_time(moment) - moment).total_seconds())
+
+    def batch_by_timezone(
+        self,
+        entries: Iterable[Tuple[str, Optional[str]]],
+        timezones: Iterable[str],
+        batch_size: int = 1000,
+    ) -> Iterator[Tuple[str, List[str]]]:
+        """Group ``(recipient, timezone)`` pairs into per-timezone batches
+
+        Only recipients whose timezone is in ``timezones`` are kept. Each
+        timezone buffers at most ``batch_size`` entries, so memory stays
+        bounded however long the stream is.
+        """
+        wanted = set(timezones)
+        batches: Dict[str, List[str]] = {}
+        for recipient, name in entries:
+            key = self.timezone_key(name)
+            if key not in wanted:
+                continue
+            batch = batches.setdefault(key, [])
+            batch.append(recipient)
+            if len(batch) >= batch_size:
+                yield key, batch
+                batches[key] = []
+        for key, batch in batches.items():
+            if batch:
+                yield key, batch